@@ -1,13 +1,31 @@
-from flask import Flask, jsonify, request, Response
+from flask import Flask, jsonify, request, Response, make_response, g, has_request_context
+from flask.logging import default_handler
 from flask_cors import CORS
-from models import Database
-import os, sys, json
+from flask_compress import Compress
+from models import Database, DatabaseParProcessus
+import jobs
+from metrics import instrumenter_app, instrumenter_database
+from requetes_lentes import journal as journal_requetes_lentes, prefixe_request_id
+import compteur_requetes
+from json_provider import OrjsonProvider
+from functools import wraps
+import os, sys, json, hashlib, uuid, re, time, logging
 from datetime import datetime
 from werkzeug.utils import secure_filename
+import psycopg2.errors
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)
 
+# Compression négociée via Accept-Encoding (brotli puis gzip), y compris pour
+# les réponses en flux comme l'export CSV, compressées morceau par morceau
+app.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/csv']
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_ALGORITHM_STREAMING'] = ['br', 'gzip']
+app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+Compress(app)
+
 # Configuration pour l'upload de fichiers
 UPLOAD_FOLDER = '/app/uploads'
 ALLOWED_EXTENSIONS = {'xlsx', 'xls'}
@@ -18,8 +36,118 @@ if not os.path.exists(UPLOAD_FOLDER):
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-db = Database()
+# Durée et nombre d'appels de chaque méthode de Database, exposés sur /metrics
+instrumenter_database(Database)
+
+# Database créée au premier usage dans chaque processus (sûr après un fork gunicorn)
+db = DatabaseParProcessus()
+
+# Latence par route, requêtes en cours et état du pool (avant liberer_connexion :
+# les teardown s'exécutent en ordre inverse, le pool est donc lu après restitution)
+instrumenter_app(app, stats_pool=lambda: db.get_pool_stats())
+
+# Identifiant accepté tel quel du frontend/proxy : il est recopié dans les
+# commentaires SQL, d'où un alphabet restreint
+REQUEST_ID_VALIDE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+@app.before_request
+def identifier_requete():
+    # Identifiant repris du client/proxy s'il est fourni et valide, sinon généré
+    request_id = request.headers.get('X-Request-ID', '')
+    g.request_id = request_id if REQUEST_ID_VALIDE.match(request_id) else uuid.uuid4().hex[:16]
+
+@app.after_request
+def renvoyer_identifiant_requete(response):
+    if g.get('request_id'):
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+class FiltreRequestId(logging.Filter):
+    def filter(self, record):
+        record.request_id = g.get('request_id', '-') if has_request_context() else '-'
+        return True
+
+# Les messages de app.logger portent l'identifiant de la requête
+default_handler.addFilter(FiltreRequestId())
+default_handler.setFormatter(logging.Formatter(
+    '[%(asctime)s] %(levelname)s [req=%(request_id)s] in %(module)s: %(message)s'))
+
+# Le journal des requêtes lentes et les commentaires SQL (pg_stat_activity,
+# logs PostgreSQL) retrouvent ainsi la requête HTTP d'origine
+# (hors requête : celui de la requête qui a soumis la tâche de fond en cours)
+journal_requetes_lentes.fournisseur_request_id = lambda: g.get('request_id') if has_request_context() else jobs.request_id_courant()
+
+# Nombre d'instructions SQL par requête (repère les N+1), renvoyé en en-têtes de debug
+SQL_DEBUG_HEADERS = os.getenv('SQL_DEBUG_HEADERS', '0') == '1'
+# Temps passé en SQL et temps total, dans l'en-tête standard Server-Timing
+SERVER_TIMING = os.getenv('SERVER_TIMING', '1') == '1'
+
+@app.before_request
+def demarrer_compteur_sql():
+    g.debut_traitement = time.perf_counter()
+    g.compteur_sql, g.jeton_compteur_sql = compteur_requetes.demarrer()
+
+@app.after_request
+def entetes_compteur_sql(response):
+    compteur = g.get('compteur_sql')
+    if compteur is None:
+        return response
+    # Les réponses en flux (export CSV) exécutent leurs requêtes après ces en-têtes
+    if SQL_DEBUG_HEADERS or app.debug:
+        response.headers['X-SQL-Requetes'] = str(compteur.nombre)
+        response.headers['X-SQL-Duree-Ms'] = f"{compteur.duree_ms:.1f}"
+    if SERVER_TIMING:
+        total_ms = (time.perf_counter() - g.debut_traitement) * 1000
+        response.headers.add('Server-Timing', f'db;dur={compteur.duree_ms:.1f};desc="{compteur.nombre} SQL"')
+        response.headers.add('Server-Timing', f'app;dur={total_ms:.1f}')
+    return response
+
+@app.teardown_request
+def arreter_compteur_sql(exception=None):
+    jeton = g.pop('jeton_compteur_sql', None)
+    if jeton is not None:
+        compteur_requetes.arreter(jeton)
+
+@app.teardown_request
+def liberer_connexion(exception=None):
+    # Rendre la connexion empruntée au pool, même si la requête a échoué
+    db.release_connection()
     
+def avec_etag(*tables):
+    """
+    GET conditionnel : l'ETag est dérivé des compteurs de version des tables lues.
+    Si le client renvoie un ETag encore valide, on répond 304 sans exécuter la vue.
+    """
+    def decorateur(vue):
+        @wraps(vue)
+        def wrapper(*args, **kwargs):
+            # Versions lues AVANT la requête : une écriture concurrente donnera
+            # au pire un ETag périmé, donc un rechargement de plus
+            versions = db.get_versions_tables(tables)
+            if versions is None:
+                return vue(*args, **kwargs)
+
+            empreinte = request.full_path + '|' + ','.join(f"{t}:{versions[t]}" for t in sorted(versions))
+            etag = hashlib.sha1(empreinte.encode('utf-8')).hexdigest()
+
+            # Flask-Compress suffixe l'ETag par l'algorithme ("...:gzip") : on
+            # compare la partie version et on renvoie l'ETag tel que reçu
+            etag_client = next((e for e in request.if_none_match.as_set()
+                                if e.split(':')[0] == etag), None)
+            if etag_client:
+                response = Response(status=304)
+                etag = etag_client
+            else:
+                response = make_response(vue(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            # Le navigateur garde la réponse mais revalide à chaque fois
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorateur
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -32,12 +160,18 @@ def hello():
         "structure": "Nom, Prenom, Email, Date_naissance, Date_entree_bac, Date_certification"
     })
 
+@app.route('/api/pool/stats', methods=['GET'])
+def get_pool_stats():
+    """Statistiques du pool de connexions PostgreSQL"""
+    return jsonify(db.get_pool_stats())
+
 # ===== ROUTES UTILISATEURS =====
 @app.route('/api/utilisateurs', methods=['GET'])
+@avec_etag('utilisateurs')
 def get_utilisateurs():
     try:
         utilisateurs = db.get_utilisateurs()
-        return jsonify([dict(u) for u in utilisateurs])
+        return jsonify(utilisateurs)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -68,6 +202,16 @@ def ajouter_utilisateur():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/utilisateurs/<int:user_id>', methods=['GET'])
+def get_utilisateur(user_id):
+    try:
+        utilisateur = db.get_utilisateur_par_id(user_id)
+        if not utilisateur:
+            return jsonify({"error": "Utilisateur non trouvé"}), 404
+        return jsonify(dict(utilisateur))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/utilisateurs/<int:user_id>', methods=['PUT'])
 def modifier_utilisateur(user_id):
     try:
@@ -99,11 +243,11 @@ def modifier_utilisateur(user_id):
                 "utilisateur": dict(utilisateur_modifie)
             })
         else:
-            print("❌ Utilisateur non trouvé ou erreur de modification")
+            print(f"{prefixe_request_id()}❌ Utilisateur non trouvé ou erreur de modification")
             return jsonify({"success": False, "error": "Utilisateur non trouvé ou erreur de modification"}), 404
             
     except Exception as e:
-        print(f"💥 Erreur lors de la modification: {str(e)}")
+        print(f"{prefixe_request_id()}💥 Erreur lors de la modification: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route('/api/utilisateurs/<int:user_id>', methods=['DELETE'])
@@ -117,11 +261,11 @@ def supprimer_utilisateur(user_id):
             print("✅ Utilisateur supprimé avec succès")
             return jsonify({"success": True, "message": "Utilisateur supprimé avec succès"})
         
-        print("❌ Utilisateur non trouvé")
+        print(f"{prefixe_request_id()}❌ Utilisateur non trouvé")
         return jsonify({"success": False, "error": "Utilisateur non trouvé"}), 404
         
     except Exception as e:
-        print(f"💥 Erreur lors de la suppression: {str(e)}")
+        print(f"{prefixe_request_id()}💥 Erreur lors de la suppression: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route('/modifier_utilisateur', methods=['POST'])
@@ -160,7 +304,7 @@ def modifier_utilisateur_form():
             return jsonify({"success": False, "error": "Utilisateur non trouvé"}), 404
             
     except Exception as e:
-        print(f"💥 Erreur lors de la modification formulaire: {str(e)}")
+        print(f"{prefixe_request_id()}💥 Erreur lors de la modification formulaire: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route('/supprimer_utilisateur', methods=['POST'])
@@ -182,7 +326,7 @@ def supprimer_utilisateur_form():
             return jsonify({"success": False, "error": "Utilisateur non trouvé"}), 404
             
     except Exception as e:
-        print(f"💥 Erreur lors de la suppression formulaire: {str(e)}")
+        print(f"{prefixe_request_id()}💥 Erreur lors de la suppression formulaire: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route('/api/utilisateurs/import-excel', methods=['POST'])
@@ -190,14 +334,14 @@ def importer_utilisateurs_excel():
     print("🔍 Début import Excel")
     
     if 'file' not in request.files:
-        print("❌ Aucun fichier dans la requête")
+        print(f"{prefixe_request_id()}❌ Aucun fichier dans la requête")
         return jsonify({"success": False, "error": "Aucun fichier fourni"}), 400
     
     file = request.files['file']
     print(f"📁 Fichier reçu: {file.filename}")
     
     if file.filename == '':
-        print("❌ Nom de fichier vide")
+        print(f"{prefixe_request_id()}❌ Nom de fichier vide")
         return jsonify({"success": False, "error": "Aucun fichier sélectionné"}), 400
 
     if file and allowed_file(file.filename):
@@ -235,7 +379,7 @@ def importer_utilisateurs_excel():
         except Exception as e:
             import traceback
             traceback_str = traceback.format_exc()
-            print(f"💥 Erreur import-excel: {traceback_str}", flush=True)
+            print(f"{prefixe_request_id()}💥 Erreur import-excel: {traceback_str}", flush=True)
             
             # Nettoyer le fichier en cas d'erreur
             if 'filepath' in locals() and os.path.exists(filepath):
@@ -252,27 +396,51 @@ def importer_utilisateurs_excel():
 
 # ===== ROUTES RÉFÉRENTIEL =====
 @app.route('/api/competences', methods=['GET'])
+@avec_etag('competences')
 def get_competences():
     try:
         competences = db.get_competences()
-        return jsonify([dict(c) for c in competences])
+        return jsonify(competences)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/items', methods=['GET'])
+@avec_etag('items', 'competences')
 def get_items():
     try:
         items = db.get_all_items()
-        return jsonify([dict(i) for i in items])
+        return jsonify(items)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/admin/requetes-lentes', methods=['GET'])
+def get_requetes_lentes():
+    """Requêtes au-delà de SLOW_QUERY_MS et plans EXPLAIN capturés (worker courant, voir pid)"""
+    return jsonify(db.get_requetes_lentes())
+
+@app.route('/api/admin/requetes-lentes', methods=['DELETE'])
+def vider_requetes_lentes():
+    """Vide le journal du worker qui répond (un journal par worker, voir pid)"""
+    db.vider_requetes_lentes()
+    return jsonify({"success": True, "message": "Journal des requêtes lentes vidé", "pid": os.getpid()})
+
+@app.route('/api/referentiel/invalider', methods=['POST'])
+def invalider_referentiel():
+    """Vide le cache du référentiel (tous les workers) après une modification de competences/items en base"""
+    try:
+        if not db.invalider_referentiel():
+            return jsonify({'success': False, 'error': 'Invalidation non diffusée aux autres workers', 'pid': os.getpid()}), 500
+        return jsonify({'success': True, 'message': 'Cache du référentiel invalidé', 'pid': os.getpid()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # ===== ROUTES ÉVALUATIONS =====
 @app.route('/api/evaluations', methods=['GET'])
+@avec_etag('evaluations', 'evaluation_items')
 def get_evaluations():
     try:
         evaluations = db.get_evaluations()
-        return jsonify([dict(e) for e in evaluations])
+        return jsonify(evaluations)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -318,6 +486,18 @@ def get_evaluation_detail(evaluation_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/evaluations/<int:evaluation_id>/bundle', methods=['GET'])
+def get_evaluation_bundle(evaluation_id):
+    """Données complètes de l'écran détail d'une évaluation, lues dans un même instantané"""
+    try:
+        inclure_referentiel = request.args.get('referentiel', '0') != '0'
+        bundle = db.get_evaluation_bundle(evaluation_id, inclure_referentiel=inclure_referentiel)
+        if bundle is None:
+            return jsonify({"error": "Évaluation non trouvée"}), 404
+        return jsonify(bundle)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/evaluations/<int:evaluation_id>', methods=['DELETE'])
 def supprimer_evaluation(evaluation_id):
     try:
@@ -351,15 +531,27 @@ def get_validations_utilisateur(utilisateur_id):
     try:
         evaluation_id = request.args.get('evaluation_id')
         validations = db.get_validations_utilisateur(utilisateur_id, evaluation_id)
-        return jsonify([dict(v) for v in validations])
+        return jsonify(validations)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/evaluations/<int:evaluation_id>/fiche/<int:utilisateur_id>', methods=['GET'])
+def get_fiche_validation(evaluation_id, utilisateur_id):
+    """Fiche de notation : l'élève, l'évaluation avec ses items et ses validations existantes"""
+    try:
+        fiche = db.get_fiche_validation(utilisateur_id, evaluation_id)
+        if fiche is None:
+            return jsonify({"error": "Utilisateur ou évaluation non trouvé"}), 404
+        return jsonify(fiche)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/evaluations/<int:evaluation_id>/validations', methods=['GET'])
+@avec_etag('validations', 'utilisateurs', 'items', 'competences')
 def get_validations_evaluation(evaluation_id):
     try:
         validations = db.get_validations_par_evaluation(evaluation_id)
-        return jsonify([dict(v) for v in validations])
+        return jsonify(validations)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -421,10 +613,10 @@ def get_attributions_evaluation(evaluation_id):
         for attr in attributions:
             print(f"   - ID: {attr['id']}, Classe: {attr['classe']}, User: {attr['utilisateur_id']}, Nom: {attr.get('nom')}, Prénom: {attr.get('prenom')}")
     
-        return jsonify([dict(a) for a in attributions])
+        return jsonify(attributions)
         
     except Exception as e:
-        print(f"❌ Erreur récupération attributions: {str(e)}")
+        print(f"{prefixe_request_id()}❌ Erreur récupération attributions: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/evaluations/<int:evaluation_id>/utilisateurs-concernes', methods=['GET'])
@@ -433,9 +625,9 @@ def get_utilisateurs_concernes(evaluation_id):
         print(f"🔍 Backend: Récupération utilisateurs concernés pour évaluation {evaluation_id}")
         utilisateurs = db.get_utilisateurs_concernes_par_evaluation(evaluation_id)
         print(f"✅ Backend: {len(utilisateurs)} utilisateurs concernés trouvés")
-        return jsonify([dict(u) for u in utilisateurs])
+        return jsonify(utilisateurs)
     except Exception as e:
-        print(f"❌ Erreur récupération utilisateurs concernés: {str(e)}")
+        print(f"{prefixe_request_id()}❌ Erreur récupération utilisateurs concernés: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 # Routes pour la gestion des items d'évaluation
@@ -456,7 +648,7 @@ def ajouter_items_evaluation():
         return jsonify(result)
         
     except Exception as e:
-        print(f"💥 Erreur ajout items: {str(e)}")
+        print(f"{prefixe_request_id()}💥 Erreur ajout items: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/retirer-item-evaluation', methods=['POST'])
@@ -476,7 +668,7 @@ def retirer_item_evaluation():
         return jsonify(result)
             
     except Exception as e:
-        print(f"💥 Erreur retrait item: {str(e)}")
+        print(f"{prefixe_request_id()}💥 Erreur retrait item: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/valider-multiple', methods=['POST'])
@@ -489,7 +681,7 @@ def valider_multiple():
         
         # Vérifier que les données JSON sont présentes
         if not request.is_json:
-            print("❌ Content-Type n'est pas application/json")
+            print(f"{prefixe_request_id()}❌ Content-Type n'est pas application/json")
             return jsonify({'success': False, 'error': 'Content-Type must be application/json'}), 400
             
         data = request.get_json()
@@ -497,7 +689,7 @@ def valider_multiple():
         
         # Validation des données requises
         if not data:
-            print("❌ Données JSON vides")
+            print(f"{prefixe_request_id()}❌ Données JSON vides")
             return jsonify({'success': False, 'error': 'Données JSON manquantes'}), 400
         
         utilisateur_id = data.get('utilisateur_id')
@@ -515,138 +707,37 @@ def valider_multiple():
         if not validations or not isinstance(validations, list):
             return jsonify({'success': False, 'error': 'Liste de validations invalide'}), 400
         
-        # Initialiser la base de données
-        try:
-            db = Database()
-            print("✅ Connexion DB réussie")
-        except Exception as e:
-            print(f"❌ Erreur connexion DB: {str(e)}")
-            return jsonify({'success': False, 'error': f'Erreur base de données: {str(e)}'}), 500
-        
         # Vérifier que l'utilisateur et l'évaluation existent
         try:
             utilisateur = db.get_utilisateur_par_id(utilisateur_id)
             if not utilisateur:
-                print(f"❌ Utilisateur {utilisateur_id} non trouvé")
+                print(f"{prefixe_request_id()}❌ Utilisateur {utilisateur_id} non trouvé")
                 return jsonify({'success': False, 'error': f'Utilisateur {utilisateur_id} non trouvé'}), 404
             
             evaluation, _ = db.get_evaluation_detail(evaluation_id)
             if not evaluation:
-                print(f"❌ Évaluation {evaluation_id} non trouvée")
+                print(f"{prefixe_request_id()}❌ Évaluation {evaluation_id} non trouvée")
                 return jsonify({'success': False, 'error': f'Évaluation {evaluation_id} non trouvée'}), 404
                 
             print("✅ Utilisateur et évaluation validés")
         except Exception as e:
-            print(f"❌ Erreur vérification utilisateur/évaluation: {str(e)}")
+            print(f"{prefixe_request_id()}❌ Erreur vérification utilisateur/évaluation: {str(e)}")
             return jsonify({'success': False, 'error': f'Erreur vérification: {str(e)}'}), 500
         
+        # Utiliser l'email de l'enseignant connecté comme validateur
+        validateur = "enseignant@bacpro-ciel.fr"  # À adapter avec votre auth
+        
+        # Traiter tout le lot : vérification des items, créé/mis à jour et upsert en une transaction
+        details = db.valider_multiple(utilisateur_id, evaluation_id, validations, validateur)
+        for error_msg in details['errors']:
+            print(f"    ❌ {error_msg}")
+        
         results = {
             'success': True,
             'message': f'{len(validations)} validation(s) traité(s)',
-            'details': {
-                'created': 0,
-                'updated': 0,
-                'errors': []
-            }
+            'details': details
         }
         
-        # Traiter chaque validation
-        for i, validation_data in enumerate(validations):
-            try:
-                item_id = validation_data.get('item_id')
-                niveau_validation = validation_data.get('niveau_validation')
-                commentaire = validation_data.get('commentaire', '').strip()
-                
-                print(f"  📋 Traitement item {i+1}: id={item_id}, niveau={niveau_validation}")
-                
-                # Validation des données de l'item
-                if item_id is None:
-                    error_msg = f'item_id manquant pour la validation {i+1}'
-                    results['details']['errors'].append(error_msg)
-                    print(f"    ❌ {error_msg}")
-                    continue
-                
-                if niveau_validation is None:
-                    error_msg = f'niveau_validation manquant pour item {item_id}'
-                    results['details']['errors'].append(error_msg)
-                    print(f"    ❌ {error_msg}")
-                    continue
-                
-                # Vérifier que l'item existe
-                try:
-                    all_items = db.get_all_items()
-                    item_exists = any(item['id'] == item_id for item in all_items)
-                    if not item_exists:
-                        error_msg = f'Item {item_id} non trouvé'
-                        results['details']['errors'].append(error_msg)
-                        print(f"    ❌ {error_msg}")
-                        continue
-                except Exception as e:
-                    error_msg = f'Erreur vérification item {item_id}: {str(e)}'
-                    results['details']['errors'].append(error_msg)
-                    print(f"    ❌ {error_msg}")
-                    continue
-                
-                # Vérifier que le niveau est valide
-                if niveau_validation not in [0, 1, 2, 3, 4]:
-                    error_msg = f'Niveau invalide {niveau_validation} pour item {item_id}'
-                    results['details']['errors'].append(error_msg)
-                    print(f"    ❌ {error_msg}")
-                    continue
-                
-                # Vérifier si une validation existe déjà
-                try:
-                    validations_existantes = db.get_validations_utilisateur(utilisateur_id, evaluation_id)
-                    validation_existante = next(
-                        (v for v in validations_existantes if v['item_id'] == item_id), 
-                        None
-                    )
-                except Exception as e:
-                    error_msg = f'Erreur vérification validation existante: {str(e)}'
-                    results['details']['errors'].append(error_msg)
-                    print(f"    ❌ {error_msg}")
-                    continue
-                
-                # Utiliser l'email de l'enseignant connecté comme validateur
-                validateur = "enseignant@bacpro-ciel.fr"  # À adapter avec votre auth
-                
-                # Appeler la méthode de mise à jour
-                try:
-                    validation_result = db.mettre_a_jour_validation(
-                        utilisateur_id=utilisateur_id,
-                        evaluation_id=evaluation_id,
-                        item_id=item_id,
-                        niveau=niveau_validation,
-                        commentaire=commentaire,
-                        validateur=validateur
-                    )
-                    
-                    if validation_result:
-                        if validation_existante:
-                            results['details']['updated'] += 1
-                            print(f"    ✅ Mise à jour - Item {item_id}, Niveau {niveau_validation}")
-                        else:
-                            results['details']['created'] += 1
-                            print(f"    ✅ Création - Item {item_id}, Niveau {niveau_validation}")
-                    else:
-                        error_msg = f"Échec opération base de données pour item {item_id}"
-                        results['details']['errors'].append(error_msg)
-                        print(f"    ❌ {error_msg}")
-                        
-                except Exception as e:
-                    error_msg = f"Erreur DB item {item_id}: {str(e)}"
-                    results['details']['errors'].append(error_msg)
-                    print(f"    ❌ {error_msg}")
-                    continue
-                
-            except Exception as e:
-                error_msg = f"Erreur générale item {item_id}: {str(e)}"
-                results['details']['errors'].append(error_msg)
-                print(f"    ❌ {error_msg}")
-                import traceback
-                print(traceback.format_exc())
-                continue
-        
         # Log de synthèse
         print(f"🎯 Validations terminées - Créées: {results['details']['created']}, Mises à jour: {results['details']['updated']}, Erreurs: {len(results['details']['errors'])}")
         
@@ -657,7 +748,7 @@ def valider_multiple():
         
     except Exception as e:
         error_msg = f"Erreur globale: {str(e)}"
-        print(f"❌ {error_msg}")
+        print(f"{prefixe_request_id()}❌ {error_msg}")
         import traceback
         print(traceback.format_exc())
         
@@ -690,6 +781,45 @@ def get_user_profile(user_id):
         app.logger.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/classes/<classe>/profils', methods=['GET'])
+def get_profils_classe(classe):
+    """Profils de tous les élèves d'une classe (même structure que /api/utilisateur/<id>/profil)"""
+    app.logger.info(f"🔍 Backend: Récupération profils classe {classe}")
+    
+    try:
+        profils = db.get_profils_classe(classe)
+        
+        if profils is None:
+            return jsonify({'error': 'Erreur lors du calcul des profils'}), 500
+        
+        return jsonify({
+            'classe': classe,
+            'total': len(profils),
+            'profils': profils
+        })
+        
+    except Exception as e:
+        app.logger.error(f"❌ Erreur backend: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/competence-summary/verifier', methods=['GET'])
+def verifier_competence_summary():
+    """Contrôle de cohérence de la synthèse des compétences avec les validations"""
+    ecarts = db.verifier_competence_summary()
+    if ecarts is None:
+        return jsonify({'error': 'Erreur lors de la vérification'}), 500
+    return jsonify({'coherent': not ecarts, 'ecarts': ecarts})
+
+@app.route('/api/competence-summary/reconstruire', methods=['POST'])
+def reconstruire_competence_summary():
+    """Reconstruit la synthèse des compétences (tous les élèves ou ?utilisateur_id=...)"""
+    utilisateur_id = request.args.get('utilisateur_id', type=int)
+    print(f"🔄 Reconstruction competence_summary - utilisateur: {utilisateur_id if utilisateur_id else 'tous'}")
+    nb_lignes = db.reconstruire_competence_summary(utilisateur_id)
+    if nb_lignes is None:
+        return jsonify({'success': False, 'error': 'Erreur lors de la reconstruction'}), 500
+    return jsonify({'success': True, 'nb_lignes': nb_lignes})
+
 # À ajouter dans votre app.py après vos routes existantes
 
 # ===== ROUTES PASSAGE DE CLASSE ET ARCHIVAGE =====
@@ -702,7 +832,7 @@ def get_preview_passage_classe():
         preview = db.get_preview_passage_terminale()
         return jsonify(preview)
     except Exception as e:
-        print(f"❌ Erreur get_preview_passage_classe: {str(e)}")
+        print(f"{prefixe_request_id()}❌ Erreur get_preview_passage_classe: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/passage-classe/passage-avec-archivage', methods=['POST'])
@@ -718,11 +848,11 @@ def passage_avec_archivage():
             print(f"✅ Passage réussi: {result['nb_archives']} archivés, {result['nb_passes']} passés")
             return jsonify(result), 200
         else:
-            print(f"❌ Échec passage: {result.get('error')}")
+            print(f"{prefixe_request_id()}❌ Échec passage: {result.get('error')}")
             return jsonify(result), 400
             
     except Exception as e:
-        print(f"💥 Erreur passage_avec_archivage: {str(e)}")
+        print(f"{prefixe_request_id()}💥 Erreur passage_avec_archivage: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({
@@ -732,15 +862,23 @@ def passage_avec_archivage():
 
 @app.route('/api/passage-classe/archives', methods=['GET'])
 def get_archives():
-    """Liste des élèves archivés avec pagination"""
+    """Liste des élèves archivés avec pagination (par clé via ?cursor=, ou ?offset=)"""
     try:
         annee = request.args.get('annee', type=int)
         limit = request.args.get('limit', 100, type=int)
         offset = request.args.get('offset', 0, type=int)
+        curseur = request.args.get('cursor')
+        total = request.args.get('total', 'estime')
+        
+        if total not in ('exact', 'estime', 'aucun'):
+            return jsonify({'error': "Paramètre total invalide (exact, estime ou aucun)"}), 400
         
-        print(f"📚 Récupération archives - Année: {annee}, Limit: {limit}, Offset: {offset}")
+        print(f"📚 Récupération archives - Année: {annee}, Limit: {limit}, Offset: {offset}, Curseur: {bool(curseur)}")
         
-        result = db.get_archives(annee=annee, limit=limit, offset=offset)
+        try:
+            result = db.get_archives(annee=annee, limit=limit, offset=offset, curseur=curseur, total=total)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Convertir les dates en strings pour JSON
         for archive in result['archives']:
@@ -752,10 +890,11 @@ def get_archives():
         return jsonify(result)
         
     except Exception as e:
-        print(f"❌ Erreur get_archives: {str(e)}")
+        print(f"{prefixe_request_id()}❌ Erreur get_archives: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/passage-classe/archives/stats', methods=['GET'])
+@avec_etag('utilisateurs_archives')
 def get_stats_archives():
     """Statistiques des archives par promotion"""
     try:
@@ -772,7 +911,7 @@ def get_stats_archives():
         return jsonify(stats)
         
     except Exception as e:
-        print(f"❌ Erreur get_stats_archives: {str(e)}")
+        print(f"{prefixe_request_id()}❌ Erreur get_stats_archives: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/passage-classe/archives/search', methods=['GET'])
@@ -795,7 +934,25 @@ def rechercher_archives():
         return jsonify(results)
         
     except Exception as e:
-        print(f"❌ Erreur rechercher_archives: {str(e)}")
+        print(f"{prefixe_request_id()}❌ Erreur rechercher_archives: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/recherche/eleves', methods=['GET'])
+def rechercher_eleves():
+    """Recherche unifiée des élèves actifs et archivés (insensible aux accents)"""
+    try:
+        q = request.args.get('q', '').strip()
+        limit = min(request.args.get('limit', 20, type=int), 100)
+        archives = request.args.get('archives', '1') != '0'
+        
+        if not q:
+            return jsonify({'error': 'Terme de recherche requis'}), 400
+        
+        print(f"🔍 Recherche élèves: '{q}' (archives: {archives})")
+        return jsonify(db.rechercher_eleves(q, limite=limit, inclure_archives=archives))
+        
+    except Exception as e:
+        print(f"{prefixe_request_id()}❌ Erreur rechercher_eleves: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/passage-classe/archives/<int:archive_id>', methods=['GET'])
@@ -821,7 +978,7 @@ def get_archive_detail(archive_id):
         return jsonify(detail)
         
     except Exception as e:
-        print(f"❌ Erreur get_archive_detail: {str(e)}")
+        print(f"{prefixe_request_id()}❌ Erreur get_archive_detail: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/passage-classe/archives/<int:archive_id>/restaurer', methods=['POST'])
@@ -835,11 +992,11 @@ def restaurer_archive(archive_id):
             print(f"✅ {result['message']}")
             return jsonify(result), 200
         else:
-            print(f"❌ {result.get('error')}")
+            print(f"{prefixe_request_id()}❌ {result.get('error')}")
             return jsonify(result), 400
             
     except Exception as e:
-        print(f"💥 Erreur restaurer_archive: {str(e)}")
+        print(f"{prefixe_request_id()}💥 Erreur restaurer_archive: {str(e)}")
         return jsonify({
             'success': False,
             'error': str(e)
@@ -847,34 +1004,44 @@ def restaurer_archive(archive_id):
 
 @app.route('/api/passage-classe/archives/export', methods=['GET'])
 def exporter_archives():
-    """Export CSV des archives"""
+    """Export CSV des archives (streamé par défaut, ?stream=0 pour une réponse en un bloc)"""
     try:
         annee = request.args.get('annee', type=int)
+        stream = request.args.get('stream', '1') != '0'
+        
+        print(f"📥 Export archives - Année: {annee if annee else 'toutes'}, stream: {stream}")
         
-        print(f"📥 Export archives - Année: {annee if annee else 'toutes'}")
+        # Créer la réponse avec le bon type MIME
+        filename = f"archives_diplomes_{annee if annee else 'all'}.csv"
+        headers = {
+            'Content-Disposition': f'attachment; filename={filename}',
+            'Content-Type': 'text/csv; charset=utf-8'
+        }
+        
+        if stream:
+            def generer():
+                yield '\ufeff'  # BOM UTF-8 pour Excel
+                yield from db.exporter_archives_csv_stream(annee=annee)
+                print(f"✅ Export CSV streamé: {filename}")
+            
+            return Response(generer(), mimetype='text/csv', headers=headers)
         
         csv_content = db.exporter_archives_csv(annee=annee)
         
         if not csv_content:
             return jsonify({'error': 'Erreur lors de la génération du CSV'}), 500
         
-        # Créer la réponse avec le bon type MIME
-        filename = f"archives_diplomes_{annee if annee else 'all'}.csv"
-        
         response = Response(
             '\ufeff' + csv_content,  # BOM UTF-8 pour Excel
             mimetype='text/csv',
-            headers={
-                'Content-Disposition': f'attachment; filename={filename}',
-                'Content-Type': 'text/csv; charset=utf-8'
-            }
+            headers=headers
         )
         
         print(f"✅ Export CSV généré: {filename}")
         return response
         
     except Exception as e:
-        print(f"❌ Erreur exporter_archives: {str(e)}")
+        print(f"{prefixe_request_id()}❌ Erreur exporter_archives: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/passage-classe/historique/<int:utilisateur_id>', methods=['GET'])
@@ -895,7 +1062,7 @@ def get_historique_utilisateur(utilisateur_id):
         return jsonify(historique)
         
     except Exception as e:
-        print(f"❌ Erreur get_historique_utilisateur: {str(e)}")
+        print(f"{prefixe_request_id()}❌ Erreur get_historique_utilisateur: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/passage-classe/test', methods=['GET'])
@@ -918,6 +1085,116 @@ def test_passage_classe():
             'error': str(e)
         }), 500
 
+# ===== ROUTES TÂCHES DE FOND =====
+# Les opérations longues sont soumises puis exécutées par jobs.py : la requête
+# répond 202 avec l'identifiant, le client suit GET /api/jobs/<id>.
+# Les routes synchrones d'origine restent disponibles.
+
+# Nombre maximal de tâches en attente avant de refuser les soumissions (503)
+JOBS_FILE_MAX = int(os.getenv('JOBS_FILE_MAX', 50))
+
+def soumettre_job(type_job, parametres=None, fichier=None):
+    if db.compter_jobs_en_attente() >= JOBS_FILE_MAX:
+        return jsonify({'success': False, 'error': "Trop de tâches en attente, réessayez plus tard"}), 503
+    job = db.creer_job(type_job, parametres, fichier, request_id=g.get('request_id'))
+    if not job:
+        return jsonify({'success': False, 'error': 'Erreur lors de la création de la tâche'}), 500
+    print(f"📨 Tâche {job['id']} soumise ({type_job})")
+    response = jsonify({'success': True, 'job_id': job['id'], 'statut': job['statut']})
+    response.status_code = 202
+    response.headers['Location'] = f"/api/jobs/{job['id']}"
+    return response
+
+@app.route('/api/jobs/import-utilisateurs', methods=['POST'])
+def soumettre_import_utilisateurs():
+    """Import Excel en tâche de fond (mêmes contrôles que /api/utilisateurs/import-excel)"""
+    try:
+        file = request.files.get('file')
+        if file is None or file.filename == '':
+            return jsonify({"success": False, "error": "Aucun fichier fourni"}), 400
+        if not allowed_file(file.filename):
+            return jsonify({"success": False, "error": "Format de fichier non autorisé. Utilisez .xlsx ou .xls"}), 400
+        contenu = file.read()
+        if not contenu:
+            return jsonify({"success": False, "error": "Le fichier est vide"}), 400
+        return soumettre_job('import_utilisateurs', {'nom_fichier': secure_filename(file.filename)}, contenu)
+    except Exception as e:
+        print(f"{prefixe_request_id()}❌ Erreur soumettre_import_utilisateurs: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/jobs/passage-classe', methods=['POST'])
+def soumettre_passage_classe():
+    """Passage de classe en tâche de fond (une seule exécution à la fois)"""
+    try:
+        # L'index unique idx_jobs_passage_classe_actif refuse un second passage,
+        # y compris entre deux soumissions simultanées
+        return soumettre_job('passage_classe')
+    except psycopg2.errors.UniqueViolation:
+        actif = db.get_job_actif('passage_classe')
+        return jsonify({'success': False, 'error': 'Un passage de classe est déjà en cours',
+                        'job_id': actif['id'] if actif else None}), 409
+    except Exception as e:
+        print(f"{prefixe_request_id()}❌ Erreur soumettre_passage_classe: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/jobs/export-archives', methods=['POST'])
+def soumettre_export_archives():
+    """Export CSV des archives en tâche de fond ; le fichier est servi par /api/jobs/<id>/resultat"""
+    try:
+        data = request.get_json(silent=True) or {}
+        annee = data.get('annee', request.args.get('annee'))
+        return soumettre_job('export_archives', {'annee': int(annee) if annee else None})
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Année invalide'}), 400
+    except Exception as e:
+        print(f"{prefixe_request_id()}❌ Erreur soumettre_export_archives: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/jobs', methods=['GET'])
+def get_jobs():
+    try:
+        limit = min(request.args.get('limit', 50, type=int), 200)
+        return jsonify(db.get_jobs(statut=request.args.get('statut'),
+                                   type_job=request.args.get('type'), limit=limit))
+    except Exception as e:
+        print(f"{prefixe_request_id()}❌ Erreur get_jobs: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    try:
+        job = db.get_job(job_id)
+        if not job:
+            return jsonify({'error': 'Tâche non trouvée'}), 404
+        return jsonify(job)
+    except Exception as e:
+        print(f"{prefixe_request_id()}❌ Erreur get_job: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<int:job_id>/resultat', methods=['GET'])
+def get_resultat_job(job_id):
+    """Fichier produit par une tâche terminée (export CSV)"""
+    try:
+        job = db.get_job(job_id)
+        if not job:
+            return jsonify({'error': 'Tâche non trouvée'}), 404
+        if job['statut'] != 'termine':
+            return jsonify({'error': f"Tâche {job['statut']}", 'statut': job['statut']}), 409
+        if not job['a_fichier_resultat']:
+            return jsonify({'error': "Cette tâche n'a pas produit de fichier"}), 404
+        nom_fichier = job['nom_fichier_resultat']
+        mimetype = 'text/csv' if nom_fichier.endswith('.csv') else 'application/octet-stream'
+        # Fichier relu morceau par morceau, jamais entièrement en mémoire
+        return Response(db.lire_fichier_job_stream(job_id), mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename={nom_fichier}'
+        })
+    except Exception as e:
+        print(f"{prefixe_request_id()}❌ Erreur get_resultat_job: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
     print("🚀 Démarrage de l'API Bac Pro CIEL - Backend corrigé")
+    # Développement : tâches de fond exécutées dans le processus servi par le rechargeur
+    if os.getenv('JOBS_EN_PROCESSUS', '0') == '1' and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        jobs.PoolJobs.depuis_env(db).demarrer()
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
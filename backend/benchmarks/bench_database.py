@@ -0,0 +1,309 @@
+"""
+Benchmark des méthodes chaudes de Database sur un jeu de données synthétique.
+
+Crée sur le serveur PostgreSQL local une base modèle jetable chargée avec
+database/init.sql et le jeu de données de donnees_synthetiques.py, puis
+chronomètre (échauffement + répétitions) :
+    - lectures, sur une copie de la base modèle : get_user_profile,
+      get_validations_par_evaluation, get_utilisateurs_concernes_par_evaluation,
+      exporter_archives_csv ;
+    - écritures, sur une copie fraîche à chaque appel (copie non chronométrée) :
+      importer_utilisateurs_excel (fichier .xlsx généré) et
+      passage_premiere_terminale_avec_archivage.
+
+Les résultats (min, médiane, moyenne, p95, écart-type en ms, commit git,
+paramètres du jeu) sont écrits en JSON pour comparer deux commits :
+    python benchmarks/bench_database.py --sortie avant.json
+    git checkout <autre commit>
+    python benchmarks/bench_database.py --sortie apres.json --comparer avant.json
+
+Usage (depuis backend/) : DATABASE_HOST, DATABASE_USER et DATABASE_PASSWORD
+désignent le serveur ; les bases <base>_modele, <base> et <base>_ecriture
+(--base, défaut bacprociel_bench) sont supprimées puis recréées.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import psycopg2
+
+RACINE_BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE_BACKEND)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Pas de capture de plans EXPLAIN en arrière-plan pendant les mesures
+os.environ.setdefault('SLOW_QUERY_EXPLAIN', '0')
+
+from donnees_synthetiques import ajouter_arguments, generer_fichier_excel, generer_jeu_de_donnees, parametres_jeu
+from models import Database
+
+
+def connexion(base, autocommit=False):
+    connection = psycopg2.connect(
+        host=os.getenv('DATABASE_HOST', 'localhost'),
+        database=base,
+        user=os.getenv('DATABASE_USER', 'admin'),
+        password=os.getenv('DATABASE_PASSWORD', 'password'),
+    )
+    connection.autocommit = autocommit
+    return connection
+
+
+class Serveur:
+    """Création et suppression des bases jetables (connexion d'administration)"""
+
+    def __init__(self, base_admin):
+        self.connection = connexion(base_admin, autocommit=True)
+
+    def recreer(self, base, modele=None):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS "{base}" WITH (FORCE)')
+            cursor.execute(f'CREATE DATABASE "{base}"' + (f' TEMPLATE "{modele}"' if modele else ''))
+
+    def supprimer(self, base):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS "{base}" WITH (FORCE)')
+
+    def version(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("SHOW server_version")
+            return cursor.fetchone()[0]
+
+    def fermer(self):
+        self.connection.close()
+
+
+def ouvrir_database(base):
+    """Database de l'application pointée sur la base donnée (messages masqués)"""
+    os.environ['DATABASE_NAME'] = base
+    with contextlib.redirect_stdout(io.StringIO()):
+        return Database()
+
+
+def statistiques(echantillons):
+    """Statistiques en millisecondes d'une série de durées en secondes"""
+    ms = sorted(d * 1000 for d in echantillons)
+    rang_p95 = max(0, min(len(ms) - 1, round(0.95 * len(ms) + 0.5) - 1))
+    return {
+        'n': len(ms),
+        'min_ms': round(ms[0], 3),
+        'mediane_ms': round(statistics.median(ms), 3),
+        'moyenne_ms': round(statistics.fmean(ms), 3),
+        'p95_ms': round(ms[rang_p95], 3),
+        'max_ms': round(ms[-1], 3),
+        'ecart_type_ms': round(statistics.stdev(ms), 3) if len(ms) > 1 else 0.0,
+    }
+
+
+def chronometrer(appel, preparer=None, nettoyer=None, verifier=None, echauffement=3, repetitions=20):
+    """
+    Exécute appel() echauffement + repetitions fois ; seules les répétitions
+    sont gardées. preparer() fournit l'argument de l'appel et nettoyer(contexte)
+    le libère : ni l'un ni l'autre n'est chronométré.
+    """
+    echantillons = []
+    for i in range(echauffement + repetitions):
+        contexte = preparer() if preparer else None
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                debut = time.perf_counter()
+                resultat = appel(contexte)
+                duree = time.perf_counter() - debut
+            if verifier and not verifier(resultat):
+                raise RuntimeError(f"Résultat inattendu: {str(resultat)[:300]}")
+        finally:
+            if nettoyer:
+                nettoyer(contexte)
+        if i >= echauffement:
+            echantillons.append(duree)
+    return statistiques(echantillons)
+
+
+def choisir_cibles(base):
+    """Élève et évaluation les plus chargés du jeu (les cas les plus coûteux)"""
+    with connexion(base) as connection, connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT evaluation_id FROM validations
+            GROUP BY evaluation_id ORDER BY COUNT(*) DESC, evaluation_id LIMIT 1
+        """)
+        evaluation_id = cursor.fetchone()[0]
+        cursor.execute("""
+            SELECT utilisateur_id FROM validations
+            GROUP BY utilisateur_id ORDER BY COUNT(*) DESC, utilisateur_id LIMIT 1
+        """)
+        utilisateur_id = cursor.fetchone()[0]
+    connection.close()
+    return utilisateur_id, evaluation_id
+
+
+def bench_lectures(base, echauffement, repetitions):
+    utilisateur_id, evaluation_id = choisir_cibles(base)
+    db = ouvrir_database(base)
+    try:
+        # Chaque appel rend sa connexion comme en fin de requête HTTP
+        options = dict(nettoyer=lambda _: db.release_connection(),
+                       echauffement=echauffement, repetitions=repetitions)
+        cas = {
+            'get_user_profile': chronometrer(
+                lambda _: db.get_user_profile(utilisateur_id),
+                verifier=lambda r: r is not None, **options),
+            'get_validations_par_evaluation': chronometrer(
+                lambda _: db.get_validations_par_evaluation(evaluation_id),
+                verifier=bool, **options),
+            'get_utilisateurs_concernes_par_evaluation': chronometrer(
+                lambda _: db.get_utilisateurs_concernes_par_evaluation(evaluation_id),
+                verifier=bool, **options),
+            'exporter_archives_csv': chronometrer(
+                lambda _: db.exporter_archives_csv(),
+                verifier=lambda r: r is not None and r.count('\n') > 0, **options),
+        }
+    finally:
+        db.fermer()
+    for nom in cas:
+        cas[nom]['arguments'] = {
+            'get_user_profile': {'user_id': utilisateur_id},
+            'exporter_archives_csv': {'annee': None},
+        }.get(nom, {'evaluation_id': evaluation_id})
+    return cas
+
+
+def bench_ecritures(serveur, base_modele, base, fichier_excel, echauffement, repetitions):
+    def preparer():
+        serveur.recreer(base, modele=base_modele)
+        return ouvrir_database(base)
+
+    def nettoyer(db):
+        db.release_connection()
+        db.fermer()
+
+    options = dict(preparer=preparer, nettoyer=nettoyer,
+                   echauffement=echauffement, repetitions=repetitions)
+    try:
+        return {
+            'importer_utilisateurs_excel': chronometrer(
+                lambda db: db.importer_utilisateurs_excel(fichier_excel),
+                verifier=lambda r: r.get('success') and r['total_importes'] > 0, **options),
+            'passage_premiere_terminale_avec_archivage': chronometrer(
+                lambda db: db.passage_premiere_terminale_avec_archivage(),
+                verifier=lambda r: r.get('success'), **options),
+        }
+    finally:
+        serveur.supprimer(base)
+
+
+def commit_git():
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=RACINE_BACKEND, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    try:
+        return {'commit': git('rev-parse', 'HEAD'),
+                'modifie': bool(git('status', '--porcelain', '--untracked-files=no'))}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'modifie': None}
+
+
+def afficher(resultats, reference=None):
+    anciens = (reference or {}).get('methodes', {})
+    print(f"\n{'méthode':<44}{'médiane':>10}{'p95':>10}{'min':>10}" + ('   vs référence' if anciens else ''))
+    for nom, stats in resultats['methodes'].items():
+        ligne = f"{nom:<44}{stats['mediane_ms']:>8.2f}ms{stats['p95_ms']:>8.2f}ms{stats['min_ms']:>8.2f}ms"
+        if nom in anciens and anciens[nom]['mediane_ms']:
+            ligne += f"   x{anciens[nom]['mediane_ms'] / stats['mediane_ms']:.2f}"
+        print(ligne)
+    if anciens:
+        if reference.get('parametres') != resultats['parametres']:
+            print("⚠️ Paramètres différents de la référence : comparaison indicative")
+        print(f"(x > 1 : plus rapide que {reference.get('git', {}).get('commit', '?')[:10]})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ajouter_arguments(parser)
+    parser.add_argument('--base', default='bacprociel_bench', help="préfixe des bases jetables")
+    parser.add_argument('--base-admin', default='postgres', help="base utilisée pour créer/supprimer")
+    parser.add_argument('--init-sql', default=os.path.join(RACINE_BACKEND, '..', 'database', 'init.sql'))
+    parser.add_argument('--echauffement', type=int, default=3)
+    parser.add_argument('--repetitions', type=int, default=20)
+    parser.add_argument('--repetitions-ecriture', type=int, default=5)
+    parser.add_argument('--lignes-import', type=int, default=200)
+    parser.add_argument('--sortie', help="fichier JSON (défaut : bench_database_<commit>.json)")
+    parser.add_argument('--comparer', help="résultats JSON d'un autre commit")
+    parser.add_argument('--garder', action='store_true', help="ne pas supprimer les bases à la fin")
+    args = parser.parse_args()
+
+    if args.base in ('bacprociel', os.getenv('DATABASE_NAME')):
+        parser.error("--base doit désigner une base jetable, pas celle de l'application")
+
+    base_modele, base_ecriture = f"{args.base}_modele", f"{args.base}_ecriture"
+    serveur = Serveur(args.base_admin)
+    fichier_excel = os.path.join(tempfile.mkdtemp(prefix='bench_import_'), 'import.xlsx')
+    try:
+        print(f"🗄️ Base modèle {base_modele} ({args.init_sql})")
+        serveur.recreer(base_modele)
+        with open(args.init_sql, encoding='utf-8') as f:
+            script = f.read()
+        connection = connexion(base_modele)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), connection.cursor() as cursor:
+                cursor.execute(script)
+            connection.commit()
+            jeu = generer_jeu_de_donnees(connection, **parametres_jeu(args))
+        finally:
+            connection.close()
+        generer_fichier_excel(fichier_excel, args.lignes_import, classes=args.classes, graine=args.graine)
+
+        print(f"⏱️ Lectures ({args.echauffement} + {args.repetitions} appels)")
+        serveur.recreer(args.base, modele=base_modele)
+        methodes = bench_lectures(args.base, args.echauffement, args.repetitions)
+
+        print(f"⏱️ Écritures ({args.echauffement} + {args.repetitions_ecriture} appels sur base fraîche)")
+        methodes.update(bench_ecritures(serveur, base_modele, base_ecriture, fichier_excel,
+                                        args.echauffement, args.repetitions_ecriture))
+        methodes['importer_utilisateurs_excel']['arguments'] = {'lignes': args.lignes_import}
+
+        resultats = {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'git': commit_git(),
+            'environnement': {
+                'python': platform.python_version(),
+                'postgresql': serveur.version(),
+                'machine': platform.platform(),
+                'processeurs': os.cpu_count(),
+            },
+            'parametres': {**parametres_jeu(args),
+                           'echauffement': args.echauffement,
+                           'repetitions': args.repetitions,
+                           'repetitions_ecriture': args.repetitions_ecriture,
+                           'lignes_import': args.lignes_import},
+            'jeu_de_donnees': jeu,
+            'methodes': methodes,
+        }
+    finally:
+        if not args.garder:
+            serveur.supprimer(args.base)
+            serveur.supprimer(base_modele)
+        serveur.fermer()
+
+    reference = None
+    if args.comparer:
+        with open(args.comparer, encoding='utf-8') as f:
+            reference = json.load(f)
+    afficher(resultats, reference)
+
+    sortie = args.sortie or f"bench_database_{(resultats['git']['commit'] or 'local')[:10]}.json"
+    with open(sortie, 'w', encoding='utf-8') as f:
+        json.dump(resultats, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ Résultats écrits dans {sortie}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Micro-benchmark de la sérialisation JSON des grosses listes du backend.
+
+Compare le fournisseur JSON par défaut de Flask (avec la copie dict(...)
+historique des routes) et OrjsonProvider, sur des lignes RealDictRow
+synthétiques de la forme de /api/utilisateurs et des listes de validations.
+
+Usage (depuis backend/) :
+    python benchmarks/bench_json.py [nb_lignes] [repetitions]
+"""
+import os
+import sys
+import timeit
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from psycopg2.extras import RealDictRow
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from json_provider import OrjsonProvider
+
+
+def ligne(valeurs):
+    row = RealDictRow()
+    row.update(valeurs)
+    return row
+
+
+def generer_utilisateurs(n):
+    debut = datetime(2024, 9, 1, 8, 0, 0)
+    return [ligne({
+        'id': i,
+        'nom': f'Nom{i}',
+        'prenom': f'Prénom{i}',
+        'email': f'prenom{i}.nom{i}@bacpro-ciel.fr',
+        'classe': 'Première' if i % 2 else 'Terminale',
+        'date_naissance': date(2007, 1, 1) + timedelta(days=i % 700),
+        'date_entree_bac': 2024,
+        'date_certification': 2026,
+        'specialite': 'CIEL',
+        'date_creation': debut + timedelta(minutes=i),
+    }) for i in range(n)]
+
+
+def generer_validations(n):
+    debut = datetime(2025, 1, 6, 10, 0, 0)
+    return [ligne({
+        'id': i,
+        'utilisateur_id': i % 300,
+        'evaluation_id': i % 40,
+        'item_id': i % 120,
+        'niveau': i % 4,
+        'commentaire': "Bonne maîtrise de la configuration réseau, à consolider sur la documentation. " * 2,
+        'validateur': 'Professeur',
+        'date_validation': debut + timedelta(minutes=i),
+        'nom': f'Nom{i % 300}',
+        'prenom': f'Prénom{i % 300}',
+        'classe': 'Terminale',
+        'code_item': f'C{i % 11:02d}.{i % 9}',
+        'sous_item': "Mettre en œuvre et configurer les équipements d'interconnexion",
+        'item_description': "Description détaillée de l'item évalué dans le référentiel",
+        'competence_code': f'C{i % 11:02d}',
+        'niveau_moyen': Decimal('2.35'),
+    }) for i in range(n)]
+
+
+def mesurer(nom, fonction, repetitions):
+    duree = min(timeit.repeat(fonction, number=repetitions, repeat=5)) / repetitions
+    print(f"  {nom:<34} {duree * 1000:8.2f} ms")
+    return duree
+
+
+def main():
+    nb_lignes = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    app = Flask(__name__)
+    defaut = DefaultJSONProvider(app)
+    rapide = OrjsonProvider(app)
+
+    for nom, lignes in (('utilisateurs', generer_utilisateurs(nb_lignes)),
+                        ('validations', generer_validations(nb_lignes))):
+        print(f"📊 {nom} ({nb_lignes} lignes, moyenne sur {repetitions} appels)")
+        with app.app_context():
+            avant = mesurer("Flask défaut + dict(...)",
+                            lambda: defaut.response([dict(r) for r in lignes]).get_data(), repetitions)
+            apres = mesurer("OrjsonProvider (lignes directes)",
+                            lambda: rapide.response(lignes).get_data(), repetitions)
+        print(f"  ➜ gain x{avant / apres:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Budgets d'instructions SQL par route du backend (garde-fou contre les N+1).
+
+Chaque route est appelée via le client de test Flask, une première fois pour
+chauffer les caches (référentiel), puis une seconde fois sous un compteur
+(compteur_requetes.budget_requetes) : le script échoue si une route exécute
+plus d'instructions que son budget. Les cas à N éléments (40 items pour
+/api/valider-multiple, 200 lignes d'import Excel) sont dimensionnés pour
+qu'une requête glissée dans une boucle dépasse largement le budget.
+
+Usage (depuis backend/, sur une base jetable : les routes d'écriture modifient
+les données) :
+    DATABASE_NAME=bacprociel_bench python benchmarks/donnees_synthetiques.py
+    DATABASE_NAME=bacprociel_bench python benchmarks/budgets_sql.py [--mesurer]
+--mesurer affiche les nombres mesurés sans échouer (pour ajuster BUDGETS).
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import os
+import sys
+import tempfile
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ['SQL_DEBUG_HEADERS'] = '1'
+os.environ.setdefault('SLOW_QUERY_EXPLAIN', '0')
+
+from compteur_requetes import BudgetRequetesDepasse, budget_requetes
+from donnees_synthetiques import generer_fichier_excel
+
+# Préfixe d'emails différent à chaque import : les lignes importées sont nouvelles
+TIRAGES = itertools.count()
+EXECUTION = uuid.uuid4().hex[:8]
+
+# (méthode, chemin, budget) ; les {paramètres} sont résolus par trouver_identifiants
+BUDGETS = [
+    ('GET', '/api/utilisateurs', 2),
+    ('GET', '/api/utilisateurs/{utilisateur_id}', 1),
+    ('GET', '/api/competences', 1),
+    ('GET', '/api/items', 1),
+    ('GET', '/api/evaluations', 2),
+    ('GET', '/api/evaluations/{evaluation_id}', 2),
+    ('GET', '/api/evaluations/{evaluation_id}/bundle?referentiel=1', 8),
+    ('GET', '/api/evaluations/{evaluation_id}/fiche/{utilisateur_id}', 5),
+    ('GET', '/api/evaluations/{evaluation_id}/validations', 2),
+    ('GET', '/api/evaluations/{evaluation_id}/attributions', 1),
+    ('GET', '/api/evaluations/{evaluation_id}/utilisateurs-concernes', 1),
+    ('GET', '/api/utilisateurs/{utilisateur_id}/validations', 1),
+    ('GET', '/api/utilisateur/{utilisateur_id}/profil', 2),
+    ('GET', '/api/classes/Terminale/profils', 2),
+    ('GET', '/api/passage-classe/preview', 1),
+    ('GET', '/api/passage-classe/archives', 2),
+    ('GET', '/api/passage-classe/archives/stats', 2),
+    ('GET', '/api/passage-classe/archives/search?q=martin', 1),
+    ('GET', '/api/passage-classe/archives/{archive_id}', 2),
+    ('GET', '/api/passage-classe/archives/export', 1),
+    ('GET', '/api/passage-classe/historique/{utilisateur_id}', 2),
+    ('GET', '/api/recherche/eleves?q=martin', 1),
+    ('POST', '/api/validations', 1),
+    ('POST', '/api/valider-multiple', 5),
+    ('POST', '/api/utilisateurs/import-excel', 4),
+]
+
+
+def trouver_identifiants(client):
+    """Évaluation la plus chargée, un élève concerné, une archive"""
+    evaluations = client.get('/api/evaluations').get_json()
+    if not evaluations:
+        raise RuntimeError("Aucune évaluation : générer d'abord le jeu de données")
+    evaluation_id = None
+    utilisateur_id = None
+    for evaluation in evaluations:
+        concernes = client.get(f"/api/evaluations/{evaluation['id']}/utilisateurs-concernes").get_json()
+        if concernes:
+            evaluation_id, utilisateur_id = evaluation['id'], concernes[0]['id']
+            break
+    if evaluation_id is None:
+        raise RuntimeError("Aucune évaluation attribuée à un élève")
+    archives = client.get('/api/passage-classe/archives?limit=1').get_json() or {}
+    archive = (archives.get('archives') or [{}])[0]
+    items = [item['id'] for item in client.get('/api/items').get_json()]
+    return {
+        'evaluation_id': evaluation_id,
+        'utilisateur_id': utilisateur_id,
+        'archive_id': archive.get('id', 0),
+        'items': items,
+    }
+
+
+def appeler(client, methode, chemin, ids, fichier_excel):
+    if chemin == '/api/valider-multiple':
+        validations = [{'item_id': item_id, 'niveau_validation': 1 + i % 4, 'commentaire': ''}
+                       for i, item_id in enumerate((ids['items'] * 2)[:40])]
+        return client.post(chemin, json={'utilisateur_id': ids['utilisateur_id'],
+                                         'evaluation_id': ids['evaluation_id'],
+                                         'validations': validations})
+    if chemin == '/api/validations':
+        return client.post(chemin, json={'utilisateur_id': ids['utilisateur_id'],
+                                         'evaluation_id': ids['evaluation_id'],
+                                         'item_id': ids['items'][0], 'niveau_validation': 2})
+    if chemin == '/api/utilisateurs/import-excel':
+        generer_fichier_excel(fichier_excel, 200, prefixe=f"budget{EXECUTION}n{next(TIRAGES)}i")
+        with open(fichier_excel, 'rb') as f:
+            return client.post(chemin, data={'file': (io.BytesIO(f.read()), 'import.xlsx')},
+                               content_type='multipart/form-data')
+    return client.open(chemin, method=methode)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mesurer', action='store_true', help="afficher les nombres sans échouer")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import app
+    app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp(prefix='budgets_sql_')
+    client = app.test_client()
+    fichier_excel = os.path.join(app.config['UPLOAD_FOLDER'], 'modele.xlsx')
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        ids = trouver_identifiants(client)
+
+    depassements = []
+    for methode, gabarit, budget in BUDGETS:
+        chemin = gabarit.format(**ids)
+        with contextlib.redirect_stdout(io.StringIO()):
+            appeler(client, methode, chemin, ids, fichier_excel).get_data()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                with budget_requetes(budget, f"{methode} {gabarit}") as compteur:
+                    response = appeler(client, methode, chemin, ids, fichier_excel)
+                    # Corps lu dans le bloc : les réponses en flux exécutent leurs requêtes ici
+                    response.get_data()
+            if response.status_code >= 400:
+                # Une route en erreur s'arrête tôt : son nombre d'instructions ne prouve rien
+                raise BudgetRequetesDepasse(f"{methode} {gabarit}: HTTP {response.status_code}")
+            etat = '✅'
+        except BudgetRequetesDepasse as e:
+            depassements.append(str(e))
+            etat = '⚠️' if args.mesurer else '❌'
+        print(f"{etat} {methode:<5}{gabarit:<60}{compteur.nombre:>4} / {budget:<4}"
+              f"HTTP {response.status_code}  X-SQL-Requetes={response.headers.get('X-SQL-Requetes')}")
+
+    if depassements and not args.mesurer:
+        print(f"\n❌ {len(depassements)} budget(s) dépassé(s) :")
+        for message in depassements:
+            print(message)
+        return 1
+    if not depassements:
+        print("\n✅ Budgets respectés")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
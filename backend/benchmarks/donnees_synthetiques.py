@@ -0,0 +1,277 @@
+"""
+Générateur de jeu de données synthétique pour les benchmarks de Database.
+
+Ajoute à une base initialisée avec database/init.sql (référentiel de
+compétences et d'items déjà présent) : des élèves répartis en classes, des
+évaluations attribuées par classe (et quelques élèves individuellement), leurs
+validations et des promotions d'élèves archivés. Les tirages sont déterministes
+pour une graine donnée : deux exécutions produisent le même jeu.
+
+Usage (depuis backend/, variables DATABASE_* pointant sur une base jetable) :
+    python benchmarks/donnees_synthetiques.py --eleves 300 --classes 2 \\
+        --evaluations 40 --validations-par-eleve 60 --cohortes-archivees 5
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import psycopg2
+from psycopg2.extras import execute_values
+
+NOMS = ('Martin', 'Bernard', 'Dubois', 'Thomas', 'Robert', 'Richard', 'Petit', 'Durand',
+        'Leroy', 'Moreau', 'Simon', 'Laurent', 'Lefèvre', 'Michel', 'Garcia', 'David',
+        'Bertrand', 'Roux', 'Vincent', 'Fournier', 'Morel', 'Girard', 'André', 'Mercier',
+        'Dupont', 'Lambert', 'Bonnet', 'François', 'Martinez', 'Legrand')
+PRENOMS = ('Lucas', 'Emma', 'Hugo', 'Léa', 'Louis', 'Chloé', 'Nathan', 'Manon', 'Enzo',
+           'Inès', 'Théo', 'Jade', 'Mathis', 'Camille', 'Noah', 'Sarah', 'Gabriel', 'Zoé',
+           'Jules', 'Lina', 'Raphaël', 'Anaïs', 'Tom', 'Clara', 'Ethan', 'Lucie', 'Yanis',
+           'Maëlys', 'Adam', 'Élise')
+MODULES = ('Réseaux locaux', 'Câblage et brassage', 'Programmation Python', 'Systèmes embarqués',
+           'Cybersécurité', 'Maintenance des postes', 'Virtualisation', 'Téléphonie IP',
+           'Électronique numérique', 'Projet de fin de cycle')
+POLES = ('Pôle 1', 'Pôle 2', 'Pôle 3')
+COMMENTAIRES = ("Bonne maîtrise, à consolider sur la documentation.",
+                "Travail rigoureux et autonome.",
+                "Manque de méthode lors de la mise en service.",
+                "Configuration correcte mais justification insuffisante.")
+
+# Les deux premières classes sont celles que traite le passage de fin d'année
+CLASSES = ('Première', 'Terminale', 'Seconde')
+
+
+def noms_classes(nb_classes):
+    """Première, Terminale, Seconde puis « Classe N » au-delà"""
+    return [CLASSES[i] if i < len(CLASSES) else f"Classe {i + 1}" for i in range(nb_classes)]
+
+
+def _copier(cursor, table, colonnes, lignes):
+    """Chargement en masse via COPY (valeurs sans tabulation ni retour à la ligne)"""
+    tampon = io.StringIO()
+    for ligne in lignes:
+        tampon.write('\t'.join(r'\N' if v is None else str(v) for v in ligne))
+        tampon.write('\n')
+    tampon.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(colonnes)}) FROM STDIN", tampon)
+
+
+def _eleve(rng, numero, classe, annee):
+    nom = rng.choice(NOMS)
+    prenom = rng.choice(PRENOMS)
+    entree = annee - (1 if classe == 'Terminale' else 0)
+    return (
+        nom,
+        prenom,
+        f"{prenom.lower()}.{nom.lower()}.{numero}@bench.bacpro-ciel.fr",
+        classe,
+        'CIEL',
+        date(entree - 15, 1, 1) + timedelta(days=rng.randrange(365)),
+        entree,
+        entree + 2,
+    )
+
+
+def generer_jeu_de_donnees(connection, eleves=300, classes=2, evaluations=40,
+                           validations_par_eleve=60, cohortes_archivees=5, graine=42):
+    """
+    Remplit la base et renvoie un résumé des volumes insérés.
+    Args:
+        connection: connexion psycopg2 (validée en fin de génération)
+        eleves: nombre d'élèves actifs, répartis également entre les classes
+        classes: nombre de classes (les deux premières sont Première et Terminale)
+        evaluations: nombre d'évaluations, attribuées chacune à une classe
+        validations_par_eleve: validations par élève (bornées par les items de ses évaluations)
+        cohortes_archivees: nombre de promotions déjà archivées
+        graine: graine des tirages aléatoires
+    """
+    rng = random.Random(graine)
+    annee = date.today().year
+    liste_classes = noms_classes(max(1, classes))
+    debut = time.perf_counter()
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT id FROM items ORDER BY id")
+        item_ids = [row[0] for row in cursor.fetchall()]
+        if not item_ids:
+            raise RuntimeError("Aucun item en base : charger database/init.sql d'abord")
+
+        # 1. Élèves
+        lignes_eleves = [_eleve(rng, i, liste_classes[i % len(liste_classes)], annee)
+                         for i in range(eleves)]
+        ids_eleves = execute_values(cursor, """
+            INSERT INTO utilisateurs (nom, prenom, email, classe, specialite,
+                                      date_naissance, date_entree_bac, date_certification)
+            VALUES %s RETURNING id, classe
+        """, lignes_eleves, page_size=1000, fetch=True)
+        eleves_par_classe = {classe: [] for classe in liste_classes}
+        for utilisateur_id, classe in ids_eleves:
+            eleves_par_classe[classe].append(utilisateur_id)
+
+        # 2. Évaluations, leurs items et leurs attributions
+        date_debut = datetime(annee - 1, 9, 1, 8, 0)
+        ids_evaluations = execute_values(cursor, """
+            INSERT INTO evaluations (pole, module, contexte, date_creation) VALUES %s RETURNING id
+        """, [(rng.choice(POLES), f"{rng.choice(MODULES)} #{e + 1}",
+               "Évaluation générée pour les benchmarks",
+               date_debut + timedelta(days=rng.randrange(280)))
+              for e in range(evaluations)], page_size=1000, fetch=True)
+        ids_evaluations = [row[0] for row in ids_evaluations]
+
+        items_evaluation = {}
+        evaluations_par_eleve = {}
+        attributions = []
+        for rang, evaluation_id in enumerate(ids_evaluations):
+            items_evaluation[evaluation_id] = rng.sample(item_ids, min(len(item_ids), rng.randint(4, 12)))
+            classe = liste_classes[rang % len(liste_classes)]
+            attributions.append((evaluation_id, classe, None))
+            for utilisateur_id in eleves_par_classe[classe]:
+                evaluations_par_eleve.setdefault(utilisateur_id, []).append(evaluation_id)
+            # Une évaluation sur cinq est aussi attribuée à quelques élèves d'une autre classe
+            autres = eleves_par_classe[liste_classes[(rang + 1) % len(liste_classes)]]
+            if rang % 5 == 0 and len(liste_classes) > 1 and autres:
+                for utilisateur_id in rng.sample(autres, min(3, len(autres))):
+                    attributions.append((evaluation_id, None, utilisateur_id))
+                    evaluations_par_eleve.setdefault(utilisateur_id, []).append(evaluation_id)
+
+        _copier(cursor, 'evaluation_items', ('evaluation_id', 'item_id'),
+                ((e, item_id) for e, items in items_evaluation.items() for item_id in items))
+        _copier(cursor, 'evaluation_attributions', ('evaluation_id', 'classe', 'utilisateur_id'),
+                attributions)
+
+        # 3. Validations : couples (évaluation, item) tirés parmi les évaluations de l'élève
+        validations = []
+        for utilisateur_id, evals in evaluations_par_eleve.items():
+            couples = [(e, item_id) for e in evals for item_id in items_evaluation[e]]
+            for evaluation_id, item_id in rng.sample(couples, min(validations_par_eleve, len(couples))):
+                validations.append((
+                    utilisateur_id, evaluation_id, item_id, rng.randint(0, 4),
+                    rng.choice(COMMENTAIRES) if rng.random() < 0.3 else None,
+                    date_debut + timedelta(days=rng.randrange(280), minutes=rng.randrange(600)),
+                    'Enseignant',
+                ))
+        _copier(cursor, 'validations',
+                ('utilisateur_id', 'evaluation_id', 'item_id', 'niveau_validation',
+                 'commentaire', 'date_validation', 'validateur'), validations)
+
+        # 4. Promotions archivées : une cohorte de Terminale par année passée
+        taille_cohorte = max(1, eleves // len(liste_classes))
+        archives = []
+        for k in range(1, cohortes_archivees + 1):
+            annee_diplome = annee - k
+            for i in range(taille_cohorte):
+                nom, prenom, email, _, specialite, naissance, entree, certification = _eleve(
+                    rng, f"a{annee_diplome}.{i}", 'Terminale', annee_diplome)
+                archives.append((
+                    10_000_000 + annee_diplome * 10_000 + i, nom, prenom, email, 'Terminale',
+                    specialite, naissance - timedelta(days=365 * k), entree - k, certification - k,
+                    datetime(entree - k, 9, 1), datetime(annee_diplome, 7, 5), annee_diplome,
+                    rng.randint(0, validations_par_eleve),
+                ))
+        _copier(cursor, 'utilisateurs_archives',
+                ('utilisateur_id', 'nom', 'prenom', 'email', 'classe_origine', 'specialite',
+                 'date_naissance', 'date_entree_bac', 'date_certification', 'date_inscription',
+                 'date_archivage', 'annee_diplome', 'nb_validations'), archives)
+
+    connection.commit()
+
+    # Statistiques à jour pour que les plans soient ceux d'une base en service
+    ancien_autocommit = connection.autocommit
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    connection.autocommit = ancien_autocommit
+
+    resume = {
+        'eleves': len(ids_eleves),
+        'classes': liste_classes,
+        'evaluations': len(ids_evaluations),
+        'attributions': len(attributions),
+        'validations': len(validations),
+        'archives': len(archives),
+        'graine': graine,
+        'duree_s': round(time.perf_counter() - debut, 2),
+    }
+    print(f"✅ Jeu de données généré: {resume}")
+    return resume
+
+
+def generer_fichier_excel(chemin, nb_lignes=200, classes=2, graine=7, taux_erreurs=0.02, prefixe='import'):
+    """
+    Fichier d'import .xlsx au format attendu par importer_utilisateurs_excel.
+    Une petite part des lignes est volontairement invalide (classe absente,
+    email en double) pour exercer aussi le chemin des erreurs. Les emails
+    dépendent de prefixe : changer de préfixe pour importer de nouveaux élèves.
+    """
+    rng = random.Random(graine)
+    annee = date.today().year
+    liste_classes = noms_classes(max(1, classes))
+    lignes = []
+    for i in range(nb_lignes):
+        nom, prenom, email, classe, specialite, naissance, entree, certification = _eleve(
+            rng, f"{prefixe}{i}", liste_classes[i % len(liste_classes)], annee)
+        if rng.random() < taux_erreurs:
+            if rng.random() < 0.5:
+                classe = None
+            elif lignes:
+                email = lignes[-1]['Email']
+        lignes.append({
+            'Nom': nom.upper(),
+            'Prénom': prenom,
+            'Email': email,
+            'Classe': classe,
+            'Date naissance': naissance.strftime('%d/%m/%Y'),
+            'Date entree bac': entree,
+            'Date certification': certification,
+            'Spécialité': specialite,
+        })
+    pd.DataFrame(lignes).to_excel(chemin, index=False)
+    return chemin
+
+
+def _connexion_depuis_env():
+    return psycopg2.connect(
+        host=os.getenv('DATABASE_HOST', 'localhost'),
+        database=os.getenv('DATABASE_NAME', 'bacprociel_bench'),
+        user=os.getenv('DATABASE_USER', 'admin'),
+        password=os.getenv('DATABASE_PASSWORD', 'password'),
+    )
+
+
+def ajouter_arguments(parser):
+    """Paramètres du jeu de données, partagés avec bench_database.py"""
+    parser.add_argument('--eleves', type=int, default=300)
+    parser.add_argument('--classes', type=int, default=2)
+    parser.add_argument('--evaluations', type=int, default=40)
+    parser.add_argument('--validations-par-eleve', type=int, default=60)
+    parser.add_argument('--cohortes-archivees', type=int, default=5)
+    parser.add_argument('--graine', type=int, default=42)
+    return parser
+
+
+def parametres_jeu(args):
+    return {
+        'eleves': args.eleves,
+        'classes': args.classes,
+        'evaluations': args.evaluations,
+        'validations_par_eleve': args.validations_par_eleve,
+        'cohortes_archivees': args.cohortes_archivees,
+        'graine': args.graine,
+    }
+
+
+def main():
+    parser = ajouter_arguments(argparse.ArgumentParser(description=__doc__.strip().splitlines()[0]))
+    args = parser.parse_args()
+    connection = _connexion_depuis_env()
+    try:
+        generer_jeu_de_donnees(connection, **parametres_jeu(args))
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""
+Comptage des instructions SQL exécutées pendant une requête HTTP (ou un bloc).
+
+Les curseurs chronométrés (voir requetes_lentes.CurseurChronometre) signalent
+chaque instruction au compteur actif du contexte courant. Le backend ouvre un
+compteur par requête et, si SQL_DEBUG_HEADERS=1 (ou en mode debug), renvoie
+X-SQL-Requetes et X-SQL-Duree-Ms. Les budgets permettent de détecter une
+requête glissée dans une boucle (N+1) :
+
+    with budget_requetes(5):
+        db.valider_multiple(utilisateur_id, evaluation_id, validations, 'Enseignant')
+"""
+import contextvars
+from contextlib import contextmanager
+
+_compteur_courant = contextvars.ContextVar('compteur_requetes', default=None)
+
+
+class BudgetRequetesDepasse(AssertionError):
+    pass
+
+
+class CompteurRequetes:
+
+    def __init__(self, garder_sql=False, parent=None):
+        self.parent = parent
+        self.nombre = 0
+        self.duree_ms = 0.0
+        # Texte des instructions, utile pour expliquer un budget dépassé
+        self.requetes = [] if garder_sql else None
+
+    def enregistrer(self, sql, duree_ms, nombre=1):
+        self.nombre += nombre
+        self.duree_ms += duree_ms
+        if self.requetes is not None:
+            if isinstance(sql, bytes):
+                sql = sql.decode('utf-8', 'replace')
+            self.requetes.append(' '.join(str(sql).split())[:200])
+
+
+def demarrer(garder_sql=False):
+    """Active un nouveau compteur ; renvoie (compteur, jeton pour arreter)"""
+    compteur = CompteurRequetes(garder_sql, parent=_compteur_courant.get())
+    return compteur, _compteur_courant.set(compteur)
+
+
+def arreter(jeton):
+    _compteur_courant.reset(jeton)
+
+
+def compteur_actif():
+    return _compteur_courant.get()
+
+
+def enregistrer(sql, duree_ms, nombre=1):
+    """Appelé par les curseurs après chaque instruction"""
+    compteur = _compteur_courant.get()
+    while compteur is not None:
+        compteur.enregistrer(sql, duree_ms, nombre)
+        compteur = compteur.parent
+
+
+@contextmanager
+def compter_requetes(garder_sql=True):
+    """Compte les instructions exécutées dans le bloc (le compteur englobant compte aussi)"""
+    compteur, jeton = demarrer(garder_sql)
+    try:
+        yield compteur
+    finally:
+        arreter(jeton)
+
+
+def verifier_budget(compteur, maximum, description='bloc'):
+    """Lève BudgetRequetesDepasse si le compteur dépasse maximum instructions"""
+    if compteur.nombre > maximum:
+        detail = ''.join(f"\n  {i + 1}. {sql}" for i, sql in enumerate(compteur.requetes or []))
+        raise BudgetRequetesDepasse(
+            f"{description}: {compteur.nombre} instructions SQL pour un budget de {maximum}{detail}")
+
+
+@contextmanager
+def budget_requetes(maximum, description='bloc'):
+    """Échoue si le bloc exécute plus de maximum instructions SQL"""
+    with compter_requetes() as compteur:
+        yield compteur
+    verifier_budget(compteur, maximum, description)
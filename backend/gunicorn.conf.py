@@ -0,0 +1,73 @@
+# Configuration gunicorn du backend (mode production)
+#
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# Rechargement gracieux (nouveaux workers avec le nouveau code, les requêtes
+# en cours se terminent sur les anciens) :
+#   kill -HUP <pid du master>      ou   docker compose kill -s HUP backend
+import multiprocessing
+import os
+import shutil
+
+# Métriques Prometheus partagées entre workers (agrégées par /metrics)
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus_backend')
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Un worker par cœur, chacun avec quelques threads. Chaque worker a son propre
+# pool PostgreSQL (DATABASE_POOL_MAX connexions) : par défaut le nombre de
+# workers est plafonné pour que workers x DATABASE_POOL_MAX tienne dans
+# DATABASE_MAX_CONNECTIONS (max_connections de PostgreSQL, 100 par défaut)
+# moins DATABASE_CONNEXIONS_RESERVEES (service jobs, psql, superutilisateur).
+connexions_disponibles = (int(os.getenv('DATABASE_MAX_CONNECTIONS', 100))
+                          - int(os.getenv('DATABASE_CONNEXIONS_RESERVEES', 15)))
+workers_max = max(1, connexions_disponibles // int(os.getenv('DATABASE_POOL_MAX', 10)))
+workers = int(os.getenv('GUNICORN_WORKERS', min(max(2, multiprocessing.cpu_count()), workers_max)))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+
+# Les exports CSV en flux peuvent durer : on laisse du temps avant de tuer un worker
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Recyclage périodique des workers (fuites mémoire pandas/openpyxl à l'import Excel)
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+# Chaque worker importe l'application après le fork : un HUP recharge donc
+# aussi le code. GUNICORN_PRELOAD=1 charge l'application une seule fois dans le
+# master (démarrage plus rapide, mémoire partagée) mais HUP ne relit plus le code.
+# Dans les deux cas la Database n'est créée qu'après le fork (voir post_fork).
+preload_app = os.getenv('GUNICORN_PRELOAD', '0') == '1'
+
+accesslog = '-'
+# Format par défaut + identifiant de requête (X-Request-ID renvoyé) et durée en ms
+access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s" req=%({x-request-id}o)s %(M)sms'
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOGLEVEL', 'info')
+
+
+def on_starting(server):
+    # Repartir de métriques vides à chaque démarrage du master
+    dossier = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(dossier, ignore_errors=True)
+    os.makedirs(dossier, exist_ok=True)
+
+
+def post_fork(server, worker):
+    # Pool de connexions propre au worker, ouvert dès son démarrage
+    from app import db
+    db.initialiser()
+    server.log.info(f"✅ Worker {worker.pid} : pool PostgreSQL initialisé")
+
+
+def worker_exit(server, worker):
+    from app import db
+    db.fermer()
+
+
+def child_exit(server, worker):
+    # Les jauges "live" du worker arrêté ne comptent plus dans l'agrégat
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
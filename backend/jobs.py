@@ -0,0 +1,272 @@
+"""
+Tâches de fond : imports Excel, passage de classe et exports d'archives.
+
+Les routes /api/jobs/* enregistrent une tâche dans la table jobs et répondent
+tout de suite (202 + identifiant) ; le client suit ensuite la progression sur
+GET /api/jobs/<id>. Les tâches sont exécutées par un PoolJobs :
+
+    python jobs.py                 # processus dédié (service « jobs » du docker-compose)
+    JOBS_EN_PROCESSUS=1 python app.py   # ou dans le serveur de développement
+
+L'état est entièrement en base : un worker arrêté en cours de tâche cesse de
+mettre à jour heartbeat_le, et la tâche est remise en attente (ou passée en
+échec si elle ne peut pas être rejouée) par la maintenance d'un autre worker.
+Plusieurs processus peuvent tourner en parallèle (FOR UPDATE SKIP LOCKED).
+"""
+import io
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+
+from requetes_lentes import journal as journal_requetes_lentes
+
+# Identifiant de la requête HTTP qui a soumis la tâche, pour les commentaires SQL
+_contexte = threading.local()
+
+TACHES = {}
+
+# Taille visée des morceaux de fichier produit enregistrés en base (jobs_fichiers)
+TAILLE_MORCEAU = 1024 * 1024
+
+
+class EchecTache(Exception):
+    """Échec attendu d'une tâche (fichier invalide...) : pas de nouvelle tentative"""
+
+    def __init__(self, message, resultat=None):
+        super().__init__(message)
+        self.resultat = resultat
+
+
+def tache(nom, reessayable=True):
+    """
+    Enregistre une fonction de tâche : fonction(db, parametres, fichier, progression)
+    renvoyant le résultat (dict) ou (résultat, nom du fichier, morceaux du fichier
+    en octets). Les morceaux sont écrits en base au fil de leur génération, avant
+    l'enregistrement du résultat : un générateur peut encore compléter celui-ci.
+    reessayable=False : une tâche interrompue passe en échec au lieu d'être rejouée.
+    """
+    def decorateur(fonction):
+        fonction.reessayable = reessayable
+        TACHES[nom] = fonction
+        return fonction
+    return decorateur
+
+
+def request_id_courant():
+    return getattr(_contexte, 'request_id', None)
+
+
+@tache('import_utilisateurs')
+def import_utilisateurs(db, parametres, fichier, progression):
+    # Import transactionnel : rejouer une tentative interrompue est sans risque
+    progression(10, "Lecture du fichier Excel")
+    resultat = db.importer_utilisateurs_excel(io.BytesIO(fichier))
+    if not resultat.get('success'):
+        raise EchecTache(resultat.get('erreur', "Erreur lors de l'import"), resultat)
+    return resultat
+
+
+@tache('passage_classe', reessayable=False)
+def passage_classe(db, parametres, fichier, progression):
+    # Une seconde exécution ferait passer les Terminale de l'année suivante
+    progression(10, "Archivage des Terminale et passage des Première")
+    resultat = db.passage_premiere_terminale_avec_archivage()
+    if not resultat.get('success'):
+        raise EchecTache(resultat.get('error', 'Erreur lors du passage'), resultat)
+    return resultat
+
+
+@tache('export_archives')
+def export_archives(db, parametres, fichier, progression):
+    annee = parametres.get('annee')
+    total = db.get_archives(annee=annee, limit=1, total='estime').get('total') or 0
+    nom_fichier = f"archives_diplomes_{annee if annee else 'all'}.csv"
+    resultat = {'lignes': 0, 'nom_fichier': nom_fichier}
+
+    def morceaux():
+        # Regroupe les lots du curseur en morceaux d'environ TAILLE_MORCEAU
+        tampon = ['\ufeff']  # BOM UTF-8 pour Excel
+        taille = 0
+        for morceau in db.exporter_archives_csv_stream(annee=annee):
+            tampon.append(morceau)
+            taille += len(morceau)
+            resultat['lignes'] += morceau.count('\n')
+            if total:
+                progression(min(95, 100 * resultat['lignes'] // total),
+                            f"{resultat['lignes']} archives exportées")
+            if taille >= TAILLE_MORCEAU:
+                yield ''.join(tampon).encode('utf-8')
+                tampon, taille = [], 0
+        if tampon:
+            yield ''.join(tampon).encode('utf-8')
+
+    return resultat, nom_fichier, morceaux()
+
+
+class PoolJobs:
+    """
+    Workers (threads) qui réservent et exécutent les tâches en attente, plus un
+    thread de maintenance (heartbeat, reprise des tâches abandonnées, purge).
+    """
+
+    def __init__(self, db, nb_workers=2, intervalle=1.0, heartbeat=10, delai_abandon=60,
+                 max_tentatives=3, retention_jours=7, max_en_cours=None):
+        self.db = db
+        self.nb_workers = nb_workers
+        self.intervalle = intervalle
+        self.heartbeat = heartbeat
+        self.delai_abandon = delai_abandon
+        self.max_tentatives = max_tentatives
+        self.retention_jours = retention_jours
+        # Borne globale (tous processus) ; par défaut seul nb_workers limite
+        self.max_en_cours = max_en_cours
+        self.nom = f"{socket.gethostname()}:{os.getpid()}"
+        self._arret = threading.Event()
+        self._threads = []
+        self._en_cours = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def depuis_env(cls, db):
+        max_en_cours = os.getenv('JOBS_CONCURRENCE_MAX')
+        return cls(
+            db,
+            nb_workers=int(os.getenv('JOBS_WORKERS', 2)),
+            intervalle=float(os.getenv('JOBS_POLL_INTERVAL', 1)),
+            heartbeat=float(os.getenv('JOBS_HEARTBEAT', 10)),
+            delai_abandon=float(os.getenv('JOBS_STALE_AFTER', 60)),
+            max_tentatives=int(os.getenv('JOBS_MAX_TENTATIVES', 3)),
+            retention_jours=int(os.getenv('JOBS_RETENTION_JOURS', 7)),
+            max_en_cours=int(max_en_cours) if max_en_cours else None,
+        )
+
+    def demarrer(self):
+        self._arret.clear()
+        for i in range(self.nb_workers):
+            thread = threading.Thread(target=self._boucle_worker, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._boucle_maintenance, name="job-maintenance", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        print(f"⚙️ Pool de tâches démarré ({self.nb_workers} workers, {self.nom})")
+
+    def arreter(self, delai=30):
+        """Laisse les tâches en cours se terminer (au plus delai secondes)"""
+        self._arret.set()
+        fin = time.monotonic() + delai
+        for thread in self._threads:
+            thread.join(max(0, fin - time.monotonic()))
+        self._threads = []
+        print("⏹️ Pool de tâches arrêté")
+
+    def _boucle_worker(self):
+        while not self._arret.is_set():
+            try:
+                job = self.db.reserver_job(self.nom, self.max_en_cours)
+                if job:
+                    self._executer(job)
+            except Exception as e:
+                print(f"💥 Erreur worker tâches: {str(e)}")
+                job = None
+            finally:
+                # Connexion rendue au pool entre deux tâches
+                self.db.release_connection()
+            if not job:
+                self._arret.wait(self.intervalle)
+
+    def _executer(self, job):
+        fonction = TACHES.get(job['type'])
+        if fonction is None:
+            self.db.echouer_job(job['id'], f"Type de tâche inconnu: {job['type']}")
+            return
+
+        _contexte.request_id = job['request_id']
+        with self._lock:
+            self._en_cours.add(job['id'])
+        derniere_mise_a_jour = [float('-inf')]
+
+        def progression(pourcentage, message=None):
+            # Au plus une écriture par seconde
+            maintenant = time.monotonic()
+            if maintenant - derniere_mise_a_jour[0] < 1:
+                return
+            derniere_mise_a_jour[0] = maintenant
+            self.db.progression_job(job['id'], pourcentage, message)
+
+        print(f"▶️ Tâche {job['id']} ({job['type']}, tentative {job['tentatives']})")
+        debut = time.perf_counter()
+        try:
+            fichier = bytes(job['fichier_entree']) if job['fichier_entree'] is not None else None
+            resultat = fonction(self.db, job['parametres'] or {}, fichier, progression)
+            nom_fichier = morceaux = None
+            if isinstance(resultat, tuple):
+                resultat, nom_fichier, morceaux = resultat
+            if morceaux is not None:
+                self.db.ecrire_fichier_job(job['id'], morceaux)
+            self.db.terminer_job(job['id'], resultat, nom_fichier)
+            print(f"✅ Tâche {job['id']} terminée en {time.perf_counter() - debut:.1f}s")
+        except EchecTache as e:
+            print(f"❌ Tâche {job['id']} en échec: {str(e)}")
+            self.db.echouer_job(job['id'], str(e), e.resultat)
+        except Exception as e:
+            print(f"💥 Erreur tâche {job['id']}: {traceback.format_exc()}")
+            self.db.echouer_job(job['id'], str(e))
+        finally:
+            with self._lock:
+                self._en_cours.discard(job['id'])
+            _contexte.request_id = None
+
+    def _boucle_maintenance(self):
+        derniere_purge = 0.0
+        while not self._arret.wait(self.heartbeat):
+            try:
+                with self._lock:
+                    en_cours = list(self._en_cours)
+                self.db.battre_coeur_jobs(en_cours)
+
+                non_reessayables = [nom for nom, f in TACHES.items() if not f.reessayable]
+                for job in self.db.recuperer_jobs_abandonnes(self.delai_abandon, self.max_tentatives,
+                                                             non_reessayables):
+                    print(f"♻️ Tâche {job['id']} ({job['type']}) abandonnée -> {job['statut']}")
+
+                if time.monotonic() - derniere_purge > 3600:
+                    derniere_purge = time.monotonic()
+                    nb = self.db.purger_jobs(self.retention_jours)
+                    if nb:
+                        print(f"🗑️ {nb} tâches terminées purgées")
+            except Exception as e:
+                print(f"💥 Erreur maintenance tâches: {str(e)}")
+            finally:
+                self.db.release_connection()
+
+
+def main():
+    from models import DatabaseParProcessus
+
+    # Les instructions SQL d'une tâche portent l'identifiant de la requête qui l'a soumise
+    journal_requetes_lentes.fournisseur_request_id = request_id_courant
+    db = DatabaseParProcessus()
+    pool = PoolJobs.depuis_env(db)
+    # Un export tient la connexion du worker et celle de son curseur de lecture
+    connexions_requises = 2 * pool.nb_workers + 1
+    if int(os.getenv('DATABASE_POOL_MAX', 10)) < connexions_requises:
+        print(f"⚠️ DATABASE_POOL_MAX < {connexions_requises} : les exports simultanés "
+              f"attendront une connexion libre")
+
+    arret = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: arret.set())
+    signal.signal(signal.SIGINT, lambda *_: arret.set())
+
+    pool.demarrer()
+    while not arret.wait(1):
+        pass
+    pool.arreter()
+    db.fermer()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import decimal
+from datetime import date, datetime, time, timezone
+
+import orjson
+from flask.json.provider import JSONProvider
+
+JOURS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+MOIS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def _date_http(o):
+    """
+    Équivalent rapide de werkzeug.http.http_date (format RFC 822 de Flask,
+    ex. "Sat, 01 Jan 2005 00:00:00 GMT") : le frontend relit ce format tel quel
+    (badges, conversion vers <input type="date">).
+    """
+    if isinstance(o, datetime):
+        if o.tzinfo is not None:
+            o = o.astimezone(timezone.utc)
+        return (f"{JOURS[o.weekday()]}, {o.day:02d} {MOIS[o.month - 1]} {o.year:04d} "
+                f"{o.hour:02d}:{o.minute:02d}:{o.second:02d} GMT")
+    return f"{JOURS[o.weekday()]}, {o.day:02d} {MOIS[o.month - 1]} {o.year:04d} 00:00:00 GMT"
+
+
+def _default(o):
+    """Types non gérés nativement par orjson, rendus comme le faisait Flask"""
+    if isinstance(o, date):
+        return _date_http(o)
+    if isinstance(o, time):
+        return o.isoformat()
+    if isinstance(o, decimal.Decimal):
+        return str(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(JSONProvider):
+    """
+    Sérialisation JSON via orjson pour jsonify et les réponses de vues.
+
+    Les RealDictRow (sous-classes de dict) et listes de lignes sont écrites
+    directement, sans copie dict(...) préalable. Le rendu reste celui du
+    fournisseur par défaut de Flask : clés triées, dates RFC 822, Decimal en
+    chaîne.
+    """
+
+    mimetype = 'application/json'
+    option = (orjson.OPT_SORT_KEYS
+              | orjson.OPT_NON_STR_KEYS
+              | orjson.OPT_PASSTHROUGH_DATETIME)
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=self.option).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # Octets écrits tels quels dans la réponse, sans passer par une str
+        corps = orjson.dumps(obj, default=_default,
+                             option=self.option | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(corps, mimetype=self.mimetype)
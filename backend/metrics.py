@@ -0,0 +1,147 @@
+"""
+Métriques Prometheus du backend : latence par route, temps passé dans chaque
+méthode de Database, utilisation du pool et requêtes en cours.
+
+Sous gunicorn, chaque worker écrit ses valeurs dans PROMETHEUS_MULTIPROC_DIR
+(voir gunicorn.conf.py) et /metrics agrège tous les workers.
+"""
+import functools
+import inspect
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                               Counter, Gauge, Histogram, generate_latest, multiprocess)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUETES = Counter(
+    'bacprociel_http_requetes_total', 'Requêtes HTTP traitées',
+    ['route', 'methode', 'statut'])
+LATENCE = Histogram(
+    'bacprociel_http_latence_secondes', 'Durée de traitement des requêtes HTTP',
+    ['route', 'methode'], buckets=BUCKETS)
+EN_COURS = Gauge(
+    'bacprociel_http_requetes_en_cours', 'Requêtes HTTP en cours de traitement',
+    multiprocess_mode='livesum')
+
+DB_APPELS = Counter(
+    'bacprociel_db_appels_total', 'Appels aux méthodes de Database',
+    ['methode', 'resultat'])
+DB_DUREE = Histogram(
+    'bacprociel_db_duree_secondes', 'Durée des méthodes de Database',
+    ['methode'], buckets=BUCKETS)
+
+POOL_CONNEXIONS = Gauge(
+    'bacprociel_db_pool_connexions', 'Connexions du pool PostgreSQL par état',
+    ['etat'], multiprocess_mode='livesum')
+POOL_MAX = Gauge(
+    'bacprociel_db_pool_connexions_max', 'Taille maximale du pool PostgreSQL',
+    multiprocess_mode='livesum')
+POOL_TIMEOUTS = Gauge(
+    'bacprociel_db_pool_timeouts', "Emprunts de connexion abandonnés faute de place",
+    multiprocess_mode='livesum')
+POOL_ATTENTE = Gauge(
+    'bacprociel_db_pool_attente_moyenne_ms', "Attente moyenne pour emprunter une connexion",
+    multiprocess_mode='liveall')
+
+# Méthodes d'infrastructure appelées à chaque requête : sans intérêt pour l'analyse
+METHODES_IGNOREES = {'release_connection', 'get_pool_stats', 'fermer'}
+
+
+def _mesurer_methode(nom, methode):
+    if inspect.isgeneratorfunction(methode):
+        # Générateur (export en flux) : on mesure toute la consommation
+        @functools.wraps(methode)
+        def generateur(*args, **kwargs):
+            debut = time.perf_counter()
+            resultat = 'ok'
+            try:
+                yield from methode(*args, **kwargs)
+            except Exception:
+                resultat = 'erreur'
+                raise
+            finally:
+                DB_DUREE.labels(nom).observe(time.perf_counter() - debut)
+                DB_APPELS.labels(nom, resultat).inc()
+        return generateur
+
+    @functools.wraps(methode)
+    def wrapper(*args, **kwargs):
+        debut = time.perf_counter()
+        resultat = 'ok'
+        try:
+            return methode(*args, **kwargs)
+        except Exception:
+            resultat = 'erreur'
+            raise
+        finally:
+            DB_DUREE.labels(nom).observe(time.perf_counter() - debut)
+            DB_APPELS.labels(nom, resultat).inc()
+    return wrapper
+
+
+def instrumenter_database(classe):
+    """Enveloppe les méthodes publiques de la classe pour mesurer appels et durée"""
+    for nom, attribut in list(vars(classe).items()):
+        if nom.startswith('_') or nom in METHODES_IGNOREES or not inspect.isfunction(attribut):
+            continue
+        setattr(classe, nom, _mesurer_methode(nom, attribut))
+    return classe
+
+
+def _registre():
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registre = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registre)
+        return registre
+    return REGISTRY
+
+
+def instrumenter_app(app, stats_pool=None):
+    """
+    Mesure chaque requête (route, méthode, statut) et expose GET /metrics.
+    Args:
+        app: application Flask
+        stats_pool: fonction renvoyant les statistiques du pool (ConnectionPool.stats)
+    """
+
+    @app.before_request
+    def debut_mesure_requete():
+        g.debut_requete = time.perf_counter()
+        EN_COURS.inc()
+
+    @app.after_request
+    def fin_mesure_requete(response):
+        debut = g.get('debut_requete')
+        if debut is not None and request.endpoint != 'metrics':
+            # Gabarit de la route (ex. /api/utilisateurs/<int:user_id>) : cardinalité bornée
+            route = request.url_rule.rule if request.url_rule else 'inconnue'
+            # L'identifiant de requête n'est ni un label (cardinalité) ni un exemplar
+            # (non conservé en mode multiprocess) : il figure dans le log d'accès
+            LATENCE.labels(route, request.method).observe(time.perf_counter() - debut)
+            REQUETES.labels(route, request.method, response.status_code).inc()
+        return response
+
+    @app.teardown_request
+    def fin_requete_en_cours(exception=None):
+        if g.pop('debut_requete', None) is not None:
+            EN_COURS.dec()
+        if stats_pool is not None:
+            try:
+                stats = stats_pool()
+                POOL_CONNEXIONS.labels('en_cours').set(stats['en_cours'])
+                POOL_CONNEXIONS.labels('disponibles').set(stats['disponibles'])
+                POOL_MAX.set(stats['max'])
+                POOL_TIMEOUTS.set(stats['timeouts'])
+                POOL_ATTENTE.set(stats['attente_moyenne_ms'])
+            except Exception as e:
+                print(f"Erreur métriques pool: {str(e)}")
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Métriques au format texte Prometheus"""
+        return Response(generate_latest(_registre()), mimetype=CONTENT_TYPE_LATEST)
+
+    return app
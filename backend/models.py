@@ -1,44 +1,157 @@
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.errors
+from psycopg2.extras import RealDictCursor, execute_values, Json
 import pandas as pd
+import numpy as np
+import io
+import numbers
+import base64
+import json
 from datetime import datetime
 import os
+import threading
 import time
+from pool import ConnectionPool
+from requetes_lentes import ConnexionChronometree, journal as journal_requetes_lentes, prefixe_request_id
 
 class Database:
     def __init__(self):
-        max_retries = 5
-        retry_delay = 2
-        
-        for attempt in range(max_retries):
-            try:
-                self.connection = psycopg2.connect(
-                    host=os.getenv('DATABASE_HOST', 'database'),
-                    database=os.getenv('DATABASE_NAME', 'bacprociel'),
-                    user=os.getenv('DATABASE_USER', 'admin'),
-                    password=os.getenv('DATABASE_PASSWORD', 'password'),
-                    connect_timeout=10
-                )
-                print("✅ Connexion à la base de données réussie")
-                break
-            except Exception as e:
-                print(f"❌ Tentative {attempt + 1}/{max_retries} échouée: {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                else:
-                    raise e
+        # Pool borné : chaque thread/requête emprunte sa propre connexion
+        self.pool = ConnectionPool(
+            minconn=int(os.getenv('DATABASE_POOL_MIN', 1)),
+            maxconn=int(os.getenv('DATABASE_POOL_MAX', 10)),
+            timeout=float(os.getenv('DATABASE_POOL_TIMEOUT', 10)),
+            ping_after=float(os.getenv('DATABASE_POOL_PING_AFTER', 30)),
+            host=os.getenv('DATABASE_HOST', 'database'),
+            database=os.getenv('DATABASE_NAME', 'bacprociel'),
+            user=os.getenv('DATABASE_USER', 'admin'),
+            password=os.getenv('DATABASE_PASSWORD', 'password'),
+            connect_timeout=10,
+            # Nom visible dans pg_stat_activity (les instructions portent en plus
+            # l'identifiant de la requête HTTP, voir requetes_lentes.annoter_requete)
+            application_name=os.getenv('DATABASE_APPLICATION_NAME', 'bacprociel-backend'),
+            # Curseurs chronométrés pour le journal des requêtes lentes
+            connection_factory=ConnexionChronometree
+        )
+        self._local = threading.local()
+        # Les plans EXPLAIN sont capturés sur une connexion séparée de ce pool
+        journal_requetes_lentes.pool = self.pool
+
+        # Cache du référentiel (voir _get_referentiel)
+        self._referentiel = None
+        self._referentiel_version = 0
+        self._referentiel_lock = threading.Lock()
+        self._referentiel_ttl = float(os.getenv('REFERENTIEL_CACHE_TTL', 0))
+
+        print("✅ Connexion à la base de données réussie")
+
+    @property
+    def connection(self):
+        """Connexion empruntée au pool pour le thread courant (empruntée au premier accès)"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and connection.closed:
+            # Connexion cassée : rendue au pool, qui l'écarte et libère sa place
+            self._local.connection = None
+            self.pool.putconn(connection)
+            connection = None
+        if connection is None:
+            connection = self.pool.getconn()
+            self._local.connection = connection
+        return connection
+
+    def release_connection(self):
+        """Rend au pool la connexion du thread courant (appelé en fin de requête)"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            self._local.connection = None
+            self.pool.putconn(connection)
+
+    def get_pool_stats(self):
+        return self.pool.stats()
+
+    def fermer(self):
+        """Ferme toutes les connexions du pool (arrêt du processus)"""
+        self.pool.closeall()
+
+    def get_requetes_lentes(self):
+        """
+        Requêtes lentes récentes et plans EXPLAIN capturés (tampons circulaires
+        propres au worker courant, identifié par son pid)
+        """
+        etat = journal_requetes_lentes.etat()
+        etat['pid'] = os.getpid()
+        return etat
+
+    def vider_requetes_lentes(self):
+        """Vide le journal du worker courant (les autres workers gardent le leur)"""
+        journal_requetes_lentes.vider()
+
+    def publier_versions(self, tables):
+        """
+        Incrémente les compteurs de versions_tables des tables données, comme
+        une écriture : les autres workers voient le changement à leur prochaine
+        lecture des versions (ETag, référentiel)
+        """
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO versions_tables_a_publier (transaction_id, nom_table)
+                    SELECT txid_current(), unnest(%s::text[])
+                    ON CONFLICT DO NOTHING
+                """, (list(tables),))
+            self.connection.commit()
+            return True
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur publier_versions: {str(e)}")
+            self.connection.rollback()
+            return False
+
+    # Tables dont est tiré le référentiel en cache (voir _get_referentiel)
+    TABLES_REFERENTIEL = ('competences', 'items')
+
+    @staticmethod
+    def _lire_versions(cursor, tables):
+        # Somme des shards de chaque compteur (voir versions_tables dans init.sql)
+        cursor.execute("""
+            SELECT nom_table, SUM(version) as version FROM versions_tables
+            WHERE nom_table = ANY(%s) GROUP BY nom_table
+        """, (list(tables),))
+        return {row['nom_table']: int(row['version']) for row in cursor.fetchall()}
+
+    def get_versions_tables(self, tables):
+        """
+        Compteurs de version des tables (incrémentés à la validation de chaque écriture)
+        Returns:
+            dict: {nom_table: version}, ou None si les compteurs sont indisponibles
+        """
+        try:
+            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                versions = self._lire_versions(cursor, tables)
+            if len(versions) != len(set(tables)):
+                return None
+            # Les routes à ETag lisent les versions avant leurs données : un
+            # référentiel chargé avant la dernière modification est écarté ici
+            self._verifier_referentiel(versions)
+            return versions
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur get_versions_tables: {str(e)}")
+            self.connection.rollback()
+            return None
 
     # ===== MÉTHODES UTILISATEURS =====
     
     def get_utilisateurs(self):
         try:
             with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute("SELECT * FROM utilisateurs ORDER BY nom, prenom")
-                return cursor.fetchall()
+                return self._lire_utilisateurs(cursor)
         except Exception as e:
-            print(f"Erreur get_utilisateurs: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur get_utilisateurs: {str(e)}")
             return []
 
+    def _lire_utilisateurs(self, cursor):
+        cursor.execute("SELECT * FROM utilisateurs ORDER BY nom, prenom")
+        return cursor.fetchall()
+
     def ajouter_utilisateur(self, nom, prenom, email=None, classe=None, date_naissance=None, date_entree_bac=None, date_certification=None, specialite=None):
         try:
             with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
@@ -53,7 +166,7 @@ class Database:
                 self.connection.commit()
                 return cursor.fetchone()
         except Exception as e:
-            print(f"Erreur ajouter_utilisateur: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur ajouter_utilisateur: {str(e)}")
             self.connection.rollback()
             return None
 
@@ -67,7 +180,7 @@ class Database:
                 # Vérifier d'abord si l'utilisateur existe
                 cursor.execute("SELECT * FROM utilisateurs WHERE id = %s", (user_id,))
                 if not cursor.fetchone():
-                    print(f"❌ Utilisateur avec ID {user_id} non trouvé")
+                    print(f"{prefixe_request_id()}❌ Utilisateur avec ID {user_id} non trouvé")
                     return None
 
                 # Construire la requête dynamiquement en fonction des champs fournis
@@ -116,7 +229,7 @@ class Database:
                 return utilisateur_modifie
                 
         except Exception as e:
-            print(f"❌ Erreur modification utilisateur {user_id}: {str(e)}")
+            print(f"{prefixe_request_id()}❌ Erreur modification utilisateur {user_id}: {str(e)}")
             self.connection.rollback()
             return None
 
@@ -127,7 +240,7 @@ class Database:
                 # Vérifier d'abord si l'utilisateur existe
                 cursor.execute("SELECT id FROM utilisateurs WHERE id = %s", (utilisateur_id,))
                 if not cursor.fetchone():
-                    print(f"❌ Utilisateur {utilisateur_id} non trouvé")
+                    print(f"{prefixe_request_id()}❌ Utilisateur {utilisateur_id} non trouvé")
                     return False
 
                 cursor.execute("DELETE FROM utilisateurs WHERE id = %s", (utilisateur_id,))
@@ -137,17 +250,37 @@ class Database:
                 if success:
                     print(f"✅ Utilisateur {utilisateur_id} supprimé avec succès")
                 else:
-                    print(f"❌ Échec suppression utilisateur {utilisateur_id}")
+                    print(f"{prefixe_request_id()}❌ Échec suppression utilisateur {utilisateur_id}")
                 
                 return success
         except Exception as e:
-            print(f"❌ Erreur suppression utilisateur {utilisateur_id}: {str(e)}")
+            print(f"{prefixe_request_id()}❌ Erreur suppression utilisateur {utilisateur_id}: {str(e)}")
             self.connection.rollback()
             return False
 
+    # Alias acceptés pour chaque colonne du fichier d'import
+    COLONNES_IMPORT = {
+        'nom': ['nom', 'name', 'lastname'],
+        'prenom': ['prenom', 'prénom', 'firstname', 'prename'],
+        'email': ['email', 'mail', 'courriel'],
+        'classe': ['classe', 'class', 'niveau', 'level'],
+        'date_naissance': ['date_naissance', 'date naissance', 'birthdate', 'dn'],
+        'date_entree_bac': ['date_entree_bac', 'date entree bac', 'entree_bac', 'debut_bac', 'annee_entree'],
+        'date_certification': ['date_certification', 'date certification', 'certification', 'fin_bac', 'annee_certification'],
+        'specialite': ['specialite', 'spécialité', 'option', 'speciality'],
+    }
+
+    FORMATS_DATE = [
+        '%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d',
+        '%d/%m/%y', '%d-%m-%y', '%d %m %Y', '%d %b %Y'
+    ]
+
     def importer_utilisateurs_excel(self, fichier_excel):
         """
         Importe des utilisateurs depuis un fichier Excel
+
+        Le fichier est traité colonne par colonne (pandas) puis chargé en une
+        fois via COPY dans une table temporaire, fusionnée dans utilisateurs.
         """
         try:
             print(f"📁 Lecture du fichier: {fichier_excel}")
@@ -155,69 +288,75 @@ class Database:
             print(f"📊 Données lues: {len(df)} lignes")
         
             # Nettoyage des colonnes
-            df.columns = df.columns.str.strip().str.lower()
+            df.columns = df.columns.astype(str).str.strip().str.lower()
             print(f"📊 Colonnes détectées: {list(df.columns)}")
+
+            # Résolution des alias une seule fois pour tout le fichier
+            alias = {
+                champ: [nom for nom in noms_possibles if nom in df.columns]
+                for champ, noms_possibles in self.COLONNES_IMPORT.items()
+            }
         
             # Vérifier si les colonnes essentielles existent
             required_columns = ['nom', 'prenom']
-            missing_columns = [col for col in required_columns if col not in df.columns]
+            missing_columns = [col for col in required_columns if not alias[col]]
             if missing_columns:
                 return {
                     'erreur': f"Colonnes manquantes: {', '.join(missing_columns)}",
                     'colonnes_detectees': list(df.columns)
                 }
-        
-            utilisateurs_importes = []
-            erreurs = []
-            
+
+            lignes = pd.DataFrame(index=df.index)
+            for champ in ['nom', 'prenom', 'email', 'classe', 'specialite']:
+                lignes[champ] = self._colonne_texte(df, alias[champ])
+            lignes['date_naissance'] = self._colonne_date(self._colonne_brute(df, alias['date_naissance']))
+            lignes['date_entree_bac'] = self._colonne_annee(self._colonne_brute(df, alias['date_entree_bac']))
+            lignes['date_certification'] = self._colonne_annee(self._colonne_brute(df, alias['date_certification']))
+
+            erreurs = []  # (index, message) triés par ligne à la fin
+
+            manquants = lignes['nom'].isna() | lignes['prenom'].isna()
+            erreurs += [(index, f"Ligne {index + 2}: Nom et prénom sont obligatoires") for index in lignes.index[manquants]]
+            lignes = lignes[~manquants]
+
+            sans_classe = lignes['classe'].isna()
+            erreurs += [(index, f"Ligne {index + 2}: La classe est obligatoire") for index in lignes.index[sans_classe]]
+            lignes = lignes[~sans_classe]
+
+            lignes['nom'] = lignes['nom'].str.title()
+            lignes['prenom'] = lignes['prenom'].str.title()
+
+            # Email fourni (normalisé) ou généré à partir du prénom et du nom
+            email_genere = (
+                lignes['prenom'].str.lower().str.replace(' ', '.', regex=False) + '.' +
+                lignes['nom'].str.lower().str.replace(' ', '.', regex=False) + '@bacpro-ciel.fr'
+            )
+            lignes['email'] = lignes['email'].str.lower().fillna(email_genere)
+
             with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                for index, row in df.iterrows():
-                    try:
-                        nom = self._extraire_valeur(row, ['nom', 'name', 'lastname'])
-                        prenom = self._extraire_valeur(row, ['prenom', 'prénom', 'firstname', 'prename'])
-                        email = self._extraire_valeur(row, ['email', 'mail', 'courriel'])
-                        classe = self._extraire_valeur(row, ['classe', 'class', 'niveau', 'level'])
-                        date_naissance = self._extraire_date(row, ['date_naissance', 'date naissance', 'birthdate', 'dn'])
-                        date_entree_bac = self._extraire_annee(row, ['date_entree_bac', 'date entree bac', 'entree_bac', 'debut_bac', 'annee_entree'])
-                        date_certification = self._extraire_annee(row, ['date_certification', 'date certification', 'certification', 'fin_bac', 'annee_certification'])
-                        specialite = self._extraire_valeur(row, ['specialite', 'spécialité', 'option', 'speciality'])
-
-                        if not nom or not prenom:
-                            erreurs.append(f"Ligne {index + 2}: Nom et prénom sont obligatoires")
-                            continue
-                        
-                        nom = str(nom).strip().title()
-                        prenom = str(prenom).strip().title()
-                        
-                        if not email:
-                            base_email = f"{prenom.lower().replace(' ', '.')}.{nom.lower().replace(' ', '.')}"
-                            email = f"{base_email}@bacpro-ciel.fr"
-                        else:
-                            email = str(email).strip().lower()
-                        
-                        # Vérifier si l'email existe déjà
-                        cursor.execute("SELECT id FROM utilisateurs WHERE email = %s", (email,))
-                        if cursor.fetchone():
-                            erreurs.append(f"Ligne {index + 2}: L'email {email} existe déjà")
-                            continue
-                        
-                        print(f"✅ Insertion: {nom} {prenom} - {email} - {classe}")
-
-                        cursor.execute("""
-                            INSERT INTO utilisateurs (nom, prenom, email, classe, date_naissance, date_entree_bac, date_certification, specialite)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING id, nom, prenom, email, classe
-                        """, (nom, prenom, email, classe, date_naissance, date_entree_bac, date_certification, specialite))
-                        
-                        nouvel_utilisateur = cursor.fetchone()
-                        utilisateurs_importes.append(dict(nouvel_utilisateur))
-                        print(f"✅ Utilisateur importé: {prenom} {nom} ({email}) - Classe: {classe}")
-                        
-                    except Exception as e:
-                        erreur_msg = f"Ligne {index + 2}: {str(e)}"
-                        erreurs.append(erreur_msg)
-                        print(f"❌ {erreur_msg}")
-                        continue
-                
+                # Emails déjà en base, en une requête, et doublons internes au fichier
+                cursor.execute(
+                    "SELECT email FROM utilisateurs WHERE email = ANY(%s)",
+                    (lignes['email'].unique().tolist(),)
+                )
+                emails_existants = {row['email'] for row in cursor.fetchall()}
+
+                doublons = lignes['email'].isin(emails_existants) | lignes['email'].duplicated(keep='first')
+                erreurs += [
+                    (index, f"Ligne {index + 2}: L'email {email} existe déjà")
+                    for index, email in lignes.loc[doublons, 'email'].items()
+                ]
+                lignes = lignes[~doublons]
+
+                utilisateurs_importes = self._charger_utilisateurs(cursor, lignes)
+
+                # Une ligne acceptée mais absente du résultat a été insérée entre-temps par un autre import
+                emails_importes = {u['email'] for u in utilisateurs_importes}
+                erreurs += [
+                    (index, f"Ligne {index + 2}: L'email {email} existe déjà")
+                    for index, email in lignes['email'].items() if email not in emails_importes
+                ]
+
                 self.connection.commit()
                 print(f"🎉 Import terminé: {len(utilisateurs_importes)} utilisateurs importés")
                 
@@ -225,14 +364,14 @@ class Database:
                 'success': True,
                 'utilisateurs_importes': utilisateurs_importes,
                 'total_importes': len(utilisateurs_importes),
-                'erreurs': erreurs,
+                'erreurs': [message for _, message in sorted(erreurs, key=lambda e: e[0])],
                 'total_lignes': len(df)
             }
             
         except Exception as e:
             self.connection.rollback()
             error_msg = f"Erreur lors de la lecture du fichier: {str(e)}"
-            print(f"❌ {error_msg}")
+            print(f"{prefixe_request_id()}❌ {error_msg}")
             import traceback
             traceback.print_exc()
             return {
@@ -241,128 +380,220 @@ class Database:
                 'traceback': traceback.format_exc()
             }
 
-    def _extraire_valeur(self, row, noms_possibles):
-        for nom in noms_possibles:
-            if nom in row and pd.notna(row[nom]):
-                value = row[nom]
-                if pd.isna(value) or value == '':
-                    return None
-                return str(value).strip()
-        return None
-
-    def _extraire_date(self, row, noms_possibles):
-        for nom in noms_possibles:
-            if nom in row and pd.notna(row[nom]):
-                try:
-                    date_val = row[nom]
-                    if pd.isna(date_val) or date_val == '':
-                        return None
-                    if isinstance(date_val, (datetime, pd.Timestamp)):
-                        return date_val.date() if hasattr(date_val, 'date') else date_val
-                    if isinstance(date_val, str):
-                        date_val = date_val.strip()
-                        if not date_val:
-                            return None
-                        formats = [
-                            '%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d',
-                            '%d/%m/%y', '%d-%m-%y', '%d %m %Y', '%d %b %Y'
-                        ]
-                        for fmt in formats:
-                            try:
-                                return datetime.strptime(date_val, fmt).date()
-                            except ValueError:
-                                continue
-                    print(f"⚠️ Format de date non reconnu: {date_val} (type: {type(date_val)})")
-                    return None
-                except Exception as e:
-                    print(f"❌ Erreur conversion date '{date_val}': {e}")
-                    return None
-        return None
-
-    def _extraire_annee(self, row, noms_possibles):
-        """Extrait une année depuis différentes colonnes possibles"""
-        for nom in noms_possibles:
-            if nom in row and pd.notna(row[nom]):
-                try:
-                    annee_val = row[nom]
-                    if pd.isna(annee_val) or annee_val == '':
-                        return None
-                    
-                    # Si c'est déjà un nombre
-                    if isinstance(annee_val, (int, float)):
-                        return int(annee_val)
-                    
-                    # Si c'est une chaîne de caractères
-                    if isinstance(annee_val, str):
-                        annee_val = annee_val.strip()
-                        if not annee_val:
-                            return None
-                        # Essayer de convertir directement en entier
-                        try:
-                            return int(annee_val)
-                        except ValueError:
-                            # Essayer d'extraire l'année d'une date
-                            try:
-                                date_obj = datetime.strptime(annee_val, '%Y-%m-%d')
-                                return date_obj.year
-                            except ValueError:
-                                pass
-                    
-                    print(f"⚠️ Format d'année non reconnu: {annee_val} (type: {type(annee_val)})")
-                    return None
-                except Exception as e:
-                    print(f"❌ Erreur conversion année '{annee_val}': {e}")
-                    return None
-        return None
+    def _charger_utilisateurs(self, cursor, lignes):
+        """Charge les lignes validées via COPY dans une table temporaire puis les fusionne"""
+        if lignes.empty:
+            return []
+
+        colonnes = ['ligne', 'nom', 'prenom', 'email', 'classe', 'date_naissance',
+                    'date_entree_bac', 'date_certification', 'specialite']
+
+        cursor.execute("""
+            CREATE TEMP TABLE import_utilisateurs (
+                ligne INTEGER,
+                nom VARCHAR(100),
+                prenom VARCHAR(100),
+                email VARCHAR(255),
+                classe VARCHAR(50),
+                date_naissance DATE,
+                date_entree_bac INTEGER,
+                date_certification INTEGER,
+                specialite VARCHAR(100)
+            ) ON COMMIT DROP
+        """)
+
+        buffer = io.StringIO()
+        lignes.assign(ligne=lignes.index)[colonnes].to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+        cursor.copy_expert(
+            f"COPY import_utilisateurs ({', '.join(colonnes)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+
+        cursor.execute("""
+            INSERT INTO utilisateurs (nom, prenom, email, classe, date_naissance, date_entree_bac, date_certification, specialite)
+            SELECT nom, prenom, email, classe, date_naissance, date_entree_bac, date_certification, specialite
+            FROM import_utilisateurs
+            ORDER BY ligne
+            ON CONFLICT (email) DO NOTHING
+            RETURNING id, nom, prenom, email, classe
+        """)
+        return [dict(row) for row in cursor.fetchall()]
+
+    def _colonne_brute(self, df, noms):
+        """Première valeur non vide parmi les colonnes alias, ligne par ligne"""
+        serie = pd.Series(None, index=df.index, dtype=object)
+        for nom in noms:
+            colonne = df[nom].astype(object)
+            colonne = colonne.mask(colonne.map(lambda v: isinstance(v, str) and not v.strip()))
+            serie = serie.combine_first(colonne)
+        return serie.astype(object)
+
+    def _colonne_texte(self, df, noms):
+        serie = self._colonne_brute(df, noms)
+        texte = serie.astype(str).str.strip()
+        return texte.where(serie.notna() & (texte != ''))
+
+    def _colonne_date(self, serie):
+        """Convertit une colonne en dates : valeurs datetime natives puis chaque format texte connu"""
+        est_texte = serie.map(lambda v: isinstance(v, str))
+        est_date = serie.map(lambda v: isinstance(v, datetime))
+        dates = pd.to_datetime(serie.where(est_date), errors='coerce')
+
+        textes = serie.where(est_texte).str.strip()
+        for fmt in self.FORMATS_DATE:
+            restantes = dates.isna() & textes.notna()
+            if not restantes.any():
+                break
+            dates = dates.fillna(pd.to_datetime(textes.where(restantes), format=fmt, errors='coerce'))
+
+        non_reconnues = dates.isna() & serie.notna()
+        if non_reconnues.any():
+            print(f"⚠️ Format de date non reconnu: {serie[non_reconnues].tolist()}")
+        return dates.dt.date.astype(object).where(dates.notna(), None)
+
+    def _colonne_annee(self, serie):
+        """Extrait une année : nombre, texte numérique ou date AAAA-MM-JJ"""
+        est_nombre = serie.map(lambda v: isinstance(v, numbers.Number) and not isinstance(v, bool))
+        est_texte = serie.map(lambda v: isinstance(v, str))
+        annees = pd.to_numeric(serie.where(est_nombre | est_texte), errors='coerce')
+        restantes = annees.isna() & est_texte
+        if restantes.any():
+            textes = serie.where(restantes).str.strip()
+            annees = annees.fillna(pd.to_datetime(textes, format='%Y-%m-%d', errors='coerce').dt.year)
+
+        non_reconnues = annees.isna() & serie.notna()
+        if non_reconnues.any():
+            print(f"⚠️ Format d'année non reconnu: {serie[non_reconnues].tolist()}")
+        return annees.apply(np.trunc).astype('Int64')
 
     def get_utilisateur_par_id(self, user_id):
         """Récupère un utilisateur spécifique par son ID"""
         try:
             with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute("SELECT * FROM utilisateurs WHERE id = %s", (user_id,))
-                return cursor.fetchone()
+                return self._lire_utilisateur(cursor, user_id)
         except Exception as e:
-            print(f"Erreur get_utilisateur_par_id: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur get_utilisateur_par_id: {str(e)}")
             return None
 
+    def _lire_utilisateur(self, cursor, user_id):
+        cursor.execute("SELECT * FROM utilisateurs WHERE id = %s", (user_id,))
+        return cursor.fetchone()
+
     # ===== MÉTHODES RÉFÉRENTIEL =====
+
+    # Le référentiel BAC PRO CIEL (compétences + items) ne change quasiment jamais :
+    # il est gardé en mémoire avec les versions de competences/items lues à son
+    # chargement, et rechargé dès qu'une lecture de versions_tables en voit de plus
+    # récentes (routes à ETag, bundle), après invalider_referentiel(), ou après
+    # REFERENTIEL_CACHE_TTL secondes si la variable est définie.
+
+    def _get_referentiel(self):
+        referentiel = self._referentiel
+        ttl = self._referentiel_ttl
+        if referentiel is not None and (not ttl or time.monotonic() - referentiel['charge_le'] < ttl):
+            return referentiel
+
+        with self._referentiel_lock:
+            # Un autre thread a pu recharger pendant l'attente du verrou
+            referentiel = self._referentiel
+            if referentiel is not None and (not ttl or time.monotonic() - referentiel['charge_le'] < ttl):
+                return referentiel
+
+            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                # Versions lues avant les données : une écriture concurrente
+                # donnera au pire un rechargement de plus
+                versions = self._lire_versions(cursor, self.TABLES_REFERENTIEL)
+                cursor.execute("SELECT * FROM competences ORDER BY code")
+                competences = cursor.fetchall()
+                cursor.execute("""
+                    SELECT i.*, c.code as competence_code, c.libelle as competence_libelle
+                    FROM items i
+                    JOIN competences c ON i.competence_id = c.id
+                    ORDER BY c.code, i.code_item
+                """)
+                items = cursor.fetchall()
+
+            items_par_competence = {}
+            for item in items:
+                items_par_competence.setdefault(item['competence_id'], []).append(item)
+
+            self._referentiel_version += 1
+            self._referentiel = {
+                'version': self._referentiel_version,
+                'versions_tables': versions,
+                'charge_le': time.monotonic(),
+                'competences': competences,
+                'items': items,
+                'items_par_id': {item['id']: item for item in items},
+                'items_par_competence': items_par_competence,
+            }
+            print(f"📚 Référentiel chargé en cache (version {self._referentiel_version}): "
+                  f"{len(competences)} compétences, {len(items)} items")
+            return self._referentiel
+
+    def _verifier_referentiel(self, versions):
+        """Écarte le référentiel en cache si versions montre une modification postérieure à son chargement"""
+        referentiel = self._referentiel
+        if referentiel is None:
+            return
+        charge = referentiel['versions_tables']
+        if any(nom in versions and versions[nom] > charge.get(nom, 0) for nom in self.TABLES_REFERENTIEL):
+            with self._referentiel_lock:
+                if self._referentiel is referentiel:
+                    self._referentiel = None
+            print("🔄 Référentiel modifié en base : cache rechargé au prochain accès")
+
+    def invalider_referentiel(self):
+        """
+        Vide le cache du référentiel : le prochain accès relit la base. Les
+        versions de competences/items sont incrémentées pour que les autres
+        workers rechargent aussi le leur (voir _verifier_referentiel)
+        """
+        with self._referentiel_lock:
+            self._referentiel = None
+        print("🔄 Cache du référentiel invalidé")
+        return self.publier_versions(self.TABLES_REFERENTIEL)
+
+    @staticmethod
+    def _copies(lignes):
+        # Les lignes du cache sont partagées par tous les threads : l'appelant
+        # reçoit des copies qu'il peut modifier sans altérer le cache
+        return [dict(ligne) for ligne in lignes]
+
+    def get_referentiel_version(self):
+        """Version du référentiel en cache (0 si pas encore chargé)"""
+        referentiel = self._referentiel
+        return referentiel['version'] if referentiel else 0
+
+    def get_item(self, item_id):
+        """Item du référentiel par son id (None s'il n'existe pas), sans requête"""
+        try:
+            item = self._get_referentiel()['items_par_id'].get(item_id)
+            return dict(item) if item is not None else None
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur get_item: {str(e)}")
+            return None
     
     def get_competences(self):
         try:
-            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute("SELECT * FROM competences ORDER BY code")
-                return cursor.fetchall()
+            return self._copies(self._get_referentiel()['competences'])
         except Exception as e:
-            print(f"Erreur get_competences: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur get_competences: {str(e)}")
             return []
 
     def get_items_par_competence(self, competence_id):
         try:
-            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute("""
-                    SELECT i.*, c.code as competence_code, c.libelle as competence_libelle
-                    FROM items i
-                    JOIN competences c ON i.competence_id = c.id
-                    WHERE i.competence_id = %s
-                    ORDER BY i.code_item
-                """, (competence_id,))
-                return cursor.fetchall()
+            return self._copies(self._get_referentiel()['items_par_competence'].get(competence_id, []))
         except Exception as e:
-            print(f"Erreur get_items_par_competence: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur get_items_par_competence: {str(e)}")
             return []
 
     def get_all_items(self):
         try:
-            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute("""
-                    SELECT i.*, c.code as competence_code, c.libelle as competence_libelle
-                    FROM items i
-                    JOIN competences c ON i.competence_id = c.id
-                    ORDER BY c.code, i.code_item
-                """)
-                return cursor.fetchall()
+            return self._copies(self._get_referentiel()['items'])
         except Exception as e:
-            print(f"Erreur get_all_items: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur get_all_items: {str(e)}")
             return []
 
     # ===== MÉTHODES ÉVALUATIONS =====
@@ -378,16 +609,16 @@ class Database:
                 evaluation = cursor.fetchone()
                 evaluation_id = evaluation['id']
                 
-                for item_id in items_ids:
-                    cursor.execute("""
-                        INSERT INTO evaluation_items (evaluation_id, item_id)
-                        VALUES (%s, %s)
-                    """, (evaluation_id, item_id))
+                # Une seule instruction : la synthèse par compétence est recalculée une fois
+                cursor.execute("""
+                    INSERT INTO evaluation_items (evaluation_id, item_id)
+                    SELECT %s, unnest(%s::integer[])
+                """, (evaluation_id, list(items_ids)))
                 
                 self.connection.commit()
                 return evaluation
         except Exception as e:
-            print(f"Erreur creer_evaluation: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur creer_evaluation: {str(e)}")
             self.connection.rollback()
             return None
 
@@ -403,30 +634,82 @@ class Database:
                 """)
                 return cursor.fetchall()
         except Exception as e:
-            print(f"Erreur get_evaluations: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur get_evaluations: {str(e)}")
             return []
 
     def get_evaluation_detail(self, evaluation_id):
         try:
             with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute("SELECT * FROM evaluations WHERE id = %s", (evaluation_id,))
-                evaluation = cursor.fetchone()
-                
-                cursor.execute("""
-                    SELECT i.*, c.code as competence_code, c.libelle as competence_libelle
-                    FROM items i
-                    JOIN evaluation_items ei ON i.id = ei.item_id
-                    JOIN competences c ON i.competence_id = c.id
-                    WHERE ei.evaluation_id = %s
-                    ORDER BY c.code, i.code_item
-                """, (evaluation_id,))
-                items = cursor.fetchall()
-                
-                return evaluation, items
+                return self._lire_evaluation_detail(cursor, evaluation_id)
         except Exception as e:
-            print(f"Erreur get_evaluation_detail: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur get_evaluation_detail: {str(e)}")
             return None, []
 
+    def _lire_evaluation_detail(self, cursor, evaluation_id):
+        cursor.execute("SELECT * FROM evaluations WHERE id = %s", (evaluation_id,))
+        evaluation = cursor.fetchone()
+        
+        cursor.execute("""
+            SELECT i.*, c.code as competence_code, c.libelle as competence_libelle
+            FROM items i
+            JOIN evaluation_items ei ON i.id = ei.item_id
+            JOIN competences c ON i.competence_id = c.id
+            WHERE ei.evaluation_id = %s
+            ORDER BY c.code, i.code_item
+        """, (evaluation_id,))
+        items = cursor.fetchall()
+        
+        return evaluation, items
+
+    def get_evaluation_bundle(self, evaluation_id, inclure_referentiel=False):
+        """
+        Toutes les données de l'écran détail d'une évaluation en un seul appel
+        Args:
+            evaluation_id: ID de l'évaluation
+            inclure_referentiel: Ajouter compétences et items (servis par le cache)
+        Returns:
+            dict: evaluation, items, attributions, utilisateurs_concernes,
+                  tous_utilisateurs, validations (+ competences, tous_items)
+                  ou None si l'évaluation n'existe pas
+
+        Les lectures se font dans une seule transaction REPEATABLE READ READ ONLY :
+        toutes les listes viennent du même instantané de la base.
+        """
+        with self.pool.connection() as connection:
+            try:
+                with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+
+                    evaluation, items = self._lire_evaluation_detail(cursor, evaluation_id)
+                    if not evaluation:
+                        return None
+
+                    bundle = {
+                        'evaluation': evaluation,
+                        'items': items,
+                        'attributions': self._lire_attributions_evaluation(cursor, evaluation_id),
+                        'utilisateurs_concernes': self._lire_utilisateurs_concernes(cursor, evaluation_id),
+                        'tous_utilisateurs': self._lire_utilisateurs(cursor),
+                        'validations': self._lire_validations_evaluation(cursor, evaluation_id),
+                    }
+                    if inclure_referentiel:
+                        versions_referentiel = self._lire_versions(cursor, self.TABLES_REFERENTIEL)
+            except Exception as e:
+                print(f"{prefixe_request_id()}Erreur get_evaluation_bundle: {str(e)}")
+                raise
+            finally:
+                # Transaction en lecture seule : rien à valider
+                connection.rollback()
+
+        if inclure_referentiel:
+            self._verifier_referentiel(versions_referentiel)
+            referentiel = self._get_referentiel()
+            bundle['competences'] = self._copies(referentiel['competences'])
+            bundle['tous_items'] = self._copies(referentiel['items'])
+            bundle['referentiel_version'] = referentiel['version']
+
+        return bundle
+
     def supprimer_evaluation(self, evaluation_id):
         try:
             with self.connection.cursor() as cursor:
@@ -434,7 +717,7 @@ class Database:
                 self.connection.commit()
                 return cursor.rowcount > 0
         except Exception as e:
-            print(f"Erreur supprimer_evaluation: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur supprimer_evaluation: {str(e)}")
             self.connection.rollback()
             return False
 
@@ -486,7 +769,7 @@ class Database:
                 return {'success': True, 'attribution': attribution}
                 
         except Exception as e:
-            print(f"Erreur attribuer_evaluation: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur attribuer_evaluation: {str(e)}")
             self.connection.rollback()
             return {'success': False, 'error': str(e)}
 
@@ -506,7 +789,7 @@ class Database:
                     return {'success': False, 'error': 'Attribution non trouvée'}
                     
         except Exception as e:
-            print(f"Erreur retirer_attribution: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur retirer_attribution: {str(e)}")
             self.connection.rollback()
             return {'success': False, 'error': str(e)}
 
@@ -516,20 +799,23 @@ class Database:
         """
         try:
             with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute("""
-                    SELECT ea.*, u.nom, u.prenom, u.classe as user_classe
-                    FROM evaluation_attributions ea
-                    LEFT JOIN utilisateurs u ON ea.utilisateur_id = u.id
-                    WHERE ea.evaluation_id = %s
-                    ORDER BY 
-                        CASE WHEN ea.classe IS NOT NULL THEN 1 ELSE 2 END,
-                        ea.classe, u.nom, u.prenom
-                """, (evaluation_id,))
-                return cursor.fetchall()
+                return self._lire_attributions_evaluation(cursor, evaluation_id)
         except Exception as e:
-            print(f"Erreur get_attributions_evaluation: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur get_attributions_evaluation: {str(e)}")
             return []
 
+    def _lire_attributions_evaluation(self, cursor, evaluation_id):
+        cursor.execute("""
+            SELECT ea.*, u.nom, u.prenom, u.classe as user_classe
+            FROM evaluation_attributions ea
+            LEFT JOIN utilisateurs u ON ea.utilisateur_id = u.id
+            WHERE ea.evaluation_id = %s
+            ORDER BY 
+                CASE WHEN ea.classe IS NOT NULL THEN 1 ELSE 2 END,
+                ea.classe, u.nom, u.prenom
+        """, (evaluation_id,))
+        return cursor.fetchall()
+
     def get_utilisateurs_concernes_par_evaluation(self, evaluation_id):
         """
         Récupère tous les utilisateurs concernés par une évaluation
@@ -537,28 +823,31 @@ class Database:
         """
         try:
             with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute("""
-                    -- Utilisateurs via attribution directe
-                    SELECT DISTINCT u.*
-                    FROM utilisateurs u
-                    JOIN evaluation_attributions ea ON u.id = ea.utilisateur_id
-                    WHERE ea.evaluation_id = %s
-                    
-                    UNION
-                    
-                    -- Utilisateurs via attribution par classe
-                    SELECT DISTINCT u.*
-                    FROM utilisateurs u
-                    JOIN evaluation_attributions ea ON u.classe = ea.classe
-                    WHERE ea.evaluation_id = %s AND ea.classe IS NOT NULL
-                    
-                    ORDER BY nom, prenom
-                """, (evaluation_id, evaluation_id))
-                return cursor.fetchall()
+                return self._lire_utilisateurs_concernes(cursor, evaluation_id)
         except Exception as e:
-            print(f"Erreur get_utilisateurs_concernes_par_evaluation: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur get_utilisateurs_concernes_par_evaluation: {str(e)}")
             return []
 
+    def _lire_utilisateurs_concernes(self, cursor, evaluation_id):
+        cursor.execute("""
+            -- Utilisateurs via attribution directe
+            SELECT DISTINCT u.*
+            FROM utilisateurs u
+            JOIN evaluation_attributions ea ON u.id = ea.utilisateur_id
+            WHERE ea.evaluation_id = %s
+            
+            UNION
+            
+            -- Utilisateurs via attribution par classe
+            SELECT DISTINCT u.*
+            FROM utilisateurs u
+            JOIN evaluation_attributions ea ON u.classe = ea.classe
+            WHERE ea.evaluation_id = %s AND ea.classe IS NOT NULL
+            
+            ORDER BY nom, prenom
+        """, (evaluation_id, evaluation_id))
+        return cursor.fetchall()
+
     def modifier_evaluation(self, evaluation_id, module=None, contexte=None):
         """
         Modifie les informations d'une évaluation
@@ -591,7 +880,7 @@ class Database:
                     return {'success': False, 'error': 'Évaluation non trouvée'}
                     
         except Exception as e:
-            print(f"Erreur modifier_evaluation: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur modifier_evaluation: {str(e)}")
             self.connection.rollback()
             return {'success': False, 'error': str(e)}
             
@@ -614,55 +903,193 @@ class Database:
                 self.connection.commit()
                 return cursor.fetchone()
         except Exception as e:
-            print(f"Erreur mettre_a_jour_validation: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur mettre_a_jour_validation: {str(e)}")
             self.connection.rollback()
             return None
 
+    def valider_multiple(self, utilisateur_id, evaluation_id, validations, validateur):
+        """
+        Enregistre un lot de validations en une seule transaction
+        Args:
+            validations: liste de dicts {item_id, niveau_validation, commentaire}
+        Returns:
+            dict {created, updated, errors} (mêmes messages d'erreur que le traitement item par item)
+        """
+        details = {'created': 0, 'updated': 0, 'errors': []}
+
+        # Identifiants d'items entiers (bool exclu) des éléments du lot qui sont des
+        # objets ; les autres éléments sont signalés un par un dans la boucle
+        identifiants = {
+            v.get('item_id') for v in validations
+            if isinstance(v, dict) and isinstance(v.get('item_id'), int) and not isinstance(v.get('item_id'), bool)
+        }
+
+        # Items existants : lookup O(1) dans le référentiel en cache, sans requête
+        items_par_id = self._get_referentiel()['items_par_id']
+        if any(item_id not in items_par_id for item_id in identifiants):
+            # Item inconnu du cache : peut-être ajouté depuis son chargement
+            self.get_versions_tables(self.TABLES_REFERENTIEL)
+            items_par_id = self._get_referentiel()['items_par_id']
+        items_existants = {item_id for item_id in identifiants if item_id in items_par_id}
+
+        try:
+            with self.connection.cursor() as cursor:
+                # Validations déjà présentes pour cet élève et cette évaluation
+                cursor.execute("""
+                    SELECT item_id FROM validations
+                    WHERE utilisateur_id = %s AND evaluation_id = %s AND item_id = ANY(%s)
+                """, (utilisateur_id, evaluation_id, list(items_existants)))
+                deja_valides = {row[0] for row in cursor.fetchall()}
+        except Exception as e:
+            self.connection.rollback()
+            raise e
+
+        lignes = {}  # item_id -> ligne à insérer (la dernière occurrence l'emporte)
+        for i, validation_data in enumerate(validations):
+            if not isinstance(validation_data, dict):
+                details['errors'].append(f'Validation {i+1} invalide : objet attendu')
+                continue
+
+            item_id = validation_data.get('item_id')
+            niveau_validation = validation_data.get('niveau_validation')
+            commentaire = (validation_data.get('commentaire') or '').strip()
+
+            if item_id is None:
+                details['errors'].append(f'item_id manquant pour la validation {i+1}')
+                continue
+
+            if niveau_validation is None:
+                details['errors'].append(f'niveau_validation manquant pour item {item_id}')
+                continue
+
+            if item_id not in items_existants:
+                details['errors'].append(f'Item {item_id} non trouvé')
+                continue
+
+            if niveau_validation not in [0, 1, 2, 3, 4]:
+                details['errors'].append(f'Niveau invalide {niveau_validation} pour item {item_id}')
+                continue
+
+            # Un item déjà vu dans ce lot est une mise à jour, comme en traitement séquentiel
+            if item_id in deja_valides or item_id in lignes:
+                details['updated'] += 1
+            else:
+                details['created'] += 1
+
+            lignes[item_id] = (utilisateur_id, evaluation_id, item_id, niveau_validation, commentaire, validateur)
+
+        if not lignes:
+            return details
+
+        # Upsert de tout le lot en un seul INSERT multi-lignes
+        try:
+            with self.connection.cursor() as cursor:
+                execute_values(cursor, """
+                    INSERT INTO validations (utilisateur_id, evaluation_id, item_id, niveau_validation, commentaire, validateur)
+                    VALUES %s
+                    ON CONFLICT (utilisateur_id, evaluation_id, item_id)
+                    DO UPDATE SET niveau_validation = EXCLUDED.niveau_validation,
+                                 commentaire = EXCLUDED.commentaire,
+                                 validateur = EXCLUDED.validateur,
+                                 date_validation = CURRENT_TIMESTAMP
+                """, list(lignes.values()), page_size=len(lignes))
+            self.connection.commit()
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur valider_multiple: {str(e)}")
+            self.connection.rollback()
+            details['created'] = 0
+            details['updated'] = 0
+            details['errors'].extend(
+                f"Échec opération base de données pour item {item_id}" for item_id in lignes
+            )
+
+        return details
+
     def get_validations_utilisateur(self, utilisateur_id, evaluation_id=None):
         try:
             with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                query = """
-                    SELECT v.*, i.code_item, i.sous_item, i.description as item_description,
-                           c.code as competence_code, c.libelle as competence_libelle,
-                           e.module as evaluation_module, e.contexte as evaluation_contexte
-                    FROM validations v
-                    JOIN items i ON v.item_id = i.id
-                    JOIN competences c ON i.competence_id = c.id
-                    JOIN evaluations e ON v.evaluation_id = e.id
-                    WHERE v.utilisateur_id = %s
-                """
-                params = [utilisateur_id]
-                
-                if evaluation_id:
-                    query += " AND v.evaluation_id = %s"
-                    params.append(evaluation_id)
-                
-                query += " ORDER BY e.date_creation DESC, c.code, i.code_item"
-                cursor.execute(query, params)
-                return cursor.fetchall()
+                return self._lire_validations_utilisateur(cursor, utilisateur_id, evaluation_id)
         except Exception as e:
-            print(f"Erreur get_validations_utilisateur: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur get_validations_utilisateur: {str(e)}")
             return []
 
+    def _lire_validations_utilisateur(self, cursor, utilisateur_id, evaluation_id=None):
+        query = """
+            SELECT v.*, i.code_item, i.sous_item, i.description as item_description,
+                   c.code as competence_code, c.libelle as competence_libelle,
+                   e.module as evaluation_module, e.contexte as evaluation_contexte
+            FROM validations v
+            JOIN items i ON v.item_id = i.id
+            JOIN competences c ON i.competence_id = c.id
+            JOIN evaluations e ON v.evaluation_id = e.id
+            WHERE v.utilisateur_id = %s
+        """
+        params = [utilisateur_id]
+        
+        if evaluation_id:
+            query += " AND v.evaluation_id = %s"
+            params.append(evaluation_id)
+        
+        query += " ORDER BY e.date_creation DESC, c.code, i.code_item"
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+    def get_fiche_validation(self, utilisateur_id, evaluation_id):
+        """
+        Fiche de notation d'un élève pour une évaluation
+        Returns:
+            dict: utilisateur, evaluation, items, validations de l'élève pour
+                  cette évaluation, ou None si l'élève ou l'évaluation n'existe pas
+
+        Lit uniquement l'élève concerné (et non toute la liste des utilisateurs),
+        dans un même instantané comme get_evaluation_bundle.
+        """
+        with self.pool.connection() as connection:
+            try:
+                with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+
+                    utilisateur = self._lire_utilisateur(cursor, utilisateur_id)
+                    if not utilisateur:
+                        return None
+                    evaluation, items = self._lire_evaluation_detail(cursor, evaluation_id)
+                    if not evaluation:
+                        return None
+
+                    return {
+                        'utilisateur': utilisateur,
+                        'evaluation': evaluation,
+                        'items': items,
+                        'validations': self._lire_validations_utilisateur(cursor, utilisateur_id, evaluation_id),
+                    }
+            except Exception as e:
+                print(f"{prefixe_request_id()}Erreur get_fiche_validation: {str(e)}")
+                raise
+            finally:
+                connection.rollback()
+
     def get_validations_par_evaluation(self, evaluation_id):
         try:
             with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute("""
-                    SELECT v.*, u.nom, u.prenom, u.classe,
-                           i.code_item, i.description as item_description,
-                           c.code as competence_code
-                    FROM validations v
-                    JOIN utilisateurs u ON v.utilisateur_id = u.id
-                    JOIN items i ON v.item_id = i.id
-                    JOIN competences c ON i.competence_id = c.id
-                    WHERE v.evaluation_id = %s
-                    ORDER BY u.nom, u.prenom, c.code, i.code_item
-                """, (evaluation_id,))
-                return cursor.fetchall()
+                return self._lire_validations_evaluation(cursor, evaluation_id)
         except Exception as e:
-            print(f"Erreur get_validations_par_evaluation: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur get_validations_par_evaluation: {str(e)}")
             return []
 
+    def _lire_validations_evaluation(self, cursor, evaluation_id):
+        cursor.execute("""
+            SELECT v.*, u.nom, u.prenom, u.classe,
+                   i.code_item, i.description as item_description,
+                   c.code as competence_code
+            FROM validations v
+            JOIN utilisateurs u ON v.utilisateur_id = u.id
+            JOIN items i ON v.item_id = i.id
+            JOIN competences c ON i.competence_id = c.id
+            WHERE v.evaluation_id = %s
+            ORDER BY u.nom, u.prenom, c.code, i.code_item
+        """, (evaluation_id,))
+        return cursor.fetchall()
+
 # Dans votre classe Database, ajoutez ces méthodes :
 
     def ajouter_items_evaluation(self, evaluation_id, items_ids):
@@ -734,24 +1161,21 @@ class Database:
                 deleted_count = cursor.rowcount
                 print(f"✅ {deleted_count} anciennes associations supprimées")
                 
-                # 2. Ajouter les nouvelles associations
-                inserted_count = 0
-                for item_id in items_ids:
-                    try:
-                        cursor.execute(
-                            "INSERT INTO evaluation_items (evaluation_id, item_id) VALUES (%s, %s)",
-                            (evaluation_id, item_id)
-                        )
-                        inserted_count += 1
-                    except Exception as e:
-                        print(f"  ❌ Erreur insertion item {item_id}: {e}")
+                # 2. Ajouter les nouvelles associations, en une instruction
+                #    (items inexistants et doublons ignorés)
+                cursor.execute("""
+                    INSERT INTO evaluation_items (evaluation_id, item_id)
+                    SELECT %s, i.id FROM items i WHERE i.id = ANY(%s)
+                    ON CONFLICT (evaluation_id, item_id) DO NOTHING
+                """, (evaluation_id, list(items_ids)))
+                inserted_count = cursor.rowcount
                 
                 self.connection.commit()
                 print(f"✅ Évaluation {evaluation_id} mise à jour: {inserted_count}/{len(items_ids)} items insérés")
                 return inserted_count > 0  # Retourne True si au moins un item a été inséré
             
         except Exception as e:
-            print(f"❌ Erreur PostgreSQL mise à jour items: {e}")
+            print(f"{prefixe_request_id()}❌ Erreur PostgreSQL mise à jour items: {e}")
             self.connection.rollback()
             return False
 
@@ -768,7 +1192,7 @@ class Database:
                 print(f"✅ {deleted_count} validation(s) supprimée(s) pour évaluation {evaluation_id}, item {item_id}")
                 return True
         except Exception as e:
-            print(f"❌ Erreur suppression validations: {e}")
+            print(f"{prefixe_request_id()}❌ Erreur suppression validations: {e}")
             self.connection.rollback()
             return False           
 
@@ -788,78 +1212,32 @@ class Database:
                 if not user:
                     return None
                 
-                # 2. Récupérer les statistiques par compétence
+                # 2. Récupérer les statistiques par compétence : une ligne pré-agrégée par
+                #    compétence (competence_summary) + la synthèse des évaluations par classe
                 cursor.execute("""
                     SELECT 
                         c.id as competence_id,
                         c.code as competence_code,
                         c.libelle as competence_libelle,
-                        COUNT(v.id) as nb_validations,
-                        COALESCE(SUM(v.niveau_validation), 0) as total_niveaux,
-                        COALESCE(ROUND(AVG(v.niveau_validation)::numeric, 2), 0) as niveau_moyen,
-                        -- Calcul du nombre d'évaluations en Première pour cette compétence
-                        (
-                            SELECT COUNT(DISTINCT e.id)
-                            FROM evaluations e
-                            JOIN evaluation_items ei ON e.id = ei.evaluation_id
-                            JOIN items i2 ON ei.item_id = i2.id
-                            JOIN evaluation_attributions ea ON e.id = ea.evaluation_id
-                            WHERE i2.competence_id = c.id
-                            AND ea.classe = 'Première'
-                        ) as nb_eval_premiere,
-                        -- Calcul du nombre d'évaluations en Terminale pour cette compétence
-                        (
-                            SELECT COUNT(DISTINCT e.id)
-                            FROM evaluations e
-                            JOIN evaluation_items ei ON e.id = ei.evaluation_id
-                            JOIN items i2 ON ei.item_id = i2.id
-                            JOIN evaluation_attributions ea ON e.id = ea.evaluation_id
-                            WHERE i2.competence_id = c.id
-                            AND ea.classe = 'Terminale'
-                        ) as nb_eval_terminale
-
+                        COALESCE(cs.nb_validations, 0) as nb_validations,
+                        COALESCE(cs.total_niveaux, 0) as total_niveaux,
+                        COALESCE(ROUND(cs.total_niveaux::numeric / NULLIF(cs.nb_niveaux, 0), 2), 0) as niveau_moyen,
+                        COALESCE(sp.nb_evaluations, 0) as nb_eval_premiere,
+                        COALESCE(st.nb_evaluations, 0) as nb_eval_terminale
                     FROM competences c
-                    LEFT JOIN items i ON i.competence_id = c.id
-                    LEFT JOIN validations v ON v.item_id = i.id AND v.utilisateur_id = %s
-                    GROUP BY c.id, c.code, c.libelle
+                    LEFT JOIN competence_summary cs
+                        ON cs.competence_id = c.id AND cs.utilisateur_id = %s
+                    LEFT JOIN competence_evaluations_stats sp
+                        ON sp.competence_id = c.id AND sp.classe = 'Première'
+                    LEFT JOIN competence_evaluations_stats st
+                        ON st.competence_id = c.id AND st.classe = 'Terminale'
                     ORDER BY c.code
                 """, (user_id,))
                 
                 competences = cursor.fetchall()
                 
                 # 3. Calculer le statut pour chaque compétence
-                competences_list = []
-                for comp in competences:
-                    total = comp['total_niveaux']
-                    nb_validations = comp['nb_validations']
-                    niveau_moyen = float(comp['niveau_moyen'])
-                    
-                    # Calcul du statut
-                    if nb_validations == 0:
-                        statut = "Non évalué"
-                        statut_class = "status-not-evaluated"
-                    elif total >= 12 and niveau_moyen >= 3:
-                        statut = "Maîtrisé"
-                        statut_class = "status-mastered"
-                    elif total >= 8 and niveau_moyen >= 2:
-                        statut = "En cours"
-                        statut_class = "status-in-progress"
-                    else:
-                        statut = "À travailler"
-                        statut_class = "status-to-work"
-                    
-                    competences_list.append({
-                        'competence_id': comp['competence_id'],
-                        'competence_code': comp['competence_code'],
-                        'competence_libelle': comp['competence_libelle'],
-                        'nb_eval_premiere': comp['nb_eval_premiere'],
-                        'nb_eval_terminale': comp['nb_eval_terminale'],
-                        'total_niveaux': int(comp['total_niveaux']),
-                        'nb_validations': comp['nb_validations'],
-                        'niveau_moyen': niveau_moyen,
-                        'statut': statut,
-                        'statut_class': statut_class
-                    })
+                competences_list = [self._competence_profil(comp) for comp in competences]
                 
                 return {
                     'user': dict(user),
@@ -867,9 +1245,132 @@ class Database:
                 }
                 
         except Exception as e:
-            print(f"Erreur get_user_profile: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur get_user_profile: {str(e)}")
             return None 
 
+    def _competence_profil(self, comp):
+        """Construit l'entrée d'une compétence du profil (totaux, moyenne et statut)"""
+        total = comp['total_niveaux']
+        nb_validations = comp['nb_validations']
+        niveau_moyen = float(comp['niveau_moyen'])
+        
+        # Calcul du statut
+        if nb_validations == 0:
+            statut = "Non évalué"
+            statut_class = "status-not-evaluated"
+        elif total >= 12 and niveau_moyen >= 3:
+            statut = "Maîtrisé"
+            statut_class = "status-mastered"
+        elif total >= 8 and niveau_moyen >= 2:
+            statut = "En cours"
+            statut_class = "status-in-progress"
+        else:
+            statut = "À travailler"
+            statut_class = "status-to-work"
+        
+        return {
+            'competence_id': comp['competence_id'],
+            'competence_code': comp['competence_code'],
+            'competence_libelle': comp['competence_libelle'],
+            'nb_eval_premiere': comp['nb_eval_premiere'],
+            'nb_eval_terminale': comp['nb_eval_terminale'],
+            'total_niveaux': int(comp['total_niveaux']),
+            'nb_validations': comp['nb_validations'],
+            'niveau_moyen': niveau_moyen,
+            'statut': statut,
+            'statut_class': statut_class
+        }
+
+    def get_profils_classe(self, classe):
+        """
+        Récupère le profil de tous les élèves d'une classe en un seul passage groupé
+        Returns:
+            liste de {'user', 'competences'} (même structure que get_user_profile)
+        """
+        try:
+            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                # 1. Les élèves de la classe
+                cursor.execute("""
+                    SELECT id, nom, prenom, email, classe, specialite, 
+                        date_naissance, date_entree_bac, date_certification
+                    FROM utilisateurs 
+                    WHERE classe = %s
+                    ORDER BY nom, prenom, id
+                """, (classe,))
+                users = cursor.fetchall()
+                
+                if not users:
+                    return []
+                
+                # 2. Statistiques élève x compétence, lues dans la synthèse pré-agrégée
+                cursor.execute("""
+                    SELECT 
+                        u.id as utilisateur_id,
+                        c.id as competence_id,
+                        c.code as competence_code,
+                        c.libelle as competence_libelle,
+                        COALESCE(cs.nb_validations, 0) as nb_validations,
+                        COALESCE(cs.total_niveaux, 0) as total_niveaux,
+                        COALESCE(ROUND(cs.total_niveaux::numeric / NULLIF(cs.nb_niveaux, 0), 2), 0) as niveau_moyen,
+                        COALESCE(sp.nb_evaluations, 0) as nb_eval_premiere,
+                        COALESCE(st.nb_evaluations, 0) as nb_eval_terminale
+                    FROM utilisateurs u
+                    CROSS JOIN competences c
+                    LEFT JOIN competence_summary cs
+                        ON cs.utilisateur_id = u.id AND cs.competence_id = c.id
+                    LEFT JOIN competence_evaluations_stats sp
+                        ON sp.competence_id = c.id AND sp.classe = 'Première'
+                    LEFT JOIN competence_evaluations_stats st
+                        ON st.competence_id = c.id AND st.classe = 'Terminale'
+                    WHERE u.classe = %s
+                    ORDER BY u.id, c.code
+                """, (classe,))
+                
+                competences_par_user = {}
+                for comp in cursor.fetchall():
+                    competences_par_user.setdefault(comp['utilisateur_id'], []).append(self._competence_profil(comp))
+                
+                return [
+                    {
+                        'user': dict(user),
+                        'competences': competences_par_user.get(user['id'], [])
+                    }
+                    for user in users
+                ]
+                
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur get_profils_classe: {str(e)}")
+            return None
+
+    def reconstruire_competence_summary(self, utilisateur_id=None):
+        """
+        Reconstruit la synthèse competence_summary depuis les validations brutes
+        Args:
+            utilisateur_id: limiter la reconstruction à un élève (optionnel)
+        Returns:
+            int: nombre de lignes de synthèse écrites (None en cas d'erreur)
+        """
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("SELECT reconstruire_competence_summary(%s)", (utilisateur_id,))
+                nb_lignes = cursor.fetchone()[0]
+                self.connection.commit()
+                return nb_lignes
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur reconstruire_competence_summary: {str(e)}")
+            self.connection.rollback()
+            return None
+
+    def verifier_competence_summary(self):
+        """Compare la synthèse aux validations brutes et retourne les écarts (liste vide si cohérent)"""
+        try:
+            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute("SELECT * FROM verifier_competence_summary()")
+                return cursor.fetchall()
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur verifier_competence_summary: {str(e)}")
+            return None
+
     # À ajouter dans votre classe Database (models.py)
 
 # ===== MÉTHODES PASSAGE DE CLASSE ET ARCHIVAGE =====
@@ -881,7 +1382,7 @@ class Database:
                 cursor.execute("SELECT * FROM v_preview_passage_terminale ORDER BY classe_actuelle")
                 return cursor.fetchall()
         except Exception as e:
-            print(f"Erreur get_preview_passage_terminale: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur get_preview_passage_terminale: {str(e)}")
             return []
 
     def passage_premiere_terminale_avec_archivage(self):
@@ -909,63 +1410,127 @@ class Database:
                     }
                     
         except Exception as e:
-            print(f"Erreur passage_premiere_terminale_avec_archivage: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur passage_premiere_terminale_avec_archivage: {str(e)}")
             self.connection.rollback()
             return {
                 'success': False,
                 'error': str(e)
             }
 
-    def get_archives(self, annee=None, limit=100, offset=0):
+    def get_archives(self, annee=None, limit=100, offset=0, curseur=None, total='estime'):
         """
         Récupère la liste des élèves archivés
         Args:
             annee: Filtrer par année de diplôme (optionnel)
             limit: Nombre max de résultats
-            offset: Décalage pour pagination
+            offset: Décalage pour pagination (ancien mode, ignoré si curseur est fourni)
+            curseur: Jeton opaque 'next_cursor' de la page précédente (pagination par clé)
+            total: 'exact' (COUNT(*)), 'estime' (statistiques) ou 'aucun'
+        Raises:
+            ValueError: si le curseur est invalide
+
+        L'ordre (date_archivage DESC, nom, prenom, id) est total : la page suivante
+        reprend juste après la dernière ligne, sans parcourir les pages précédentes.
         """
+        cle = self._decoder_curseur_archives(curseur) if curseur else None
+
         try:
             with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                conditions = []
+                params = []
                 if annee:
-                    cursor.execute("""
-                        SELECT * FROM utilisateurs_archives
-                        WHERE annee_diplome = %s
-                        ORDER BY date_archivage DESC, nom, prenom
-                        LIMIT %s OFFSET %s
-                    """, (annee, limit, offset))
-                    
-                    cursor.execute("""
-                        SELECT COUNT(*) as total FROM utilisateurs_archives
-                        WHERE annee_diplome = %s
-                    """, (annee,))
-                else:
-                    cursor.execute("""
-                        SELECT * FROM utilisateurs_archives
-                        ORDER BY date_archivage DESC, nom, prenom
-                        LIMIT %s OFFSET %s
-                    """, (limit, offset))
-                    
-                    cursor.execute("SELECT COUNT(*) as total FROM utilisateurs_archives")
-                
+                    conditions.append("annee_diplome = %s")
+                    params.append(annee)
+                if cle:
+                    # La borne redondante (<=) donne à l'index une borne de parcours :
+                    # la page suivante est lue à partir de la clé, sans filtrer ni trier ce qui précède
+                    conditions.append("""COALESCE(date_archivage, '-infinity') <= %s AND (
+                        COALESCE(date_archivage, '-infinity') < %s
+                        OR (COALESCE(date_archivage, '-infinity') = %s AND (nom, prenom, id) > (%s, %s, %s))
+                    )""")
+                    params.extend([cle[0], cle[0], cle[0], cle[1], cle[2], cle[3]])
+
+                query = "SELECT * FROM utilisateurs_archives"
+                if conditions:
+                    query += " WHERE " + " AND ".join(conditions)
+                query += " ORDER BY COALESCE(date_archivage, '-infinity') DESC, nom, prenom, id LIMIT %s"
+                # Une ligne de plus que la page : sa présence seule signale une page suivante
+                params.append(limit + 1)
+                if not cle and offset:
+                    query += " OFFSET %s"
+                    params.append(offset)
+
+                cursor.execute(query, params)
                 archives = cursor.fetchall()
-                total = cursor.fetchone()['total']
-                
+
+                next_cursor = None
+                if len(archives) > limit:
+                    archives = archives[:limit]
+                    next_cursor = self._encoder_curseur_archives(archives[-1])
+
                 return {
                     'archives': archives,
-                    'total': total,
+                    'total': self._compter_archives(cursor, annee, total),
+                    'total_type': total,
                     'limit': limit,
-                    'offset': offset
+                    'offset': 0 if cle else offset,
+                    'next_cursor': next_cursor
                 }
                 
         except Exception as e:
-            print(f"Erreur get_archives: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur get_archives: {str(e)}")
             return {
                 'archives': [],
                 'total': 0,
+                'total_type': total,
                 'limit': limit,
-                'offset': offset
+                'offset': offset,
+                'next_cursor': None
             }
 
+    def _compter_archives(self, cursor, annee, mode):
+        """Total des archives selon le mode demandé ('exact', 'estime' ou 'aucun')"""
+        if mode == 'aucun':
+            return None
+
+        if mode == 'exact':
+            if annee:
+                cursor.execute("SELECT COUNT(*) as total FROM utilisateurs_archives WHERE annee_diplome = %s", (annee,))
+            else:
+                cursor.execute("SELECT COUNT(*) as total FROM utilisateurs_archives")
+            return cursor.fetchone()['total']
+
+        # Estimation : rollup par promotion pour une année, statistiques du planificateur sinon
+        if annee:
+            cursor.execute("SELECT nb_diplomes FROM v_stats_archives WHERE annee_diplome = %s", (annee,))
+            row = cursor.fetchone()
+            return row['nb_diplomes'] if row else 0
+
+        cursor.execute("""
+            SELECT reltuples::bigint as estimation FROM pg_class
+            WHERE oid = 'utilisateurs_archives'::regclass
+        """)
+        estimation = cursor.fetchone()['estimation']
+        if estimation is None or estimation < 0:
+            # Table jamais analysée : on se rabat sur le rollup
+            cursor.execute("SELECT COALESCE(SUM(nb_diplomes), 0)::bigint as total FROM v_stats_archives")
+            return cursor.fetchone()['total']
+        return estimation
+
+    def _encoder_curseur_archives(self, archive):
+        date_archivage = archive['date_archivage'].isoformat() if archive['date_archivage'] else '-infinity'
+        cle = [date_archivage, archive['nom'], archive['prenom'], archive['id']]
+        return base64.urlsafe_b64encode(json.dumps(cle).encode('utf-8')).decode('ascii')
+
+    def _decoder_curseur_archives(self, curseur):
+        try:
+            date_archivage, nom, prenom, archive_id = json.loads(base64.urlsafe_b64decode(curseur.encode('ascii')))
+            if date_archivage != '-infinity':
+                datetime.fromisoformat(date_archivage)
+            return date_archivage, str(nom), str(prenom), int(archive_id)
+        except Exception:
+            raise ValueError("Curseur de pagination invalide")
+
     def get_stats_archives(self):
         """Récupère les statistiques des archives par promotion"""
         try:
@@ -973,7 +1538,7 @@ class Database:
                 cursor.execute("SELECT * FROM v_stats_archives")
                 return cursor.fetchall()
         except Exception as e:
-            print(f"Erreur get_stats_archives: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur get_stats_archives: {str(e)}")
             return []
 
     def rechercher_archive(self, recherche):
@@ -987,7 +1552,26 @@ class Database:
                 cursor.execute("SELECT * FROM rechercher_archive(%s)", (recherche,))
                 return cursor.fetchall()
         except Exception as e:
-            print(f"Erreur rechercher_archive: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur rechercher_archive: {str(e)}")
+            return []
+
+    def rechercher_eleves(self, recherche, limite=20, inclure_archives=True):
+        """
+        Recherche unifiée (sans accents, classée) parmi les élèves actifs et archivés
+        Args:
+            recherche: Terme de recherche (nom, prénom ou email)
+            limite: Nombre max de résultats
+            inclure_archives: Inclure les élèves archivés
+        """
+        try:
+            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(
+                    "SELECT * FROM rechercher_eleves(%s, %s, %s)",
+                    (recherche, limite, inclure_archives)
+                )
+                return cursor.fetchall()
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur rechercher_eleves: {str(e)}")
             return []
 
     def get_archive_detail(self, archive_id):
@@ -1038,7 +1622,7 @@ class Database:
                 }
                 
         except Exception as e:
-            print(f"Erreur get_archive_detail: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur get_archive_detail: {str(e)}")
             return None
 
     def restaurer_eleve_archive(self, archive_id):
@@ -1059,7 +1643,7 @@ class Database:
                 }
                 
         except Exception as e:
-            print(f"Erreur restaurer_eleve_archive: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur restaurer_eleve_archive: {str(e)}")
             self.connection.rollback()
             return {
                 'success': False,
@@ -1104,9 +1688,49 @@ class Database:
                 }
                 
         except Exception as e:
-            print(f"Erreur get_historique_eleve: {str(e)}")
+            print(f"{prefixe_request_id()}Erreur get_historique_eleve: {str(e)}")
             return None
 
+    EN_TETE_CSV_ARCHIVES = 'Nom;Prénom;Email;Classe;Spécialité;Année diplôme;Nb validations;Nb évaluations;Moyenne validation;Date archivage'
+
+    def _requete_export_archives(self, annee=None):
+        """Requête (SQL, paramètres) commune aux exports CSV des archives"""
+        query = """
+            SELECT 
+                ua.nom, ua.prenom, ua.email, ua.classe_origine,
+                ua.specialite, ua.annee_diplome, ua.nb_validations,
+                ua.date_archivage,
+                COUNT(DISTINCT v.evaluation_id) as nb_evaluations,
+                ROUND(AVG(v.niveau_validation)::numeric, 2) as moyenne_validation
+            FROM utilisateurs_archives ua
+            LEFT JOIN validations v ON ua.utilisateur_id = v.utilisateur_id
+        """
+        if annee:
+            return query + """
+            WHERE ua.annee_diplome = %s
+            GROUP BY ua.id
+            ORDER BY ua.nom, ua.prenom
+            """, (annee,)
+        return query + """
+            GROUP BY ua.id
+            ORDER BY ua.annee_diplome DESC, ua.nom, ua.prenom
+        """, ()
+
+    def _ligne_csv_archive(self, archive):
+        date_archivage = archive['date_archivage'].strftime('%d/%m/%Y') if archive['date_archivage'] else ''
+        return ';'.join([
+            str(archive['nom'] or ''),
+            str(archive['prenom'] or ''),
+            str(archive['email'] or ''),
+            str(archive['classe_origine'] or ''),
+            str(archive['specialite'] or ''),
+            str(archive['annee_diplome'] or ''),
+            str(archive['nb_validations'] or '0'),
+            str(archive['nb_evaluations'] or '0'),
+            str(archive['moyenne_validation'] or '0'),
+            date_archivage
+        ])
+
     def exporter_archives_csv(self, annee=None):
         """
         Génère un CSV des archives
@@ -1117,59 +1741,401 @@ class Database:
         """
         try:
             with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                if annee:
-                    cursor.execute("""
-                        SELECT 
-                            ua.nom, ua.prenom, ua.email, ua.classe_origine,
-                            ua.specialite, ua.annee_diplome, ua.nb_validations,
-                            ua.date_archivage,
-                            COUNT(DISTINCT v.evaluation_id) as nb_evaluations,
-                            ROUND(AVG(v.niveau_validation)::numeric, 2) as moyenne_validation
-                        FROM utilisateurs_archives ua
-                        LEFT JOIN validations v ON ua.utilisateur_id = v.utilisateur_id
-                        WHERE ua.annee_diplome = %s
-                        GROUP BY ua.id
-                        ORDER BY ua.nom, ua.prenom
-                    """, (annee,))
-                else:
-                    cursor.execute("""
-                        SELECT 
-                            ua.nom, ua.prenom, ua.email, ua.classe_origine,
-                            ua.specialite, ua.annee_diplome, ua.nb_validations,
-                            ua.date_archivage,
-                            COUNT(DISTINCT v.evaluation_id) as nb_evaluations,
-                            ROUND(AVG(v.niveau_validation)::numeric, 2) as moyenne_validation
-                        FROM utilisateurs_archives ua
-                        LEFT JOIN validations v ON ua.utilisateur_id = v.utilisateur_id
-                        GROUP BY ua.id
-                        ORDER BY ua.annee_diplome DESC, ua.nom, ua.prenom
-                    """)
-                
+                cursor.execute(*self._requete_export_archives(annee))
                 archives = cursor.fetchall()
                 
                 # Générer le CSV
-                csv_lines = [
-                    'Nom;Prénom;Email;Classe;Spécialité;Année diplôme;Nb validations;Nb évaluations;Moyenne validation;Date archivage'
-                ]
-                
-                for archive in archives:
-                    date_archivage = archive['date_archivage'].strftime('%d/%m/%Y') if archive['date_archivage'] else ''
-                    line = ';'.join([
-                        str(archive['nom'] or ''),
-                        str(archive['prenom'] or ''),
-                        str(archive['email'] or ''),
-                        str(archive['classe_origine'] or ''),
-                        str(archive['specialite'] or ''),
-                        str(archive['annee_diplome'] or ''),
-                        str(archive['nb_validations'] or '0'),
-                        str(archive['nb_evaluations'] or '0'),
-                        str(archive['moyenne_validation'] or '0'),
-                        date_archivage
-                    ])
-                    csv_lines.append(line)
+                csv_lines = [self.EN_TETE_CSV_ARCHIVES]
+                csv_lines.extend(self._ligne_csv_archive(archive) for archive in archives)
                 
                 return '\n'.join(csv_lines)
                 
         except Exception as e:
-            print(f"Erreur exporter_archives_csv: {str(e)}")
-            return None                   
\ No newline at end of file
+            print(f"{prefixe_request_id()}Erreur exporter_archives_csv: {str(e)}")
+            return None
+
+    def exporter_archives_csv_stream(self, annee=None, batch_size=500):
+        """
+        Génère le CSV des archives par morceaux, sans charger toutes les lignes
+        Args:
+            annee: Filtrer par année (optionnel)
+            batch_size: Nombre de lignes lues par aller-retour (curseur serveur)
+        Yields:
+            str: morceaux de CSV (même contenu que exporter_archives_csv)
+
+        Le générateur emprunte sa propre connexion au pool : il est consommé
+        après la fin de la requête Flask, quand la connexion du thread est rendue.
+        """
+        connection = self.pool.getconn()
+        try:
+            # Curseur nommé = curseur côté serveur, lu par lots de batch_size lignes
+            with connection.cursor(name='export_archives', cursor_factory=RealDictCursor) as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(*self._requete_export_archives(annee))
+
+                yield self.EN_TETE_CSV_ARCHIVES
+                while True:
+                    archives = cursor.fetchmany(batch_size)
+                    if not archives:
+                        break
+                    yield ''.join('\n' + self._ligne_csv_archive(archive) for archive in archives)
+            connection.commit()
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur exporter_archives_csv_stream: {str(e)}")
+            connection.rollback()
+            raise
+        finally:
+            self.pool.putconn(connection)
+
+    # ===== MÉTHODES TÂCHES DE FOND (voir jobs.py) =====
+
+    # Colonnes renvoyées aux clients : jamais le contenu des fichiers
+    COLONNES_JOB = """
+        id, type, statut, parametres, progression, message, resultat, erreur,
+        nom_fichier_resultat, nom_fichier_resultat IS NOT NULL as a_fichier_resultat,
+        tentatives, worker, request_id, cree_le, demarre_le, heartbeat_le, termine_le
+    """
+
+    @staticmethod
+    def _json_job(valeur):
+        # Résultats de méthodes (dates, Decimal...) stockés en JSONB
+        return Json(valeur, dumps=lambda o: json.dumps(o, default=str, ensure_ascii=False))
+
+    def creer_job(self, type_job, parametres=None, fichier_entree=None, request_id=None):
+        """
+        Enregistre une tâche en attente
+        Returns:
+            dict: la tâche créée (sans les fichiers), None en cas d'erreur
+        Raises:
+            psycopg2.errors.UniqueViolation: tâche unique déjà en attente ou en cours
+                (voir idx_jobs_passage_classe_actif)
+        """
+        try:
+            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(f"""
+                    INSERT INTO jobs (type, parametres, fichier_entree, request_id)
+                    VALUES (%s, %s, %s, %s)
+                    RETURNING {self.COLONNES_JOB}
+                """, (type_job, self._json_job(parametres or {}),
+                      psycopg2.Binary(fichier_entree) if fichier_entree is not None else None,
+                      request_id))
+                job = cursor.fetchone()
+                self.connection.commit()
+                return job
+        except psycopg2.errors.UniqueViolation:
+            self.connection.rollback()
+            raise
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur creer_job: {str(e)}")
+            self.connection.rollback()
+            return None
+
+    def get_job(self, job_id):
+        try:
+            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(f"SELECT {self.COLONNES_JOB} FROM jobs WHERE id = %s", (job_id,))
+                return cursor.fetchone()
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur get_job: {str(e)}")
+            return None
+
+    def get_jobs(self, statut=None, type_job=None, limit=50):
+        """Tâches les plus récentes, filtrées par statut et/ou type"""
+        try:
+            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                conditions = []
+                params = []
+                if statut:
+                    conditions.append("statut = %s")
+                    params.append(statut)
+                if type_job:
+                    conditions.append("type = %s")
+                    params.append(type_job)
+                query = f"SELECT {self.COLONNES_JOB} FROM jobs"
+                if conditions:
+                    query += " WHERE " + " AND ".join(conditions)
+                query += " ORDER BY id DESC LIMIT %s"
+                params.append(limit)
+                cursor.execute(query, params)
+                return cursor.fetchall()
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur get_jobs: {str(e)}")
+            return []
+
+    def get_job_actif(self, type_job):
+        """Tâche de ce type en attente ou en cours (la plus ancienne), sinon None"""
+        try:
+            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(f"""
+                    SELECT {self.COLONNES_JOB} FROM jobs
+                    WHERE type = %s AND statut IN ('en_attente', 'en_cours')
+                    ORDER BY id LIMIT 1
+                """, (type_job,))
+                return cursor.fetchone()
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur get_job_actif: {str(e)}")
+            return None
+
+    def compter_jobs_en_attente(self):
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM jobs WHERE statut = 'en_attente'")
+                return cursor.fetchone()[0]
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur compter_jobs_en_attente: {str(e)}")
+            return 0
+
+    def ecrire_fichier_job(self, job_id, morceaux):
+        """
+        Enregistre le fichier produit par une tâche au fil de sa génération
+        Args:
+            morceaux: itérable d'octets, chaque morceau validé aussitôt écrit
+        Returns:
+            int: taille du fichier en octets
+        """
+        try:
+            with self.connection.cursor() as cursor:
+                # Morceaux d'une tentative précédente interrompue
+                cursor.execute("DELETE FROM jobs_fichiers WHERE job_id = %s", (job_id,))
+                self.connection.commit()
+                taille = 0
+                for numero, morceau in enumerate(morceaux):
+                    cursor.execute("""
+                        INSERT INTO jobs_fichiers (job_id, numero, contenu) VALUES (%s, %s, %s)
+                    """, (job_id, numero, psycopg2.Binary(morceau)))
+                    self.connection.commit()
+                    taille += len(morceau)
+                return taille
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur ecrire_fichier_job: {str(e)}")
+            self.connection.rollback()
+            raise
+
+    def lire_fichier_job_stream(self, job_id, batch_size=4):
+        """
+        Relit le fichier produit par une tâche morceau par morceau
+        Yields:
+            bytes: morceaux du fichier, dans l'ordre
+
+        Comme exporter_archives_csv_stream, le générateur emprunte sa propre
+        connexion : il est consommé après la fin de la requête Flask.
+        """
+        connection = self.pool.getconn()
+        try:
+            with connection.cursor(name='fichier_job') as cursor:
+                cursor.itersize = batch_size
+                cursor.execute("""
+                    SELECT contenu FROM jobs_fichiers WHERE job_id = %s ORDER BY numero
+                """, (job_id,))
+                for (contenu,) in cursor:
+                    yield bytes(contenu)
+            connection.commit()
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur lire_fichier_job_stream: {str(e)}")
+            connection.rollback()
+            raise
+        finally:
+            self.pool.putconn(connection)
+
+    def reserver_job(self, worker, max_en_cours=None):
+        """
+        Passe la plus ancienne tâche en attente à 'en_cours' pour ce worker
+        Args:
+            worker: identifiant du worker (hôte:pid)
+            max_en_cours: nombre maximal de tâches en cours, tous workers confondus
+        Returns:
+            dict: la tâche avec son fichier d'entrée, None si rien à faire
+        """
+        try:
+            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                if max_en_cours:
+                    # Les réservations sont sérialisées pour que la borne globale soit respectée
+                    cursor.execute("SELECT pg_advisory_xact_lock(hashtext('jobs'))")
+                    cursor.execute("SELECT COUNT(*) as nb FROM jobs WHERE statut = 'en_cours'")
+                    if cursor.fetchone()['nb'] >= max_en_cours:
+                        self.connection.rollback()
+                        return None
+                cursor.execute("""
+                    UPDATE jobs SET
+                        statut = 'en_cours',
+                        tentatives = tentatives + 1,
+                        worker = %s,
+                        progression = 0,
+                        message = NULL,
+                        erreur = NULL,
+                        demarre_le = CURRENT_TIMESTAMP,
+                        heartbeat_le = CURRENT_TIMESTAMP
+                    WHERE id = (
+                        SELECT id FROM jobs WHERE statut = 'en_attente'
+                        ORDER BY id LIMIT 1
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, type, parametres, fichier_entree, tentatives, request_id
+                """, (worker,))
+                job = cursor.fetchone()
+                self.connection.commit()
+                return job
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur reserver_job: {str(e)}")
+            self.connection.rollback()
+            return None
+
+    def progression_job(self, job_id, progression, message=None):
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE jobs SET progression = %s, message = COALESCE(%s, message),
+                                    heartbeat_le = CURRENT_TIMESTAMP
+                    WHERE id = %s AND statut = 'en_cours'
+                """, (max(0, min(100, int(progression))), message, job_id))
+                self.connection.commit()
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur progression_job: {str(e)}")
+            self.connection.rollback()
+
+    def terminer_job(self, job_id, resultat, nom_fichier=None):
+        """Tâche réussie : résultat enregistré (fichier produit déjà écrit), fichier d'entrée libéré"""
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE jobs SET
+                        statut = 'termine',
+                        progression = 100,
+                        resultat = %s,
+                        nom_fichier_resultat = %s,
+                        fichier_entree = NULL,
+                        termine_le = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                """, (self._json_job(resultat), nom_fichier, job_id))
+                self.connection.commit()
+                return True
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur terminer_job: {str(e)}")
+            self.connection.rollback()
+            return False
+
+    def echouer_job(self, job_id, erreur, resultat=None):
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE jobs SET
+                        statut = 'echec',
+                        erreur = %s,
+                        resultat = %s,
+                        fichier_entree = NULL,
+                        termine_le = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                """, (erreur, self._json_job(resultat) if resultat is not None else None, job_id))
+                # Fichier produit en partie avant l'échec
+                cursor.execute("DELETE FROM jobs_fichiers WHERE job_id = %s", (job_id,))
+                self.connection.commit()
+                return True
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur echouer_job: {str(e)}")
+            self.connection.rollback()
+            return False
+
+    def battre_coeur_jobs(self, job_ids):
+        """Signale que ces tâches sont toujours traitées (voir recuperer_jobs_abandonnes)"""
+        if not job_ids:
+            return
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE jobs SET heartbeat_le = CURRENT_TIMESTAMP
+                    WHERE id = ANY(%s) AND statut = 'en_cours'
+                """, (list(job_ids),))
+                self.connection.commit()
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur battre_coeur_jobs: {str(e)}")
+            self.connection.rollback()
+
+    def recuperer_jobs_abandonnes(self, delai_secondes, max_tentatives, types_non_reessayables=()):
+        """
+        Tâches 'en_cours' sans signe de vie depuis delai_secondes (worker arrêté) :
+        remises en attente, ou en échec si les tentatives sont épuisées ou si la
+        tâche ne peut pas être rejouée sans risque.
+        Returns:
+            list: (id, type, nouveau statut) des tâches récupérées
+        """
+        try:
+            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute("""
+                    UPDATE jobs SET
+                        statut = CASE WHEN r.reprise THEN 'en_attente' ELSE 'echec' END,
+                        erreur = 'Tâche interrompue (worker arrêté) après '
+                                 || jobs.tentatives || ' tentative(s)',
+                        worker = NULL,
+                        termine_le = CASE WHEN r.reprise THEN NULL ELSE CURRENT_TIMESTAMP END
+                    FROM (
+                        SELECT id, (tentatives < %s AND NOT (type = ANY(%s))) as reprise
+                        FROM jobs
+                        WHERE statut = 'en_cours'
+                          AND heartbeat_le < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                        FOR UPDATE SKIP LOCKED
+                    ) r
+                    WHERE jobs.id = r.id
+                    RETURNING jobs.id, jobs.type, jobs.statut
+                """, (max_tentatives, list(types_non_reessayables), delai_secondes))
+                jobs = cursor.fetchall()
+                self.connection.commit()
+                return jobs
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur recuperer_jobs_abandonnes: {str(e)}")
+            self.connection.rollback()
+            return []
+
+    def purger_jobs(self, jours):
+        """Supprime les tâches terminées depuis plus de jours jours (et leurs fichiers)"""
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("""
+                    DELETE FROM jobs
+                    WHERE termine_le < CURRENT_TIMESTAMP - make_interval(days => %s)
+                """, (int(jours),))
+                nb = cursor.rowcount
+                self.connection.commit()
+                return nb
+        except Exception as e:
+            print(f"{prefixe_request_id()}Erreur purger_jobs: {str(e)}")
+            self.connection.rollback()
+            return 0
+
+
+class DatabaseParProcessus:
+    """
+    Accès à la Database propre au processus courant.
+
+    Sous un serveur pre-fork (gunicorn), une connexion ouverte avant le fork
+    serait partagée entre workers : le pool n'est donc créé qu'au premier
+    usage dans chaque processus (ou explicitement dans le hook post_fork),
+    et recréé si le PID change.
+    """
+
+    def __init__(self):
+        self._database = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def initialiser(self):
+        """Crée la Database du processus courant si besoin et la renvoie"""
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    # Celle héritée du parent n'est pas fermée : ses sockets
+                    # appartiennent toujours au processus parent
+                    self._database = Database()
+                    self._pid = pid
+        return self._database
+
+    def fermer(self):
+        """Ferme le pool du processus courant (arrêt du worker)"""
+        with self._lock:
+            if self._database is not None and self._pid == os.getpid():
+                self._database.fermer()
+            self._database = None
+            self._pid = None
+
+    def __getattr__(self, nom):
+        return getattr(self.initialiser(), nom)
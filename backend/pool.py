@@ -0,0 +1,211 @@
+import psycopg2
+import psycopg2.extensions
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeoutError(Exception):
+    """Levée quand aucune connexion ne se libère avant la fin du délai d'attente"""
+
+
+class ConnectionPool:
+    """
+    Pool borné de connexions PostgreSQL, partagé entre les threads Flask.
+
+    Chaque requête emprunte une connexion (getconn) et la rend à la fin
+    (putconn). Les connexions cassées sont détectées au retour et à
+    l'emprunt, puis remplacées.
+    """
+
+    def __init__(self, minconn, maxconn, timeout=10, ping_after=30, max_retries=5, retry_delay=2, **connect_kwargs):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Taille de pool invalide: min={minconn}, max={maxconn}")
+
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._connect_kwargs = connect_kwargs
+
+        self._lock = threading.Condition()
+        self._idle = []          # [(connexion, date de dernier retour)]
+        self._in_use = set()
+        self._opening = 0        # connexions en cours d'ouverture (slots réservés)
+        self._closed = False
+
+        self._stats = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'connexions_creees': 0,
+            'connexions_cassees': 0,
+            'attente_totale_ms': 0.0,
+        }
+
+        # Connexions initiales, avec les mêmes tentatives qu'au démarrage historique
+        for attempt in range(max_retries):
+            try:
+                for _ in range(self.minconn - len(self._idle)):
+                    self._idle.append((self._connect(), time.monotonic()))
+                print(f"✅ Pool de connexions prêt ({self.minconn}-{self.maxconn})")
+                break
+            except Exception as e:
+                print(f"❌ Tentative {attempt + 1}/{max_retries} échouée: {str(e)}")
+                if attempt < max_retries - 1:
+                    time.sleep(retry_delay)
+                else:
+                    raise e
+
+    def _connect(self):
+        connection = psycopg2.connect(**self._connect_kwargs)
+        # Appelé verrou relâché (getconn) : compteur mis à jour sous le verrou
+        with self._lock:
+            self._stats['connexions_creees'] += 1
+        return connection
+
+    def _discard(self, connection):
+        self._stats['connexions_cassees'] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _needs_ping(self, idle_since):
+        return self.ping_after is not None and time.monotonic() - idle_since >= self.ping_after
+
+    def _ping(self, connection):
+        """Vérifie une connexion restée inactive longtemps avant de la prêter (verrou relâché)"""
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self, timeout=None):
+        """Emprunte une connexion, en attendant au plus `timeout` secondes"""
+        timeout = self.timeout if timeout is None else timeout
+        debut = time.monotonic()
+        deadline = debut + timeout
+
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise psycopg2.InterfaceError("Le pool de connexions est fermé")
+
+                connection = None
+                while self._idle and not self._closed:
+                    candidate, idle_since = self._idle.pop()
+                    if candidate.closed:
+                        self._discard(candidate)
+                        continue
+                    if not self._needs_ping(idle_since):
+                        connection = candidate
+                        break
+                    # Ping réseau hors verrou, slot réservé comme pour une ouverture :
+                    # les autres emprunts et retours ne l'attendent pas
+                    self._opening += 1
+                    self._lock.release()
+                    try:
+                        vivante = self._ping(candidate)
+                    finally:
+                        self._lock.acquire()
+                        self._opening -= 1
+                    if vivante and not self._closed:
+                        connection = candidate
+                        break
+                    self._discard(candidate)
+                    self._lock.notify()
+
+                if self._closed:
+                    continue
+
+                if connection is None and len(self._in_use) + self._opening < self.maxconn:
+                    # Place libre : on réserve le slot puis on se connecte sans bloquer les autres threads
+                    self._opening += 1
+                    self._lock.release()
+                    try:
+                        connection = self._connect()
+                    finally:
+                        self._lock.acquire()
+                        self._opening -= 1
+                        self._lock.notify()
+
+                if connection is not None:
+                    self._in_use.add(connection)
+                    self._stats['checkouts'] += 1
+                    self._stats['attente_totale_ms'] += (time.monotonic() - debut) * 1000
+                    return connection
+
+                restant = deadline - time.monotonic()
+                if restant <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f"Aucune connexion disponible après {timeout}s ({self.maxconn} en cours d'utilisation)"
+                    )
+                self._lock.wait(restant)
+
+    def putconn(self, connection):
+        """Rend une connexion au pool, en annulant toute transaction restée ouverte"""
+        with self._lock:
+            if connection not in self._in_use:
+                return
+            self._in_use.discard(connection)
+
+            reutilisable = not connection.closed and not self._closed
+            if reutilisable:
+                try:
+                    status = connection.get_transaction_status()
+                    if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                        reutilisable = False
+                    elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                        connection.rollback()
+                except Exception:
+                    reutilisable = False
+
+            if reutilisable:
+                self._idle.append((connection, time.monotonic()))
+            else:
+                self._discard(connection)
+
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager : `with pool.connection() as conn: ...`"""
+        connection = self.getconn(timeout)
+        try:
+            yield connection
+        finally:
+            self.putconn(connection)
+
+    def stats(self):
+        """Statistiques d'utilisation du pool"""
+        with self._lock:
+            checkouts = self._stats['checkouts']
+            return {
+                'min': self.minconn,
+                'max': self.maxconn,
+                'timeout': self.timeout,
+                'en_cours': len(self._in_use),
+                'disponibles': len(self._idle),
+                'total': len(self._in_use) + len(self._idle),
+                'checkouts': checkouts,
+                'timeouts': self._stats['timeouts'],
+                'connexions_creees': self._stats['connexions_creees'],
+                'connexions_cassees': self._stats['connexions_cassees'],
+                'attente_moyenne_ms': round(self._stats['attente_totale_ms'] / checkouts, 3) if checkouts else 0.0,
+            }
+
+    def closeall(self):
+        """Ferme toutes les connexions du pool"""
+        with self._lock:
+            self._closed = True
+            for connection, _ in self._idle:
+                connection.close()
+            for connection in self._in_use:
+                connection.close()
+            self._idle = []
+            self._in_use = set()
+            self._lock.notify_all()
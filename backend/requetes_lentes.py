@@ -0,0 +1,291 @@
+"""
+Journal des requêtes SQL lentes.
+
+Chaque instruction exécutée par un curseur de la base est chronométrée ; au-delà
+du seuil SLOW_QUERY_MS elle est journalisée (SQL, paramètres masqués, durée,
+méthode de Database appelante, identifiant de requête HTTP). La première fois
+qu'une forme de requête est lente, son plan EXPLAIN (ANALYZE, BUFFERS) est
+capturé en arrière-plan sur une autre connexion, constantes masquées. Requêtes
+et plans sont gardés dans des tampons circulaires bornés (voir
+GET /api/admin/requetes-lentes).
+"""
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.sql
+
+import compteur_requetes
+
+# Instructions dont on peut rejouer le plan avec ANALYZE sans rien modifier
+LECTURE = re.compile(r'^\s*(SELECT|WITH|VALUES|TABLE)\b', re.IGNORECASE)
+LITTERAUX = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+ESPACES = re.compile(r'\s+')
+# Constantes d'un plan EXPLAIN ('texte'::type, '{1,2}'::integer[]...) et
+# valeurs citées dans un message d'erreur PostgreSQL
+LITTERAUX_PLAN = re.compile(r"'(?:[^']|'')*'")
+LITTERAUX_ERREUR = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+
+
+def masquer_parametre(valeur):
+    """Les identifiants et drapeaux restent lisibles ; textes et dates sont masqués"""
+    if valeur is None or isinstance(valeur, (bool, int, float)):
+        return valeur
+    if isinstance(valeur, str):
+        return f"<texte:{len(valeur)}>"
+    if isinstance(valeur, (datetime, date)):
+        return '<date>'
+    if isinstance(valeur, (list, tuple)):
+        return f"<liste:{len(valeur)}>"
+    return f"<{type(valeur).__name__}>"
+
+
+def masquer_parametres(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {cle: masquer_parametre(valeur) for cle, valeur in params.items()}
+    try:
+        return [masquer_parametre(valeur) for valeur in params]
+    except TypeError:
+        return masquer_parametre(params)
+
+
+def forme_requete(sql):
+    """Forme normalisée : littéraux remplacés et espaces réduits"""
+    return ESPACES.sub(' ', LITTERAUX.sub('?', sql)).strip()
+
+
+def masquer_plan(texte):
+    """
+    Le plan est capturé avec les vrais paramètres : les constantes qu'il cite
+    (emails, noms, termes de recherche) sont masquées avant d'être exposées
+    """
+    return LITTERAUX_PLAN.sub("'?'", texte)
+
+
+def methode_appelante():
+    """Première méthode publique de models.py dans la pile d'appels"""
+    frame = sys._getframe(2)
+    repli = None
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename.endswith('models.py'):
+            if not code.co_name.startswith('_'):
+                return code.co_name
+            repli = repli or code.co_name
+        frame = frame.f_back
+    return repli or 'inconnue'
+
+
+class JournalRequetesLentes:
+
+    def __init__(self, seuil_ms=500, explain=True, taille=100):
+        self.seuil_ms = seuil_ms
+        self.explain = explain
+        self.requetes = deque(maxlen=taille)
+        self.plans = deque(maxlen=taille)
+        self._formes_expliquees = set()
+        self._lock = threading.Lock()
+        self._explain_executor = None
+
+        # Branchés par l'application : identifiant de requête HTTP et pool
+        # utilisé pour capturer les plans sur une connexion séparée
+        self.fournisseur_request_id = None
+        self.pool = None
+
+    @classmethod
+    def depuis_env(cls):
+        return cls(
+            seuil_ms=float(os.getenv('SLOW_QUERY_MS', 500)),
+            explain=os.getenv('SLOW_QUERY_EXPLAIN', '1') == '1',
+            taille=int(os.getenv('SLOW_QUERY_BUFFER', 100)),
+        )
+
+    @property
+    def actif(self):
+        return self.seuil_ms > 0
+
+    def request_id_courant(self):
+        try:
+            return self.fournisseur_request_id() if self.fournisseur_request_id else None
+        except Exception:
+            return None
+
+    def enregistrer(self, sql, params, duree_ms):
+        """Appelé après chaque instruction ; ne fait rien sous le seuil"""
+        if not self.actif or duree_ms < self.seuil_ms:
+            return
+        if isinstance(sql, bytes):
+            sql = sql.decode('utf-8', 'replace')
+        sql = str(sql)
+
+        forme = forme_requete(sql)
+        empreinte = hashlib.sha1(forme.encode('utf-8')).hexdigest()[:12]
+        entree = {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'duree_ms': round(duree_ms, 1),
+            'methode': methode_appelante(),
+            'request_id': self.request_id_courant(),
+            'forme': empreinte,
+            # Forme normalisée : les valeurs écrites en dur (execute_values) sont masquées aussi
+            'sql': forme,
+            'params': masquer_parametres(params),
+        }
+        with self._lock:
+            self.requetes.append(entree)
+            a_expliquer = self.explain and self.pool is not None and empreinte not in self._formes_expliquees
+            if a_expliquer:
+                self._formes_expliquees.add(empreinte)
+                if self._explain_executor is None:
+                    self._explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='explain')
+
+        print(f"🐢 Requête lente {entree['duree_ms']} ms [{entree['methode']}] "
+              f"req={entree['request_id']} forme={empreinte}: {entree['sql'][:300]} "
+              f"params={entree['params']}")
+
+        if a_expliquer:
+            self._explain_executor.submit(self._capturer_plan, sql, params, entree)
+
+    def _capturer_plan(self, sql, params, entree):
+        """EXPLAIN sur une connexion du pool, en transaction lecture seule annulée"""
+        analyse = bool(LECTURE.match(sql))
+        options = 'ANALYZE, BUFFERS' if analyse else 'COSTS'
+        plan = {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'forme': entree['forme'],
+            'methode': entree['methode'],
+            'request_id': entree['request_id'],
+            'duree_ms': entree['duree_ms'],
+            'sql': entree['sql'],
+            'analyse': analyse,
+        }
+        try:
+            connection = self.pool.getconn(timeout=2)
+        except Exception as e:
+            plan['erreur'] = f"Pas de connexion disponible: {str(e)}"
+            with self._lock:
+                self.plans.append(plan)
+            return
+        try:
+            # Curseur non chronométré : l'EXPLAIN lui-même ne doit pas être journalisé
+            with psycopg2.extensions.connection.cursor(connection) as cursor:
+                cursor.execute("SET TRANSACTION READ ONLY")
+                cursor.execute(f"EXPLAIN ({options}) {sql}", params)
+                plan['plan'] = masquer_plan('\n'.join(ligne[0] for ligne in cursor.fetchall()))
+        except Exception as e:
+            # Ex. table temporaire de la session d'origine, invisible ici
+            plan['erreur'] = LITTERAUX_ERREUR.sub('?', str(e).strip())
+        finally:
+            connection.rollback()
+            self.pool.putconn(connection)
+        with self._lock:
+            self.plans.append(plan)
+
+    def etat(self):
+        with self._lock:
+            return {
+                'seuil_ms': self.seuil_ms,
+                'explain': self.explain,
+                'requetes': list(reversed(self.requetes)),
+                'plans': list(reversed(self.plans)),
+            }
+
+    def vider(self):
+        with self._lock:
+            self.requetes.clear()
+            self.plans.clear()
+            self._formes_expliquees.clear()
+
+
+journal = JournalRequetesLentes.depuis_env()
+
+
+def prefixe_request_id():
+    """Préfixe '[req=<id>] ' des messages d'erreur (vide hors requête)"""
+    request_id = journal.request_id_courant()
+    return f"[req={request_id}] " if request_id else ''
+
+
+def annoter_requete(query):
+    """
+    Préfixe l'instruction d'un commentaire portant l'identifiant de la requête
+    HTTP : visible dans pg_stat_activity et les logs PostgreSQL, sans aller-retour
+    supplémentaire (pg_stat_statements ignore les commentaires pour regrouper).
+    L'identifiant est validé par l'application (alphabet sans '*', '/' ni '%').
+    """
+    request_id = journal.request_id_courant()
+    if not request_id:
+        return query
+    commentaire = f"/* request_id={request_id} */ "
+    if isinstance(query, str):
+        return commentaire + query
+    if isinstance(query, bytes):
+        return commentaire.encode('ascii') + query
+    if isinstance(query, psycopg2.sql.Composable):
+        return psycopg2.sql.SQL(commentaire) + query
+    return query
+
+
+class CurseurChronometre:
+    """
+    Mixin de curseur : chronomètre execute/executemany/copy_expert pour le
+    journal des requêtes lentes et le compteur d'instructions de la requête HTTP,
+    et annote chaque instruction avec l'identifiant de la requête HTTP
+    """
+
+    def execute(self, query, vars=None):
+        debut = time.perf_counter()
+        try:
+            return super().execute(annoter_requete(query), vars)
+        finally:
+            duree_ms = (time.perf_counter() - debut) * 1000
+            journal.enregistrer(query, vars, duree_ms)
+            compteur_requetes.enregistrer(query, duree_ms)
+
+    def executemany(self, query, vars_list):
+        # psycopg2 exécute une instruction par jeu de paramètres
+        vars_list = list(vars_list)
+        debut = time.perf_counter()
+        try:
+            return super().executemany(annoter_requete(query), vars_list)
+        finally:
+            duree_ms = (time.perf_counter() - debut) * 1000
+            journal.enregistrer(query, None, duree_ms)
+            compteur_requetes.enregistrer(query, duree_ms, nombre=len(vars_list))
+
+    def copy_expert(self, sql, file, size=8192):
+        debut = time.perf_counter()
+        try:
+            return super().copy_expert(annoter_requete(sql), file, size)
+        finally:
+            duree_ms = (time.perf_counter() - debut) * 1000
+            journal.enregistrer(sql, None, duree_ms)
+            compteur_requetes.enregistrer(sql, duree_ms)
+
+
+_curseurs_chronometres = {}
+
+
+class ConnexionChronometree(psycopg2.extensions.connection):
+    """
+    Connexion dont tous les curseurs sont chronométrés, quel que soit le
+    cursor_factory demandé (RealDictCursor, curseur nommé...).
+    """
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        chronometre = _curseurs_chronometres.get(factory)
+        if chronometre is None:
+            chronometre = type(f"{factory.__name__}Chronometre", (CurseurChronometre, factory), {})
+            _curseurs_chronometres[factory] = chronometre
+        kwargs['cursor_factory'] = chronometre
+        return super().cursor(*args, **kwargs)
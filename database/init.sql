@@ -567,4 +567,835 @@ BEGIN
     RAISE NOTICE '  - v_stats_archives';
     RAISE NOTICE '  - v_eleves_archives_complet';
     RAISE NOTICE '========================================';
-END $$;
\ No newline at end of file
+END $$;
+
+-- ========================================
+-- MIGRATION : Nombre d'évaluations par compétence et par classe
+-- À exécuter sur votre base de données existante
+-- ========================================
+
+-- Table de synthèse : nombre d'évaluations distinctes portant sur chaque
+-- compétence, par classe attribuée. Indépendante de l'élève, elle évite de
+-- recalculer deux sous-requêtes corrélées par compétence à chaque profil.
+CREATE TABLE IF NOT EXISTS competence_evaluations_stats (
+    competence_id INTEGER NOT NULL REFERENCES competences(id) ON DELETE CASCADE,
+    classe VARCHAR(50) NOT NULL,
+    nb_evaluations INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (competence_id, classe)
+);
+
+-- ========================================
+-- FONCTION : Recalcul de la synthèse pour quelques compétences
+-- ========================================
+CREATE OR REPLACE FUNCTION rafraichir_stats_competences(p_competences INTEGER[])
+RETURNS VOID AS $$
+BEGIN
+    IF p_competences IS NULL OR cardinality(p_competences) = 0 THEN
+        RETURN;
+    END IF;
+
+    -- Un seul recalcul à la fois par compétence jusqu'à la fin de la transaction :
+    -- le calcul qui suit le verrou voit les écritures concurrentes déjà validées.
+    -- Verrous pris dans l'ordre des identifiants.
+    PERFORM pg_advisory_xact_lock(hashtext('competence_evaluations_stats'), competence_id)
+    FROM (SELECT DISTINCT unnest(p_competences) as competence_id ORDER BY 1) c;
+
+    WITH calcul AS (
+        SELECT 
+            i.competence_id,
+            ea.classe,
+            COUNT(DISTINCT ei.evaluation_id)::integer as nb_evaluations
+        FROM evaluation_items ei
+        JOIN items i ON ei.item_id = i.id
+        JOIN evaluation_attributions ea ON ea.evaluation_id = ei.evaluation_id
+        WHERE ea.classe IS NOT NULL
+          AND i.competence_id = ANY(p_competences)
+        GROUP BY i.competence_id, ea.classe
+    ),
+    maj AS (
+        INSERT INTO competence_evaluations_stats (competence_id, classe, nb_evaluations)
+        SELECT competence_id, classe, nb_evaluations FROM calcul
+        ON CONFLICT (competence_id, classe) DO UPDATE
+            SET nb_evaluations = EXCLUDED.nb_evaluations
+            WHERE competence_evaluations_stats.nb_evaluations <> EXCLUDED.nb_evaluations
+    )
+    DELETE FROM competence_evaluations_stats s
+    WHERE s.competence_id = ANY(p_competences)
+      AND NOT EXISTS (
+          SELECT 1 FROM calcul c
+          WHERE c.competence_id = s.competence_id AND c.classe = s.classe
+      );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Recalcul complet (remplissage initial, TRUNCATE)
+CREATE OR REPLACE FUNCTION rafraichir_competence_evaluations_stats()
+RETURNS VOID AS $$
+BEGIN
+    PERFORM rafraichir_stats_competences(ARRAY(SELECT id FROM competences));
+END;
+$$ LANGUAGE plpgsql;
+
+-- Compétences à recalculer, par transaction : les déclencheurs d'instruction
+-- les notent ici, le recalcul a lieu une seule fois à la validation (COMMIT).
+-- Tous les verrous de compétence sont alors pris d'un coup et dans l'ordre,
+-- ce qui évite les interblocages entre transactions à plusieurs instructions
+-- (suppression puis insertion des items d'une évaluation, par exemple).
+CREATE UNLOGGED TABLE IF NOT EXISTS competence_evaluations_stats_a_recalculer (
+    transaction_id BIGINT NOT NULL,
+    competence_id INTEGER NOT NULL,
+    PRIMARY KEY (transaction_id, competence_id)
+);
+
+CREATE OR REPLACE FUNCTION marquer_stats_competences(p_competences INTEGER[])
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO competence_evaluations_stats_a_recalculer (transaction_id, competence_id)
+    SELECT txid_current(), unnest(p_competences)
+    ON CONFLICT DO NOTHING;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_recalculer_stats_competences()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_competences INTEGER[];
+BEGIN
+    -- Le premier déclenchement traite toute la file de la transaction, les suivants la trouvent vide
+    WITH pris AS (
+        DELETE FROM competence_evaluations_stats_a_recalculer
+        WHERE transaction_id = txid_current()
+        RETURNING competence_id
+    )
+    SELECT array_agg(competence_id) INTO v_competences FROM pris;
+
+    PERFORM rafraichir_stats_competences(v_competences);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_recalculer_stats_competences ON competence_evaluations_stats_a_recalculer;
+CREATE CONSTRAINT TRIGGER trg_recalculer_stats_competences
+AFTER INSERT ON competence_evaluations_stats_a_recalculer
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW EXECUTE FUNCTION trg_recalculer_stats_competences();
+
+-- Déclencheurs au niveau instruction avec tables de transition : seules les
+-- compétences des lignes touchées sont notées pour recalcul
+CREATE OR REPLACE FUNCTION trg_stats_evaluation_items()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM rafraichir_competence_evaluations_stats();
+    ELSIF TG_OP = 'INSERT' THEN
+        PERFORM marquer_stats_competences(ARRAY(
+            SELECT DISTINCT i.competence_id FROM nouvelles n JOIN items i ON i.id = n.item_id));
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM marquer_stats_competences(ARRAY(
+            SELECT DISTINCT i.competence_id FROM anciennes a JOIN items i ON i.id = a.item_id));
+    ELSE
+        PERFORM marquer_stats_competences(ARRAY(
+            SELECT DISTINCT i.competence_id
+            FROM (SELECT item_id FROM nouvelles UNION SELECT item_id FROM anciennes) t
+            JOIN items i ON i.id = t.item_id));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_stats_evaluation_attributions()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM rafraichir_competence_evaluations_stats();
+    ELSIF TG_OP = 'INSERT' THEN
+        PERFORM marquer_stats_competences(ARRAY(
+            SELECT DISTINCT i.competence_id
+            FROM evaluation_items ei JOIN items i ON i.id = ei.item_id
+            WHERE ei.evaluation_id IN (SELECT evaluation_id FROM nouvelles)));
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM marquer_stats_competences(ARRAY(
+            SELECT DISTINCT i.competence_id
+            FROM evaluation_items ei JOIN items i ON i.id = ei.item_id
+            WHERE ei.evaluation_id IN (SELECT evaluation_id FROM anciennes)));
+    ELSE
+        PERFORM marquer_stats_competences(ARRAY(
+            SELECT DISTINCT i.competence_id
+            FROM evaluation_items ei JOIN items i ON i.id = ei.item_id
+            WHERE ei.evaluation_id IN (SELECT evaluation_id FROM nouvelles
+                                       UNION SELECT evaluation_id FROM anciennes)));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_stats_items()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM marquer_stats_competences(ARRAY(SELECT DISTINCT competence_id FROM anciennes));
+    ELSE
+        -- Seuls les items changés de compétence modifient la synthèse
+        PERFORM marquer_stats_competences(ARRAY(
+            SELECT n.competence_id FROM nouvelles n JOIN anciennes a ON a.id = n.id
+            WHERE n.competence_id <> a.competence_id
+            UNION
+            SELECT a.competence_id FROM nouvelles n JOIN anciennes a ON a.id = n.id
+            WHERE n.competence_id <> a.competence_id));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Une table de transition n'est autorisée que pour un seul événement par déclencheur
+DROP TRIGGER IF EXISTS trg_evaluation_items_stats_ins ON evaluation_items;
+CREATE TRIGGER trg_evaluation_items_stats_ins
+AFTER INSERT ON evaluation_items
+REFERENCING NEW TABLE AS nouvelles
+FOR EACH STATEMENT EXECUTE FUNCTION trg_stats_evaluation_items();
+
+DROP TRIGGER IF EXISTS trg_evaluation_items_stats_upd ON evaluation_items;
+CREATE TRIGGER trg_evaluation_items_stats_upd
+AFTER UPDATE ON evaluation_items
+REFERENCING OLD TABLE AS anciennes NEW TABLE AS nouvelles
+FOR EACH STATEMENT EXECUTE FUNCTION trg_stats_evaluation_items();
+
+DROP TRIGGER IF EXISTS trg_evaluation_items_stats_del ON evaluation_items;
+CREATE TRIGGER trg_evaluation_items_stats_del
+AFTER DELETE ON evaluation_items
+REFERENCING OLD TABLE AS anciennes
+FOR EACH STATEMENT EXECUTE FUNCTION trg_stats_evaluation_items();
+
+DROP TRIGGER IF EXISTS trg_evaluation_items_stats_trunc ON evaluation_items;
+CREATE TRIGGER trg_evaluation_items_stats_trunc
+AFTER TRUNCATE ON evaluation_items
+FOR EACH STATEMENT EXECUTE FUNCTION trg_stats_evaluation_items();
+
+DROP TRIGGER IF EXISTS trg_evaluation_attributions_stats_ins ON evaluation_attributions;
+CREATE TRIGGER trg_evaluation_attributions_stats_ins
+AFTER INSERT ON evaluation_attributions
+REFERENCING NEW TABLE AS nouvelles
+FOR EACH STATEMENT EXECUTE FUNCTION trg_stats_evaluation_attributions();
+
+DROP TRIGGER IF EXISTS trg_evaluation_attributions_stats_upd ON evaluation_attributions;
+CREATE TRIGGER trg_evaluation_attributions_stats_upd
+AFTER UPDATE ON evaluation_attributions
+REFERENCING OLD TABLE AS anciennes NEW TABLE AS nouvelles
+FOR EACH STATEMENT EXECUTE FUNCTION trg_stats_evaluation_attributions();
+
+DROP TRIGGER IF EXISTS trg_evaluation_attributions_stats_del ON evaluation_attributions;
+CREATE TRIGGER trg_evaluation_attributions_stats_del
+AFTER DELETE ON evaluation_attributions
+REFERENCING OLD TABLE AS anciennes
+FOR EACH STATEMENT EXECUTE FUNCTION trg_stats_evaluation_attributions();
+
+DROP TRIGGER IF EXISTS trg_evaluation_attributions_stats_trunc ON evaluation_attributions;
+CREATE TRIGGER trg_evaluation_attributions_stats_trunc
+AFTER TRUNCATE ON evaluation_attributions
+FOR EACH STATEMENT EXECUTE FUNCTION trg_stats_evaluation_attributions();
+
+-- Les associations d'un item supprimé disparaissent en cascade, item compris :
+-- c'est ce déclencheur qui recalcule sa compétence
+DROP TRIGGER IF EXISTS trg_items_stats_upd ON items;
+CREATE TRIGGER trg_items_stats_upd
+AFTER UPDATE ON items
+REFERENCING OLD TABLE AS anciennes NEW TABLE AS nouvelles
+FOR EACH STATEMENT EXECUTE FUNCTION trg_stats_items();
+
+DROP TRIGGER IF EXISTS trg_items_stats_del ON items;
+CREATE TRIGGER trg_items_stats_del
+AFTER DELETE ON items
+REFERENCING OLD TABLE AS anciennes
+FOR EACH STATEMENT EXECUTE FUNCTION trg_stats_items();
+
+-- Remplissage initial
+DO $$ 
+BEGIN
+    PERFORM rafraichir_competence_evaluations_stats();
+    RAISE NOTICE 'Synthèse competence_evaluations_stats initialisée';
+END $$;
+
+
+-- ========================================
+-- MIGRATION : Synthèse de maîtrise des compétences par élève
+-- À exécuter sur votre base de données existante
+-- ========================================
+
+-- Une ligne pré-agrégée par (élève, compétence), maintenue par déclencheurs
+-- sur validations : la lecture du statut d'une compétence ne ré-agrège plus
+-- les validations brutes.
+CREATE TABLE IF NOT EXISTS competence_summary (
+    utilisateur_id INTEGER NOT NULL REFERENCES utilisateurs(id) ON DELETE CASCADE,
+    competence_id INTEGER NOT NULL REFERENCES competences(id) ON DELETE CASCADE,
+    nb_validations INTEGER NOT NULL DEFAULT 0,   -- nombre de validations (lignes)
+    nb_niveaux INTEGER NOT NULL DEFAULT 0,       -- validations avec un niveau renseigné
+    total_niveaux INTEGER NOT NULL DEFAULT 0,    -- somme des niveaux
+    derniere_validation TIMESTAMP,
+    PRIMARY KEY (utilisateur_id, competence_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_competence_summary_competence_id ON competence_summary(competence_id);
+
+-- ========================================
+-- FONCTION : Applique à la synthèse les validations ajoutées et retirées
+-- par une instruction (écarts cumulés par élève et compétence)
+-- ========================================
+CREATE OR REPLACE FUNCTION appliquer_competence_summary(
+    p_ajoutees validations[],
+    p_retirees validations[]
+)
+RETURNS VOID AS $$
+DECLARE
+    v_utilisateurs INTEGER[];
+    v_competences INTEGER[];
+BEGIN
+    -- Un seul upsert pour tout le lot. La date de dernière validation n'est
+    -- relue sur les validations restantes que pour les couples dont une ligne
+    -- retirée portait la date la plus récente, sans ajout plus récent qu'elle.
+    WITH mouvements AS (
+        SELECT v.utilisateur_id, v.item_id, v.niveau_validation, v.date_validation, 1 as signe
+        FROM unnest(p_ajoutees) v
+        UNION ALL
+        SELECT v.utilisateur_id, v.item_id, v.niveau_validation, v.date_validation, -1
+        FROM unnest(p_retirees) v
+    ),
+    ecarts AS (
+        SELECT 
+            m.utilisateur_id,
+            i.competence_id,
+            SUM(m.signe) as nb_validations,
+            SUM(CASE WHEN m.niveau_validation IS NULL THEN 0 ELSE m.signe END) as nb_niveaux,
+            SUM(COALESCE(m.niveau_validation, 0) * m.signe) as total_niveaux,
+            MAX(m.date_validation) FILTER (WHERE m.signe > 0) as derniere_ajoutee,
+            MAX(m.date_validation) FILTER (WHERE m.signe < 0) as derniere_retiree
+        FROM mouvements m
+        JOIN items i ON m.item_id = i.id
+        GROUP BY m.utilisateur_id, i.competence_id
+    ),
+    calcul AS (
+        SELECT 
+            e.*,
+            cs.utilisateur_id IS NOT NULL as existe,
+            COALESCE(e.derniere_retiree >= cs.derniere_validation
+                     AND (e.derniere_ajoutee IS NULL OR e.derniere_ajoutee < e.derniere_retiree), false) as a_relire
+        FROM ecarts e
+        LEFT JOIN competence_summary cs
+            ON cs.utilisateur_id = e.utilisateur_id AND cs.competence_id = e.competence_id
+    ),
+    maj AS (
+        INSERT INTO competence_summary (
+            utilisateur_id, competence_id, nb_validations, nb_niveaux, total_niveaux, derniere_validation
+        )
+        SELECT 
+            c.utilisateur_id, c.competence_id, c.nb_validations, c.nb_niveaux, c.total_niveaux,
+            CASE WHEN c.a_relire THEN (
+                SELECT MAX(v.date_validation)
+                FROM validations v
+                JOIN items i ON v.item_id = i.id
+                WHERE v.utilisateur_id = c.utilisateur_id AND i.competence_id = c.competence_id
+            ) ELSE c.derniere_ajoutee END
+        FROM calcul c
+        -- Un retrait ne crée pas de ligne (élève supprimé : la sienne l'est déjà en cascade)
+        WHERE c.existe OR c.nb_validations > 0
+        ORDER BY c.utilisateur_id, c.competence_id
+        ON CONFLICT (utilisateur_id, competence_id) DO UPDATE SET
+            nb_validations = competence_summary.nb_validations + EXCLUDED.nb_validations,
+            nb_niveaux = competence_summary.nb_niveaux + EXCLUDED.nb_niveaux,
+            total_niveaux = competence_summary.total_niveaux + EXCLUDED.total_niveaux,
+            derniere_validation = CASE
+                WHEN (SELECT c.a_relire FROM calcul c
+                      WHERE c.utilisateur_id = EXCLUDED.utilisateur_id AND c.competence_id = EXCLUDED.competence_id)
+                THEN EXCLUDED.derniere_validation
+                ELSE GREATEST(competence_summary.derniere_validation, EXCLUDED.derniere_validation)
+            END
+        RETURNING utilisateur_id, competence_id, nb_validations
+    )
+    SELECT array_agg(utilisateur_id), array_agg(competence_id)
+    INTO v_utilisateurs, v_competences
+    FROM maj
+    WHERE nb_validations <= 0;
+
+    -- Couples sans plus aucune validation
+    IF v_utilisateurs IS NOT NULL THEN
+        DELETE FROM competence_summary cs
+        USING unnest(v_utilisateurs, v_competences) as vide(utilisateur_id, competence_id)
+        WHERE cs.utilisateur_id = vide.utilisateur_id AND cs.competence_id = vide.competence_id
+          AND cs.nb_validations <= 0;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Déclencheur d'instruction : tout un lot (valider_multiple) est appliqué en une fois
+CREATE OR REPLACE FUNCTION trg_validations_competence_summary()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        DELETE FROM competence_summary;
+    ELSIF TG_OP = 'INSERT' THEN
+        PERFORM appliquer_competence_summary(ARRAY(SELECT n::validations FROM nouvelles n), '{}');
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM appliquer_competence_summary(
+            ARRAY(SELECT n::validations FROM nouvelles n),
+            ARRAY(SELECT a::validations FROM anciennes a));
+    ELSE
+        PERFORM appliquer_competence_summary('{}', ARRAY(SELECT a::validations FROM anciennes a));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Une table de transition n'est autorisée que pour un seul événement par déclencheur
+DROP TRIGGER IF EXISTS trg_validations_competence_summary_ins ON validations;
+CREATE TRIGGER trg_validations_competence_summary_ins
+AFTER INSERT ON validations
+REFERENCING NEW TABLE AS nouvelles
+FOR EACH STATEMENT EXECUTE FUNCTION trg_validations_competence_summary();
+
+DROP TRIGGER IF EXISTS trg_validations_competence_summary_upd ON validations;
+CREATE TRIGGER trg_validations_competence_summary_upd
+AFTER UPDATE ON validations
+REFERENCING OLD TABLE AS anciennes NEW TABLE AS nouvelles
+FOR EACH STATEMENT EXECUTE FUNCTION trg_validations_competence_summary();
+
+DROP TRIGGER IF EXISTS trg_validations_competence_summary_del ON validations;
+CREATE TRIGGER trg_validations_competence_summary_del
+AFTER DELETE ON validations
+REFERENCING OLD TABLE AS anciennes
+FOR EACH STATEMENT EXECUTE FUNCTION trg_validations_competence_summary();
+
+DROP TRIGGER IF EXISTS trg_validations_competence_summary_trunc ON validations;
+CREATE TRIGGER trg_validations_competence_summary_trunc
+AFTER TRUNCATE ON validations
+FOR EACH STATEMENT EXECUTE FUNCTION trg_validations_competence_summary();
+
+-- ========================================
+-- FONCTION : Reconstruire la synthèse depuis les validations brutes
+-- (remplissage initial, ou pour un seul élève si p_utilisateur_id est fourni)
+-- ========================================
+CREATE OR REPLACE FUNCTION reconstruire_competence_summary(p_utilisateur_id INTEGER DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+    v_nb_lignes INTEGER;
+BEGIN
+    DELETE FROM competence_summary
+    WHERE p_utilisateur_id IS NULL OR utilisateur_id = p_utilisateur_id;
+
+    INSERT INTO competence_summary (
+        utilisateur_id, competence_id, nb_validations, nb_niveaux, total_niveaux, derniere_validation
+    )
+    SELECT 
+        v.utilisateur_id,
+        i.competence_id,
+        COUNT(v.id),
+        COUNT(v.niveau_validation),
+        COALESCE(SUM(v.niveau_validation), 0),
+        MAX(v.date_validation)
+    FROM validations v
+    JOIN items i ON v.item_id = i.id
+    WHERE p_utilisateur_id IS NULL OR v.utilisateur_id = p_utilisateur_id
+    GROUP BY v.utilisateur_id, i.competence_id;
+
+    GET DIAGNOSTICS v_nb_lignes = ROW_COUNT;
+    RETURN v_nb_lignes;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Un changement de compétence d'un item déplace ses validations : reconstruction complète
+CREATE OR REPLACE FUNCTION trg_items_competence_summary()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM reconstruire_competence_summary();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_items_competence_summary ON items;
+CREATE TRIGGER trg_items_competence_summary
+AFTER UPDATE OF competence_id ON items
+FOR EACH STATEMENT EXECUTE FUNCTION trg_items_competence_summary();
+
+-- ========================================
+-- FONCTION : Recalcul de la synthèse pour quelques compétences (tous élèves)
+-- ========================================
+CREATE OR REPLACE FUNCTION recalculer_competence_summary(p_competences INTEGER[])
+RETURNS VOID AS $$
+BEGIN
+    IF p_competences IS NULL OR cardinality(p_competences) = 0 THEN
+        RETURN;
+    END IF;
+
+    DELETE FROM competence_summary
+    WHERE competence_id = ANY(p_competences);
+
+    INSERT INTO competence_summary (
+        utilisateur_id, competence_id, nb_validations, nb_niveaux, total_niveaux, derniere_validation
+    )
+    SELECT
+        v.utilisateur_id,
+        i.competence_id,
+        COUNT(v.id),
+        COUNT(v.niveau_validation),
+        COALESCE(SUM(v.niveau_validation), 0),
+        MAX(v.date_validation)
+    FROM validations v
+    JOIN items i ON v.item_id = i.id
+    WHERE i.competence_id = ANY(p_competences)
+    GROUP BY v.utilisateur_id, i.competence_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Les validations d'un item supprimé disparaissent en cascade alors que l'item
+-- n'existe déjà plus : le déclencheur sur validations ne retrouve pas
+-- leur compétence. Les compétences des items supprimés sont donc recalculées ici
+-- (la jointure sur items écarte les validations de l'item, qu'elles soient déjà
+-- supprimées ou non à ce stade).
+CREATE OR REPLACE FUNCTION trg_items_supprimes_competence_summary()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM recalculer_competence_summary(ARRAY(SELECT DISTINCT competence_id FROM anciennes));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_items_supprimes_competence_summary ON items;
+CREATE TRIGGER trg_items_supprimes_competence_summary
+AFTER DELETE ON items
+REFERENCING OLD TABLE AS anciennes
+FOR EACH STATEMENT EXECUTE FUNCTION trg_items_supprimes_competence_summary();
+
+-- ========================================
+-- FONCTION : Contrôle de cohérence synthèse / validations brutes
+-- Retourne uniquement les lignes en écart (aucune ligne = synthèse cohérente)
+-- ========================================
+CREATE OR REPLACE FUNCTION verifier_competence_summary()
+RETURNS TABLE (
+    utilisateur_id INTEGER,
+    competence_id INTEGER,
+    nb_validations_attendu BIGINT,
+    nb_validations_synthese INTEGER,
+    total_niveaux_attendu BIGINT,
+    total_niveaux_synthese INTEGER,
+    derniere_validation_attendue TIMESTAMP,
+    derniere_validation_synthese TIMESTAMP
+) AS $$
+BEGIN
+    RETURN QUERY
+    WITH attendu AS (
+        SELECT 
+            v.utilisateur_id,
+            i.competence_id,
+            COUNT(v.id) as nb_validations,
+            COUNT(v.niveau_validation) as nb_niveaux,
+            COALESCE(SUM(v.niveau_validation), 0) as total_niveaux,
+            MAX(v.date_validation) as derniere_validation
+        FROM validations v
+        JOIN items i ON v.item_id = i.id
+        GROUP BY v.utilisateur_id, i.competence_id
+    )
+    SELECT 
+        COALESCE(a.utilisateur_id, cs.utilisateur_id),
+        COALESCE(a.competence_id, cs.competence_id),
+        COALESCE(a.nb_validations, 0),
+        COALESCE(cs.nb_validations, 0),
+        COALESCE(a.total_niveaux, 0),
+        COALESCE(cs.total_niveaux, 0),
+        a.derniere_validation,
+        cs.derniere_validation
+    FROM attendu a
+    FULL OUTER JOIN competence_summary cs
+        ON cs.utilisateur_id = a.utilisateur_id AND cs.competence_id = a.competence_id
+    WHERE a.nb_validations IS DISTINCT FROM cs.nb_validations
+       OR a.nb_niveaux IS DISTINCT FROM cs.nb_niveaux
+       OR a.total_niveaux IS DISTINCT FROM cs.total_niveaux
+       OR a.derniere_validation IS DISTINCT FROM cs.derniere_validation;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Remplissage initial
+DO $$ 
+BEGIN
+    PERFORM reconstruire_competence_summary();
+    RAISE NOTICE 'Synthèse competence_summary initialisée';
+END $$;
+
+
+-- ========================================
+-- MIGRATION : Pagination par clé des archives
+-- À exécuter sur votre base de données existante
+-- ========================================
+
+-- Index couvrant l'ordre de pagination (date_archivage DESC, nom, prenom, id),
+-- global et par promotion : chaque page reprend directement après la précédente
+CREATE INDEX IF NOT EXISTS idx_archives_pagination
+    ON utilisateurs_archives ((COALESCE(date_archivage, '-infinity'::timestamp)) DESC, nom, prenom, id);
+CREATE INDEX IF NOT EXISTS idx_archives_annee_pagination
+    ON utilisateurs_archives (annee_diplome, (COALESCE(date_archivage, '-infinity'::timestamp)) DESC, nom, prenom, id);
+
+
+-- ========================================
+-- MIGRATION : Recherche indexée (sans accents) des élèves actifs et archivés
+-- À exécuter sur votre base de données existante
+-- ========================================
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() est STABLE et ne peut pas être indexée : enveloppe IMMUTABLE
+-- avec le dictionnaire explicite
+CREATE OR REPLACE FUNCTION immutable_unaccent(TEXT)
+RETURNS TEXT AS $$
+    SELECT public.unaccent('public.unaccent'::regdictionary, $1)
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+
+-- Clé de recherche normalisée : minuscules, sans accents ("Chloé" -> "chloe")
+CREATE OR REPLACE FUNCTION cle_recherche_eleve(p_nom TEXT, p_prenom TEXT, p_email TEXT)
+RETURNS TEXT AS $$
+    SELECT lower(immutable_unaccent(
+        COALESCE(p_nom, '') || ' ' || COALESCE(p_prenom, '') || ' ' || COALESCE(p_email, '')
+    ))
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+-- Index trigrammes sur la clé : LIKE '%terme%' et similarité utilisent l'index
+CREATE INDEX IF NOT EXISTS idx_utilisateurs_recherche_trgm
+    ON utilisateurs USING gin (cle_recherche_eleve(nom, prenom, email) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_archives_recherche_trgm
+    ON utilisateurs_archives USING gin (cle_recherche_eleve(nom, prenom, email) gin_trgm_ops);
+
+-- Terme normalisé comme la clé, avec les jokers LIKE échappés
+CREATE OR REPLACE FUNCTION motif_recherche_eleve(p_recherche TEXT)
+RETURNS TEXT AS $$
+    SELECT '%' || replace(replace(replace(
+        lower(immutable_unaccent(trim(p_recherche))),
+        '\', '\\'), '%', '\%'), '_', '\_') || '%'
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+-- ========================================
+-- FONCTION : Rechercher dans les archives (version indexée, même signature)
+-- ========================================
+CREATE OR REPLACE FUNCTION rechercher_archive(p_recherche TEXT)
+RETURNS TABLE (
+    id INTEGER,
+    nom VARCHAR(100),
+    prenom VARCHAR(100),
+    email VARCHAR(255),
+    annee_diplome INTEGER,
+    nb_validations INTEGER,
+    date_archivage TIMESTAMP
+) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT 
+        ua.id,
+        ua.nom,
+        ua.prenom,
+        ua.email,
+        ua.annee_diplome,
+        ua.nb_validations,
+        ua.date_archivage
+    FROM utilisateurs_archives ua
+    WHERE cle_recherche_eleve(ua.nom, ua.prenom, ua.email) LIKE motif_recherche_eleve(p_recherche)
+    ORDER BY ua.date_archivage DESC;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ========================================
+-- FONCTION : Recherche unifiée élèves actifs + archivés, classée et limitée
+-- Correspondance exacte d'une sous-chaîne d'abord, puis par similarité de mots
+-- (tolère les fautes de frappe), les deux servies par les index trigrammes
+-- ========================================
+CREATE OR REPLACE FUNCTION rechercher_eleves(
+    p_recherche TEXT,
+    p_limite INTEGER DEFAULT 20,
+    p_inclure_archives BOOLEAN DEFAULT TRUE
+)
+RETURNS TABLE (
+    source TEXT,
+    id INTEGER,
+    utilisateur_id INTEGER,
+    nom VARCHAR(100),
+    prenom VARCHAR(100),
+    email VARCHAR(255),
+    classe VARCHAR(50),
+    annee_diplome INTEGER,
+    score REAL
+) AS $$
+DECLARE
+    v_terme TEXT := lower(immutable_unaccent(trim(p_recherche)));
+    v_motif TEXT := motif_recherche_eleve(p_recherche);
+BEGIN
+    RETURN QUERY
+    SELECT r.source, r.id, r.utilisateur_id, r.nom, r.prenom, r.email, r.classe, r.annee_diplome, r.score
+    FROM (
+        SELECT 
+            'actif'::TEXT as source,
+            u.id,
+            u.id as utilisateur_id,
+            u.nom,
+            u.prenom,
+            u.email,
+            u.classe,
+            NULL::INTEGER as annee_diplome,
+            (CASE WHEN cle_recherche_eleve(u.nom, u.prenom, u.email) LIKE v_motif THEN 1 ELSE 0 END
+             + word_similarity(v_terme, cle_recherche_eleve(u.nom, u.prenom, u.email)))::REAL as score
+        FROM utilisateurs u
+        WHERE cle_recherche_eleve(u.nom, u.prenom, u.email) LIKE v_motif
+           OR v_terme <% cle_recherche_eleve(u.nom, u.prenom, u.email)
+        UNION ALL
+        SELECT 
+            'archive'::TEXT,
+            ua.id,
+            ua.utilisateur_id,
+            ua.nom,
+            ua.prenom,
+            ua.email,
+            ua.classe_origine,
+            ua.annee_diplome,
+            (CASE WHEN cle_recherche_eleve(ua.nom, ua.prenom, ua.email) LIKE v_motif THEN 1 ELSE 0 END
+             + word_similarity(v_terme, cle_recherche_eleve(ua.nom, ua.prenom, ua.email)))::REAL
+        FROM utilisateurs_archives ua
+        WHERE p_inclure_archives
+          AND (cle_recherche_eleve(ua.nom, ua.prenom, ua.email) LIKE v_motif
+               OR v_terme <% cle_recherche_eleve(ua.nom, ua.prenom, ua.email))
+    ) r
+    ORDER BY r.score DESC, r.nom, r.prenom, r.id
+    LIMIT p_limite;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ========================================
+-- MIGRATION : Compteurs de version par table (ETag / GET conditionnel)
+-- À exécuter sur votre base de données existante
+-- ========================================
+
+-- Un compteur par table, incrémenté à la validation de chaque transaction qui
+-- a modifié la table. Le backend en dérive les ETag de ses endpoints de
+-- lecture et répond 304 sans exécuter la requête quand rien n'a changé.
+--
+-- Le compteur est réparti sur plusieurs lignes (shard choisi par session) et
+-- n'est incrémenté qu'au COMMIT : les transactions concurrentes (saisie des
+-- validations) ne se sérialisent pas sur une ligne unique verrouillée jusqu'à
+-- leur fin. La version d'une table est la somme de ses lignes.
+CREATE TABLE IF NOT EXISTS versions_tables (
+    nom_table TEXT NOT NULL,
+    shard SMALLINT NOT NULL DEFAULT 0,
+    version BIGINT NOT NULL DEFAULT 0,
+    modifie_le TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (nom_table, shard)
+);
+
+-- Tables modifiées par chaque transaction en cours, publiées à sa validation
+CREATE UNLOGGED TABLE IF NOT EXISTS versions_tables_a_publier (
+    transaction_id BIGINT NOT NULL,
+    nom_table TEXT NOT NULL,
+    PRIMARY KEY (transaction_id, nom_table)
+);
+
+-- Déclencheur d'instruction : note la table, sans toucher aux compteurs partagés
+CREATE OR REPLACE FUNCTION marquer_version_table()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO versions_tables_a_publier (transaction_id, nom_table)
+    VALUES (txid_current(), TG_TABLE_NAME)
+    ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Déclencheur différé (COMMIT) : incrémente les compteurs des tables notées,
+-- dans l'ordre des noms (pas d'interblocage), sur le shard de la session.
+-- L'incrément devient visible en même temps que les données modifiées.
+CREATE OR REPLACE FUNCTION trg_publier_versions_tables()
+RETURNS TRIGGER AS $$
+BEGIN
+    WITH pris AS (
+        DELETE FROM versions_tables_a_publier
+        WHERE transaction_id = txid_current()
+        RETURNING nom_table
+    )
+    INSERT INTO versions_tables (nom_table, shard, version, modifie_le)
+    SELECT nom_table, pg_backend_pid() % 16, 1, CURRENT_TIMESTAMP
+    FROM pris
+    ORDER BY nom_table
+    ON CONFLICT (nom_table, shard) DO UPDATE
+    SET version = versions_tables.version + 1,
+        modifie_le = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_publier_versions_tables ON versions_tables_a_publier;
+CREATE CONSTRAINT TRIGGER trg_publier_versions_tables
+AFTER INSERT ON versions_tables_a_publier
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW EXECUTE FUNCTION trg_publier_versions_tables();
+
+DO $$
+DECLARE
+    v_table TEXT;
+BEGIN
+    FOREACH v_table IN ARRAY ARRAY[
+        'utilisateurs', 'competences', 'items', 'evaluations',
+        'evaluation_items', 'evaluation_attributions', 'validations',
+        'utilisateurs_archives'
+    ]
+    LOOP
+        INSERT INTO versions_tables (nom_table) VALUES (v_table)
+        ON CONFLICT DO NOTHING;
+
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_version_%s ON %I', v_table, v_table);
+        EXECUTE format(
+            'CREATE TRIGGER trg_version_%s
+             AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I
+             FOR EACH STATEMENT EXECUTE FUNCTION marquer_version_table()',
+            v_table, v_table
+        );
+    END LOOP;
+END $$;
+
+
+-- ========================================
+-- MIGRATION : Tâches de fond (imports Excel, passage de classe, exports)
+-- À exécuter sur votre base de données existante
+-- ========================================
+
+-- Une ligne par tâche : l'état survit au redémarrage des workers. Le fichier
+-- d'entrée (import) est stocké avec la tâche pour qu'un autre worker puisse la
+-- reprendre ; le fichier produit (export) l'est par morceaux dans jobs_fichiers.
+CREATE TABLE IF NOT EXISTS jobs (
+    id SERIAL PRIMARY KEY,
+    type VARCHAR(50) NOT NULL,
+    statut VARCHAR(20) NOT NULL DEFAULT 'en_attente'
+        CHECK (statut IN ('en_attente', 'en_cours', 'termine', 'echec')),
+    parametres JSONB NOT NULL DEFAULT '{}',
+    progression INTEGER NOT NULL DEFAULT 0 CHECK (progression BETWEEN 0 AND 100),
+    message TEXT,
+    resultat JSONB,
+    erreur TEXT,
+    fichier_entree BYTEA,
+    nom_fichier_resultat VARCHAR(255),
+    tentatives INTEGER NOT NULL DEFAULT 0,
+    worker VARCHAR(100),
+    request_id VARCHAR(64),
+    cree_le TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    demarre_le TIMESTAMP,
+    heartbeat_le TIMESTAMP,
+    termine_le TIMESTAMP
+);
+
+-- File d'attente (FIFO) et détection des tâches abandonnées par un worker arrêté
+CREATE INDEX IF NOT EXISTS idx_jobs_en_attente ON jobs(id) WHERE statut = 'en_attente';
+CREATE INDEX IF NOT EXISTS idx_jobs_en_cours ON jobs(heartbeat_le) WHERE statut = 'en_cours';
+CREATE INDEX IF NOT EXISTS idx_jobs_termine_le ON jobs(termine_le) WHERE termine_le IS NOT NULL;
+
+-- Un seul passage de classe en attente ou en cours (soumissions concurrentes : 409)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_passage_classe_actif ON jobs(type)
+    WHERE type = 'passage_classe' AND statut IN ('en_attente', 'en_cours');
+
+-- Fichier produit par une tâche, écrit et servi morceau par morceau (jamais
+-- entièrement en mémoire). Une nouvelle tentative repart de zéro.
+CREATE TABLE IF NOT EXISTS jobs_fichiers (
+    job_id INTEGER NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    numero INTEGER NOT NULL,
+    contenu BYTEA NOT NULL,
+    PRIMARY KEY (job_id, numero)
+);
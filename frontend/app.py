@@ -1,22 +1,123 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, render_template, request, jsonify, redirect, url_for, Response, g
 import requests
 from datetime import datetime
 import os, sys
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from flask_compress import Compress
+from backend_client import creer_session_backend, CacheEtag, identifiant_requete, demarrer_contexte, arreter_contexte, prefixe_request_id
+from metrics import instrumenter_app
 
 app = Flask(__name__)
 BACKEND_URL = os.getenv('BACKEND_URL', 'http://backend:5000')
 
+# Compression des pages et du JSON vers le navigateur ; les réponses déjà
+# compressées par le backend (Content-Encoding présent) sont laissées telles quelles
+app.config['COMPRESS_MIMETYPES'] = ['text/html', 'text/css', 'text/javascript',
+                                    'application/javascript', 'application/json', 'text/csv']
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_ALGORITHM_STREAMING'] = ['br', 'gzip']
+app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+Compress(app)
+
+# Latence par route, requêtes en cours et durée des appels au backend sur /metrics
+instrumenter_app(app)
+
+# Session partagée : connexions keep-alive réutilisées et timeouts par défaut
+backend = creer_session_backend(BACKEND_URL)
+
+# Identifiant de requête reçu (X-Request-ID) ou généré, transmis à chaque appel
+# backend ; Server-Timing détaille le temps passé ici, au backend et en SQL
+SERVER_TIMING = os.getenv('SERVER_TIMING', '1') == '1'
+
+@app.before_request
+def identifier_requete():
+    g.request_id = identifiant_requete(request.headers.get('X-Request-ID'))
+    g.contexte_backend, g.jeton_contexte_backend = demarrer_contexte(g.request_id)
+
+@app.after_request
+def entetes_requete(response):
+    contexte = g.get('contexte_backend')
+    if contexte is not None:
+        response.headers['X-Request-ID'] = contexte.request_id
+        if SERVER_TIMING:
+            for valeur in contexte.server_timing():
+                response.headers.add('Server-Timing', valeur)
+    return response
+
+@app.teardown_request
+def fin_contexte_requete(exception=None):
+    jeton = g.pop('jeton_contexte_backend', None)
+    if jeton is not None:
+        arreter_contexte(jeton)
+
+# Pool borné pour lancer en parallèle les appels indépendants d'une même page
+fanout = ThreadPoolExecutor(max_workers=int(os.getenv('FRONTEND_FANOUT_WORKERS', 8)),
+                            thread_name_prefix='fanout')
+
+# Réponses déjà reçues du backend, revalidées par ETag (304 = rien à retélécharger)
+cache_etag = CacheEtag(max_entrees=int(os.getenv('FRONTEND_ETAG_CACHE_SIZE', 256)))
+
 def get_backend_data(endpoint):
     try:
-        response = requests.get(f"{BACKEND_URL}{endpoint}")
-        return response.json() if response.status_code == 200 else []
+        en_cache = cache_etag.get(endpoint)
+        headers = {'If-None-Match': en_cache[0]} if en_cache else {}
+        response = backend.get(f"{BACKEND_URL}{endpoint}", headers=headers)
+        if response.status_code == 304 and en_cache:
+            return en_cache[1]
+        if response.status_code != 200:
+            return []
+        data = response.json()
+        if response.headers.get('ETag'):
+            cache_etag.put(endpoint, response.headers['ETag'], data)
+        return data
     except:
         return []
 
+# En-têtes de la réponse backend conservés quand le corps est relayé tel quel
+EN_TETES_RELAYES = ('Content-Type', 'Content-Encoding', 'Content-Length', 'Content-Disposition',
+                    'ETag', 'Cache-Control', 'Vary')
+
+def relayer_brut(response):
+    """
+    Relaie au navigateur la réponse du backend (requête faite avec stream=True)
+    sans décoder le corps : s'il est compressé, il repart compressé.
+    Un 304 est relayé tel quel (le navigateur réutilise sa copie).
+    """
+    def relayer():
+        try:
+            yield from response.raw.stream(64 * 1024, decode_content=False)
+        finally:
+            response.close()
+
+    relais = Response(relayer(), status=response.status_code, direct_passthrough=True)
+    for en_tete in EN_TETES_RELAYES:
+        if response.headers.get(en_tete):
+            relais.headers[en_tete] = response.headers[en_tete]
+    return relais
+
+def en_tetes_relais():
+    """En-têtes du navigateur à transmettre au backend (validation et compression)"""
+    return {en_tete: request.headers[en_tete]
+            for en_tete in ('If-None-Match', 'Accept-Encoding')
+            if request.headers.get(en_tete)}
+
+def get_backend_data_multiple(*endpoints):
+    """
+    Récupère plusieurs endpoints en parallèle, résultats dans l'ordre des endpoints.
+    Chaque appel reste isolé : un échec donne [] comme get_backend_data.
+    """
+    # Une copie du contexte par appel : identifiant de requête et cumul des durées suivent
+    contextes = [contextvars.copy_context() for _ in endpoints]
+    return list(fanout.map(lambda contexte, endpoint: contexte.run(get_backend_data, endpoint),
+                            contextes, endpoints))
+
 @app.route('/')
 def index():
-    utilisateurs = get_backend_data('/api/utilisateurs')
-    evaluations_data = get_backend_data('/api/evaluations')
+    utilisateurs, evaluations_data = get_backend_data_multiple(
+        '/api/utilisateurs',
+        '/api/evaluations',
+    )
     return render_template('index.html', 
                         utilisateurs=utilisateurs,
                         evaluations=evaluations_data)
@@ -42,9 +143,11 @@ def bilan_final():
 
 @app.route('/evaluations')
 def evaluations():
-    evaluations_data = get_backend_data('/api/evaluations')
-    competences = get_backend_data('/api/competences')
-    items = get_backend_data('/api/items')
+    evaluations_data, competences, items = get_backend_data_multiple(
+        '/api/evaluations',
+        '/api/competences',
+        '/api/items',
+    )
     return render_template('evaluations.html', 
                          evaluations=evaluations_data,
                          competences=competences,
@@ -62,7 +165,7 @@ def creer_evaluation():
     print(f"🔍 Création évaluation - Données: {data}", flush=True)  # Debug
 
     try:
-        response = requests.post(f"{BACKEND_URL}/api/evaluations", json=data)
+        response = backend.post(f"{BACKEND_URL}/api/evaluations", json=data)
         if response.status_code == 201:
             return redirect(url_for('evaluations'))
     except:
@@ -74,26 +177,17 @@ def creer_evaluation():
 def detail_evaluation(evaluation_id):
     print(f"🔍 DETAIL EVALUATION - ID: {evaluation_id}")
     
-    evaluation_data = get_backend_data(f'/api/evaluations/{evaluation_id}')
-    
-    # Récupérer les attributions
-    attributions = get_backend_data(f'/api/evaluations/{evaluation_id}/attributions')
+    # Un seul appel : toutes les données de l'écran, lues dans le même instantané
+    bundle = get_backend_data(f'/api/evaluations/{evaluation_id}/bundle?referentiel=1') or {}
+    evaluation_data = {'evaluation': bundle.get('evaluation', {}), 'items': bundle.get('items', [])}
+    attributions = bundle.get('attributions', [])
+    utilisateurs_concernes = bundle.get('utilisateurs_concernes', [])
+    tous_utilisateurs = bundle.get('tous_utilisateurs', [])
+    validations = bundle.get('validations', [])
+    tous_items = bundle.get('tous_items', [])
+    competences = bundle.get('competences', [])
     print(f"🔍 Attributions récupérées: {len(attributions)}")
-    
-    # Récupérer les utilisateurs CONCERNÉS par cette évaluation
-    utilisateurs_concernes = get_backend_data(f'/api/evaluations/{evaluation_id}/utilisateurs-concernes')
     print(f"🔍 Utilisateurs concernés: {len(utilisateurs_concernes)}")
-    
-    # Récupérer tous les utilisateurs (pour le formulaire d'attribution)
-    tous_utilisateurs = get_backend_data('/api/utilisateurs')
-    
-    validations = get_backend_data(f'/api/evaluations/{evaluation_id}/validations')
-    
-    # Récupérer tous les items disponibles
-    tous_items = get_backend_data('/api/items')
-    
-    # Récupérer les compétences depuis le backend
-    competences = get_backend_data('/api/competences')
     print(f"🔍 Compétences récupérées: {len(competences)}")
 
     return render_template('detail_evaluation.html',
@@ -109,28 +203,26 @@ def detail_evaluation(evaluation_id):
 @app.route('/api/evaluations/<int:evaluation_id>/utilisateurs-concernes')
 def get_utilisateurs_concernes(evaluation_id):
     try:
-        response = requests.get(f"{BACKEND_URL}/api/evaluations/{evaluation_id}/utilisateurs-concernes")
+        response = backend.get(f"{BACKEND_URL}/api/evaluations/{evaluation_id}/utilisateurs-concernes")
         return jsonify(response.json()), response.status_code
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/valider/<int:evaluation_id>/<int:utilisateur_id>')
 def page_validation(evaluation_id, utilisateur_id):
-    evaluation_data = get_backend_data(f'/api/evaluations/{evaluation_id}')
-    utilisateur = next((u for u in get_backend_data('/api/utilisateurs') if u['id'] == utilisateur_id), {})
-    validations = get_backend_data(f'/api/utilisateurs/{utilisateur_id}/validations?evaluation_id={evaluation_id}')
+    fiche = get_backend_data(f'/api/evaluations/{evaluation_id}/fiche/{utilisateur_id}') or {}
     
     return render_template('validation.html',
-                         evaluation=evaluation_data.get('evaluation', {}),
-                         items=evaluation_data.get('items', []),
-                         utilisateur=utilisateur,
-                         validations=validations)
+                         evaluation=fiche.get('evaluation', {}),
+                         items=fiche.get('items', []),
+                         utilisateur=fiche.get('utilisateur', {}),
+                         validations=fiche.get('validations', []))
 
 @app.route('/api/valider-multiple', methods=['POST'])
 def valider_multiples():
     data = request.get_json()
     try:
-        response = requests.post(f"{BACKEND_URL}/api/valider-multiple", json=data)
+        response = backend.post(f"{BACKEND_URL}/api/valider-multiple", json=data)
         return jsonify(response.json()), response.status_code
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -148,7 +240,7 @@ def valider_item():
     }
     
     try:
-        response = requests.post(f"{BACKEND_URL}/api/validations", json=data)
+        response = backend.post(f"{BACKEND_URL}/api/validations", json=data)
         if response.status_code == 200:
             return redirect(url_for('page_validation', 
                                   evaluation_id=data['evaluation_id'],
@@ -177,7 +269,7 @@ def ajouter_utilisateur():
         }
 
     try:
-        response = requests.post(f"{BACKEND_URL}/api/utilisateurs", json=data)
+        response = backend.post(f"{BACKEND_URL}/api/utilisateurs", json=data)
         if response.status_code == 201:
             return jsonify({'id': response.json().get('id')})
         else:
@@ -206,7 +298,7 @@ def modifier_utilisateur_route():
             'specialite': request.form.get('specialite', '')
         }
 
-        response = requests.put(f"{BACKEND_URL}/api/utilisateurs/{user_id}", json=data)
+        response = backend.put(f"{BACKEND_URL}/api/utilisateurs/{user_id}", json=data)
         if response.status_code == 200:
             return jsonify({'success': True})
         else:
@@ -229,7 +321,7 @@ def supprimer_utilisateur_route():
             return jsonify({'error': 'ID utilisateur manquant'}), 400
 
         # Envoi de la requête DELETE vers le backend
-        response = requests.delete(f"{BACKEND_URL}/api/utilisateurs/{user_id}")
+        response = backend.delete(f"{BACKEND_URL}/api/utilisateurs/{user_id}")
 
         if response.status_code == 200:
             return jsonify({'success': True})
@@ -246,7 +338,7 @@ def import_utilisateurs():
     print("🔍 Frontend: Réception demande d'import")
 
     if 'file' not in request.files:
-        print("❌ Frontend: Aucun fichier dans la requête")
+        print(f"{prefixe_request_id()}❌ Frontend: Aucun fichier dans la requête")
         return jsonify({'success': False, 'error': 'Aucun fichier reçu'}), 400
 
     file = request.files['file']
@@ -258,21 +350,22 @@ def import_utilisateurs():
             'file': (file.filename, file.stream, file.content_type)
         }
         
-        print(f"📤 Frontend: Envoi vers backend - {BACKEND_URL}/api/utilisateurs/import-excel")
+        # Import exécuté en tâche de fond : le backend répond tout de suite (202 + job_id),
+        # le navigateur suit ensuite /api/jobs/<id>
+        print(f"📤 Frontend: Envoi vers backend - {BACKEND_URL}/api/jobs/import-utilisateurs")
         
-        response = requests.post(
-            f"{BACKEND_URL}/api/utilisateurs/import-excel",
-            files=files,
-            timeout=30  # Timeout de 30 secondes
+        response = backend.post(
+            f"{BACKEND_URL}/api/jobs/import-utilisateurs",
+            files=files
         )
         
         print(f"📥 Frontend: Réponse backend - Status: {response.status_code}")
         print(f"📥 Frontend: Contenu réponse: {response.text[:500]}...")
 
         # Répercuter la réponse du backend vers le frontend
-        if response.status_code == 200:
+        if response.status_code in (200, 202):
             result = response.json()
-            return jsonify(result)
+            return jsonify(result), response.status_code
         else:
             try:
                 error_data = response.json()
@@ -295,7 +388,7 @@ def import_utilisateurs():
             'error': 'Impossible de se connecter au backend'
         }), 500
     except Exception as e:
-        print(f"❌ Frontend: Erreur inattendue: {str(e)}")
+        print(f"{prefixe_request_id()}❌ Frontend: Erreur inattendue: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/referentiel')
@@ -316,7 +409,7 @@ def referentiel():
 def proxy_attribuer_evaluation():
     data = request.get_json()
     try:
-        response = requests.post(f"{BACKEND_URL}/api/attribuer-evaluation", json=data)
+        response = backend.post(f"{BACKEND_URL}/api/attribuer-evaluation", json=data)
         return jsonify(response.json()), response.status_code
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -325,7 +418,7 @@ def proxy_attribuer_evaluation():
 def retirer_attribution():
     data = request.get_json()
     try:
-        response = requests.post(f"{BACKEND_URL}/api/retirer-attribution", json=data)
+        response = backend.post(f"{BACKEND_URL}/api/retirer-attribution", json=data)
         return jsonify(response.json()), response.status_code
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -334,7 +427,7 @@ def retirer_attribution():
 def modifier_evaluation():
     data = request.get_json()
     try:
-        response = requests.post(f"{BACKEND_URL}/api/modifier-evaluation", json=data)
+        response = backend.post(f"{BACKEND_URL}/api/modifier-evaluation", json=data)
         return jsonify(response.json()), response.status_code
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -343,7 +436,7 @@ def modifier_evaluation():
 def supprimer_evaluation():
     data = request.get_json()
     try:
-        response = requests.post(f"{BACKEND_URL}/api/supprimer-evaluation", json=data)
+        response = backend.post(f"{BACKEND_URL}/api/supprimer-evaluation", json=data)
         return jsonify(response.json()), response.status_code
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -351,7 +444,7 @@ def supprimer_evaluation():
 @app.route('/api/evaluations/<int:evaluation_id>/attributions')
 def get_attributions_evaluation(evaluation_id):
     try:
-        response = requests.get(f"{BACKEND_URL}/api/evaluations/{evaluation_id}/attributions")
+        response = backend.get(f"{BACKEND_URL}/api/evaluations/{evaluation_id}/attributions")
         return jsonify(response.json()), response.status_code
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -360,7 +453,7 @@ def get_attributions_evaluation(evaluation_id):
 def ajouter_items_evaluation():
     data = request.get_json()
     try:
-        response = requests.post(f"{BACKEND_URL}/api/ajouter-items-evaluation", json=data)
+        response = backend.post(f"{BACKEND_URL}/api/ajouter-items-evaluation", json=data)
         return jsonify(response.json()), response.status_code
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -369,7 +462,7 @@ def ajouter_items_evaluation():
 def retirer_item_evaluation():
     data = request.get_json()
     try:
-        response = requests.post(f"{BACKEND_URL}/api/retirer-item-evaluation", json=data)
+        response = backend.post(f"{BACKEND_URL}/api/retirer-item-evaluation", json=data)
         return jsonify(response.json()), response.status_code
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -381,13 +474,22 @@ def get_user_profile_proxy(user_id):
         #response = requests.get(f"{BACKEND_URL}/api/utilisateur/{user_id}/profil")
         backend_url = f"{BACKEND_URL}/api/utilisateur/{user_id}/profil"
         app.logger.info(f"📡 Appel backend: {backend_url}")
-        response = requests.get(backend_url, timeout=10)
+        response = backend.get(backend_url, timeout=10)
         print(f"🔍 Récupération profil utilisateur ID: {user_id}", flush=True)
         app.logger.info(f"📥 Réponse backend - Status: {response.status_code}")
         return jsonify(response.json()), response.status_code
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/classes/<classe>/profils', methods=['GET'])
+def get_profils_classe_proxy(classe):
+    """Proxy vers le backend pour récupérer les profils de toute une classe"""
+    try:
+        response = backend.get(f"{BACKEND_URL}/api/classes/{classe}/profils", timeout=30)
+        return jsonify(response.json()), response.status_code
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
  # À ajouter dans votre app.py FRONTEND après vos routes existantes
 
 # ===== ROUTES PASSAGE DE CLASSE (PROXY VERS BACKEND) =====
@@ -401,7 +503,7 @@ def passage_classe():
 def proxy_preview_passage_classe():
     """Proxy - Aperçu des passages de classe"""
     try:
-        response = requests.get(f"{BACKEND_URL}/api/passage-classe/preview")
+        response = backend.get(f"{BACKEND_URL}/api/passage-classe/preview")
         return jsonify(response.json()), response.status_code
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -410,11 +512,49 @@ def proxy_preview_passage_classe():
 def proxy_passage_avec_archivage():
     """Proxy - Archive Terminales et passe Première en Terminale"""
     try:
-        response = requests.post(f"{BACKEND_URL}/api/passage-classe/passage-avec-archivage")
+        response = backend.post(f"{BACKEND_URL}/api/passage-classe/passage-avec-archivage", timeout=(3.05, 120))
+        return jsonify(response.json()), response.status_code
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# ===== TÂCHES DE FOND =====
+@app.route('/api/jobs/passage-classe', methods=['POST'])
+def proxy_job_passage_classe():
+    """Proxy - Soumet le passage de classe (tâche de fond)"""
+    try:
+        response = backend.post(f"{BACKEND_URL}/api/jobs/passage-classe")
         return jsonify(response.json()), response.status_code
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/jobs/export-archives', methods=['POST'])
+def proxy_job_export_archives():
+    """Proxy - Soumet l'export CSV des archives (tâche de fond)"""
+    try:
+        response = backend.post(f"{BACKEND_URL}/api/jobs/export-archives", json=request.get_json(silent=True) or {})
+        return jsonify(response.json()), response.status_code
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def proxy_get_job(job_id):
+    """Proxy - État et progression d'une tâche"""
+    try:
+        response = backend.get(f"{BACKEND_URL}/api/jobs/{job_id}")
+        return jsonify(response.json()), response.status_code
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<int:job_id>/resultat', methods=['GET'])
+def proxy_resultat_job(job_id):
+    """Proxy - Fichier produit par une tâche (relayé sans mise en mémoire)"""
+    try:
+        response = backend.get(f"{BACKEND_URL}/api/jobs/{job_id}/resultat",
+                               headers=en_tetes_relais(), stream=True)
+        return relayer_brut(response)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/passage-classe/archives', methods=['GET'])
 def proxy_get_archives():
     """Proxy - Liste des élèves archivés"""
@@ -429,8 +569,12 @@ def proxy_get_archives():
         }
         if annee:
             params['annee'] = annee
+        # Pagination par clé et mode de calcul du total, relayés tels quels
+        for param in ('cursor', 'total'):
+            if request.args.get(param):
+                params[param] = request.args.get(param)
         
-        response = requests.get(
+        response = backend.get(
             f"{BACKEND_URL}/api/passage-classe/archives",
             params=params
         )
@@ -442,8 +586,9 @@ def proxy_get_archives():
 def proxy_stats_archives():
     """Proxy - Statistiques des archives"""
     try:
-        response = requests.get(f"{BACKEND_URL}/api/passage-classe/archives/stats")
-        return jsonify(response.json()), response.status_code
+        response = backend.get(f"{BACKEND_URL}/api/passage-classe/archives/stats",
+                               headers=en_tetes_relais(), stream=True)
+        return relayer_brut(response)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -452,7 +597,7 @@ def proxy_rechercher_archives():
     """Proxy - Recherche dans les archives"""
     try:
         q = request.args.get('q', '')
-        response = requests.get(
+        response = backend.get(
             f"{BACKEND_URL}/api/passage-classe/archives/search",
             params={'q': q}
         )
@@ -460,11 +605,23 @@ def proxy_rechercher_archives():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/recherche/eleves', methods=['GET'])
+def proxy_rechercher_eleves():
+    """Proxy - Recherche unifiée élèves actifs et archivés"""
+    try:
+        response = backend.get(
+            f"{BACKEND_URL}/api/recherche/eleves",
+            params=request.args
+        )
+        return jsonify(response.json()), response.status_code
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/passage-classe/archives/<int:archive_id>', methods=['GET'])
 def proxy_archive_detail(archive_id):
     """Proxy - Détails d'un élève archivé"""
     try:
-        response = requests.get(
+        response = backend.get(
             f"{BACKEND_URL}/api/passage-classe/archives/{archive_id}"
         )
         return jsonify(response.json()), response.status_code
@@ -475,7 +632,7 @@ def proxy_archive_detail(archive_id):
 def proxy_restaurer_archive(archive_id):
     """Proxy - Restaure un élève archivé"""
     try:
-        response = requests.post(
+        response = backend.post(
             f"{BACKEND_URL}/api/passage-classe/archives/{archive_id}/restaurer"
         )
         return jsonify(response.json()), response.status_code
@@ -484,32 +641,27 @@ def proxy_restaurer_archive(archive_id):
 
 @app.route('/api/passage-classe/archives/export', methods=['GET'])
 def proxy_export_archives():
-    """Proxy - Export CSV des archives"""
+    """Proxy - Export CSV des archives (relayé au fil de l'eau, sans mise en mémoire)"""
     try:
         annee = request.args.get('annee')
         params = {}
         if annee:
             params['annee'] = annee
         
-        response = requests.get(
+        response = backend.get(
             f"{BACKEND_URL}/api/passage-classe/archives/export",
             params=params,
+            headers=en_tetes_relais(),
             stream=True
         )
         
-        # Créer une réponse avec le même contenu
-        from flask import Response
-        
+        # Corps relayé au fil de l'eau et sans décompression (gzip/br du backend)
         filename = f"archives_diplomes_{annee if annee else 'all'}.csv"
-        
-        return Response(
-            response.iter_content(chunk_size=1024),
-            mimetype='text/csv',
-            headers={
-                'Content-Disposition': f'attachment; filename={filename}',
-                'Content-Type': 'text/csv; charset=utf-8'
-            }
-        )
+        relais = relayer_brut(response)
+        relais.headers['Content-Disposition'] = f'attachment; filename={filename}'
+        if 'Content-Type' not in relais.headers:
+            relais.headers['Content-Type'] = 'text/csv; charset=utf-8'
+        return relais
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -517,7 +669,7 @@ def proxy_export_archives():
 def proxy_historique_utilisateur(utilisateur_id):
     """Proxy - Historique complet d'un élève"""
     try:
-        response = requests.get(
+        response = backend.get(
             f"{BACKEND_URL}/api/passage-classe/historique/{utilisateur_id}"
         )
         return jsonify(response.json()), response.status_code
@@ -528,7 +680,7 @@ def proxy_historique_utilisateur(utilisateur_id):
 def proxy_test_passage_classe():
     """Proxy - Test de connexion"""
     try:
-        response = requests.get(f"{BACKEND_URL}/api/passage-classe/test")
+        response = backend.get(f"{BACKEND_URL}/api/passage-classe/test")
         return jsonify(response.json()), response.status_code
     except Exception as e:
         return jsonify({
@@ -0,0 +1,205 @@
+import contextvars
+import os
+import re
+import threading
+import time
+import uuid
+import requests
+from collections import OrderedDict
+from metrics import mesurer_appel_backend
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import EmptyPoolError
+
+
+# Identifiant accepté du navigateur/proxy s'il est court et sans caractère
+# spécial (le backend le recopie dans des commentaires SQL)
+REQUEST_ID_VALIDE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+def identifiant_requete(valeur):
+    """Identifiant reçu s'il est valide, sinon un nouvel identifiant"""
+    return valeur if valeur and REQUEST_ID_VALIDE.match(valeur) else uuid.uuid4().hex[:16]
+
+
+class ContexteRequete:
+    """
+    Requête du navigateur en cours : identifiant transmis au backend et cumul
+    des appels backend (durées, détail Server-Timing renvoyé par le backend).
+    Partagé avec les threads de fan-out (voir contextvars.copy_context).
+    """
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.debut = time.perf_counter()
+        self.appels = 0
+        self.duree_ms = 0.0
+        self.timings_backend = {}
+        self._lock = threading.Lock()
+
+    def enregistrer_appel(self, duree_ms, server_timing=None):
+        with self._lock:
+            self.appels += 1
+            self.duree_ms += duree_ms
+            for nom, duree in lire_server_timing(server_timing):
+                self.timings_backend[nom] = self.timings_backend.get(nom, 0.0) + duree
+
+    def server_timing(self):
+        """Valeurs Server-Timing du frontend : total, appels backend et détail backend"""
+        total_ms = (time.perf_counter() - self.debut) * 1000
+        with self._lock:
+            valeurs = [f'app;dur={total_ms:.1f}',
+                       f'backend;dur={self.duree_ms:.1f};desc="{self.appels} appel(s)"']
+            valeurs += [f'backend-{nom};dur={duree:.1f}' for nom, duree in self.timings_backend.items()]
+        return valeurs
+
+
+def lire_server_timing(valeur):
+    """(nom, durée) de chaque entrée d'un en-tête Server-Timing"""
+    if not valeur:
+        return
+    for entree in valeur.split(','):
+        nom, *parametres = [partie.strip() for partie in entree.split(';')]
+        for parametre in parametres:
+            if parametre.startswith('dur='):
+                try:
+                    yield nom, float(parametre[4:])
+                except ValueError:
+                    pass
+
+
+_contexte_requete = contextvars.ContextVar('contexte_requete', default=None)
+
+
+def demarrer_contexte(request_id):
+    """Active le contexte de la requête courante ; renvoie (contexte, jeton)"""
+    contexte = ContexteRequete(request_id)
+    return contexte, _contexte_requete.set(contexte)
+
+
+def arreter_contexte(jeton):
+    _contexte_requete.reset(jeton)
+
+
+def prefixe_request_id():
+    """Préfixe '[req=<id>] ' des messages d'erreur (vide hors requête)"""
+    contexte = _contexte_requete.get()
+    return f"[req={contexte.request_id}] " if contexte is not None else ''
+
+
+class AttenteBornee:
+    """
+    Mixin pour les pools urllib3 : sans délai explicite, l'attente d'une
+    connexion libre (pool_block=True) est bornée à attente_max secondes au
+    lieu d'être infinie (le timeout de lecture ne couvre pas cette attente).
+    """
+    attente_max = None
+
+    def _get_conn(self, timeout=None):
+        return super()._get_conn(timeout=self.attente_max if timeout is None else timeout)
+
+
+class AdaptateurBackend(HTTPAdapter):
+    """HTTPAdapter dont les pools attendent au plus attente_pool secondes une connexion libre"""
+
+    def __init__(self, attente_pool=10, **kwargs):
+        self.attente_pool = attente_pool
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: type(classe.__name__, (AttenteBornee, classe), {'attente_max': self.attente_pool})
+            for scheme, classe in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+    def send(self, request, **kwargs):
+        try:
+            return super().send(request, **kwargs)
+        except EmptyPoolError as e:
+            # Pool saturé : même traitement qu'un backend qui ne répond pas à temps
+            raise requests.exceptions.ConnectTimeout(e, request=request)
+
+
+class BackendSession(requests.Session):
+    """
+    Session HTTP partagée vers le backend.
+
+    Les connexions TCP sont conservées (keep-alive) et réutilisées d'un appel
+    à l'autre ; chaque requête reçoit un timeout (connexion, lecture) par
+    défaut si l'appelant n'en précise pas, et porte l'identifiant X-Request-ID
+    de la requête du navigateur en cours.
+    """
+
+    def __init__(self, pool_size=20, connect_timeout=3.05, read_timeout=30, pool_timeout=10):
+        super().__init__()
+        self.pool_size = pool_size
+        self.pool_timeout = pool_timeout
+        self.timeout = (connect_timeout, read_timeout)
+        # Pas de compression sur le réseau interne pour les données consommées
+        # ici ; les routes relais transmettent l'Accept-Encoding du navigateur
+        self.headers['Accept-Encoding'] = 'identity'
+
+        # pool_block=True : au-delà de pool_size, on attend une connexion libre
+        # (au plus pool_timeout secondes) plutôt que d'ouvrir des connexions jetables
+        adapter = AdaptateurBackend(attente_pool=pool_timeout, pool_connections=1,
+                                    pool_maxsize=pool_size, pool_block=True)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        contexte = _contexte_requete.get()
+        if contexte is None:
+            return mesurer_appel_backend(
+                method, url, lambda: super(BackendSession, self).request(method, url, *args, **kwargs))
+
+        kwargs['headers'] = {**(kwargs.get('headers') or {}), 'X-Request-ID': contexte.request_id}
+        debut = time.perf_counter()
+        response = None
+        try:
+            response = mesurer_appel_backend(
+                method, url, lambda: super(BackendSession, self).request(method, url, *args, **kwargs))
+            return response
+        finally:
+            contexte.enregistrer_appel((time.perf_counter() - debut) * 1000,
+                                       response.headers.get('Server-Timing') if response is not None else None)
+
+
+class CacheEtag:
+    """
+    Dernière réponse JSON reçue par endpoint, avec son ETag.
+
+    Permet de renvoyer If-None-Match au backend et de réutiliser le JSON
+    déjà décodé quand il répond 304. Taille bornée (LRU).
+    """
+
+    def __init__(self, max_entrees=256):
+        self.max_entrees = max_entrees
+        self._entrees = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cle):
+        with self._lock:
+            entree = self._entrees.get(cle)
+            if entree is not None:
+                self._entrees.move_to_end(cle)
+            return entree
+
+    def put(self, cle, etag, data):
+        with self._lock:
+            self._entrees[cle] = (etag, data)
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.max_entrees:
+                self._entrees.popitem(last=False)
+
+
+def creer_session_backend(base_url):
+    """Construit la session à partir des variables d'environnement BACKEND_*"""
+    session = BackendSession(
+        pool_size=int(os.getenv('BACKEND_POOL_SIZE', 20)),
+        connect_timeout=float(os.getenv('BACKEND_CONNECT_TIMEOUT', 3.05)),
+        read_timeout=float(os.getenv('BACKEND_READ_TIMEOUT', 30)),
+        pool_timeout=float(os.getenv('BACKEND_POOL_TIMEOUT', 10)),
+    )
+    print(f"✅ Session backend prête ({base_url}, pool={session.pool_size}, timeout={session.timeout})")
+    return session
@@ -0,0 +1,305 @@
+"""
+Test de charge de bout en bout (navigateur → frontend → backend → PostgreSQL).
+
+Des utilisateurs virtuels (un thread et une session HTTP chacun, comme un
+navigateur) rejouent en boucle des parcours réalistes contre les deux
+applications lancées en local :
+    - correction : ouvre le détail d'une évaluation, puis pour quelques élèves
+      la fiche /valider/<eval>/<élève> et enregistre la grille via
+      /api/valider-multiple ;
+    - bilan : ouvre un bilan (intermédiaire ou final) et consulte des profils ;
+    - archives : page de passage de classe, statistiques et export CSV.
+
+Les identifiants (évaluations, items, élèves concernés) sont découverts au
+démarrage auprès du backend. En fin de test : débit, latences p50/p95/p99
+et taux d'erreur par route, affichés et écrits en JSON.
+
+Usage (depuis frontend/) :
+    python benchmarks/charge_parcours.py --frontend http://localhost --backend http://localhost:5000 \\
+        --utilisateurs 12 --duree 60 --melange correction=6,bilan=3,archives=1
+Attention : les parcours de correction écrivent des validations dans la base visée.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import requests
+
+
+class Mesures:
+    """Échantillons (route, statut, durée, erreur) partagés par les threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.echantillons = []
+        self.parcours = defaultdict(int)
+
+    def ajouter(self, route, statut, duree, erreur, octets):
+        with self._lock:
+            self.echantillons.append((route, statut, duree, erreur, octets))
+
+    def parcours_termine(self, nom):
+        with self._lock:
+            self.parcours[nom] += 1
+
+
+def percentile(valeurs_triees, p):
+    """Percentile au rang le plus proche"""
+    if not valeurs_triees:
+        return None
+    rang = max(0, min(len(valeurs_triees) - 1, int(-(-p * len(valeurs_triees) // 100)) - 1))
+    return valeurs_triees[rang]
+
+
+class UtilisateurVirtuel(threading.Thread):
+
+    def __init__(self, numero, config, catalogue, mesures, fin, depart):
+        super().__init__(name=f"uv-{numero}", daemon=True)
+        self.config = config
+        self.catalogue = catalogue
+        self.mesures = mesures
+        self.fin = fin
+        self.depart = depart
+        self.rng = random.Random(config.graine + numero)
+        self.session = requests.Session()
+
+    # ===== Requêtes mesurées =====
+
+    def appeler(self, methode, route, chemin, verifier_json=False, **kwargs):
+        """Requête complète (corps lu jusqu'au bout) ; route = gabarit pour l'agrégation"""
+        debut = time.perf_counter()
+        erreur = None
+        statut = None
+        octets = 0
+        try:
+            response = self.session.request(methode, self.config.frontend + chemin,
+                                            timeout=self.config.timeout, **kwargs)
+            statut = response.status_code
+            octets = len(response.content)
+            if statut >= 400:
+                erreur = f"HTTP {statut}"
+            elif verifier_json and not response.json().get('success'):
+                erreur = f"success=false: {response.text[:200]}"
+        except Exception as e:
+            erreur = f"{type(e).__name__}: {str(e)[:200]}"
+        self.mesures.ajouter(f"{methode} {route}", statut, time.perf_counter() - debut, erreur, octets)
+        return erreur is None
+
+    def pause(self):
+        """Temps de réflexion de l'utilisateur entre deux actions"""
+        if self.config.pensee_max > 0:
+            self.fin.wait(self.rng.uniform(self.config.pensee_min, self.config.pensee_max))
+
+    # ===== Parcours =====
+
+    def parcours_correction(self):
+        evaluation = self.rng.choice(self.catalogue['evaluations'])
+        eid = evaluation['id']
+        self.appeler('GET', '/evaluation/<evaluation_id>', f"/evaluation/{eid}")
+        eleves = self.rng.sample(evaluation['eleves'], min(len(evaluation['eleves']), self.rng.randint(1, 3)))
+        for uid in eleves:
+            if self.fin.is_set():
+                return
+            self.pause()
+            self.appeler('GET', '/valider/<evaluation_id>/<utilisateur_id>', f"/valider/{eid}/{uid}")
+            self.pause()
+            # Grille saisie comme dans validation.js : seuls les niveaux non nuls sont envoyés
+            validations = [{
+                'item_id': item_id,
+                'niveau_validation': self.rng.randint(1, 4),
+                'commentaire': self.rng.choice(('', '', 'Travail soigné', 'À revoir : justification')),
+            } for item_id in evaluation['items'] if self.rng.random() < 0.8]
+            if validations:
+                self.appeler('POST', '/api/valider-multiple', '/api/valider-multiple', verifier_json=True,
+                             json={'utilisateur_id': uid, 'evaluation_id': eid, 'validations': validations})
+
+    def parcours_bilan(self):
+        page = self.rng.choice(('/bilan-intermediaire', '/bilan-final'))
+        self.appeler('GET', page, page)
+        for uid in self.rng.sample(self.catalogue['eleves'], min(len(self.catalogue['eleves']), self.rng.randint(1, 4))):
+            if self.fin.is_set():
+                return
+            self.pause()
+            self.appeler('GET', '/api/utilisateur/<user_id>/profil', f"/api/utilisateur/{uid}/profil")
+
+    def parcours_archives(self):
+        self.appeler('GET', '/passage-classe', '/passage-classe')
+        self.appeler('GET', '/api/passage-classe/archives/stats', '/api/passage-classe/archives/stats')
+        self.pause()
+        self.appeler('GET', '/api/passage-classe/archives/export', '/api/passage-classe/archives/export')
+
+    def run(self):
+        if self.fin.wait(self.depart):
+            return
+        noms = list(self.config.melange)
+        poids = [self.config.melange[nom] for nom in noms]
+        while not self.fin.is_set():
+            nom = self.rng.choices(noms, weights=poids)[0]
+            getattr(self, f"parcours_{nom}")()
+            self.mesures.parcours_termine(nom)
+            self.pause()
+        self.session.close()
+
+
+def decouvrir(backend, max_evaluations, timeout):
+    """Évaluations (items + élèves concernés) et élèves, lus directement au backend"""
+    session = requests.Session()
+    evaluations = []
+    for evaluation in session.get(f"{backend}/api/evaluations", timeout=timeout).json()[:max_evaluations]:
+        bundle = session.get(f"{backend}/api/evaluations/{evaluation['id']}/bundle", timeout=timeout).json()
+        items = [item['id'] for item in bundle.get('items', [])]
+        eleves = [u['id'] for u in bundle.get('utilisateurs_concernes', [])]
+        if items and eleves:
+            evaluations.append({'id': evaluation['id'], 'items': items, 'eleves': eleves})
+    eleves = [u['id'] for u in session.get(f"{backend}/api/utilisateurs", timeout=timeout).json()]
+    session.close()
+    if not evaluations or not eleves:
+        raise RuntimeError("Aucune évaluation attribuée ou aucun élève : rien à rejouer")
+    return {'evaluations': evaluations, 'eleves': eleves}
+
+
+def rapport(mesures, duree):
+    par_route = defaultdict(list)
+    for echantillon in mesures.echantillons:
+        par_route[echantillon[0]].append(echantillon)
+
+    def resume(echantillons):
+        durees = sorted(e[2] * 1000 for e in echantillons)
+        erreurs = sum(1 for e in echantillons if e[3])
+        return {
+            'requetes': len(echantillons),
+            'debit_rps': round(len(echantillons) / duree, 2),
+            'erreurs': erreurs,
+            'taux_erreur': round(erreurs / len(echantillons), 4) if echantillons else 0,
+            'p50_ms': round(percentile(durees, 50), 1),
+            'p95_ms': round(percentile(durees, 95), 1),
+            'p99_ms': round(percentile(durees, 99), 1),
+            'max_ms': round(durees[-1], 1),
+            'octets_moyens': int(sum(e[4] for e in echantillons) / len(echantillons)),
+        }
+
+    exemples_erreurs = defaultdict(int)
+    for route, _, _, erreur, _ in mesures.echantillons:
+        if erreur:
+            exemples_erreurs[f"{route} → {erreur}"] += 1
+
+    return {
+        'duree_s': round(duree, 2),
+        'global': resume(mesures.echantillons) if mesures.echantillons else {},
+        'parcours': dict(mesures.parcours),
+        'routes': {route: resume(echantillons) for route, echantillons in sorted(par_route.items())},
+        'erreurs': dict(sorted(exemples_erreurs.items(), key=lambda e: -e[1])[:20]),
+    }
+
+
+def afficher(resultats):
+    print(f"\n{'route':<52}{'req':>7}{'req/s':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'erreurs':>9}")
+    lignes = list(resultats['routes'].items()) + [('TOTAL', resultats['global'])]
+    for route, stats in lignes:
+        print(f"{route:<52}{stats['requetes']:>7}{stats['debit_rps']:>8.1f}"
+              f"{stats['p50_ms']:>7.0f}ms{stats['p95_ms']:>7.0f}ms{stats['p99_ms']:>7.0f}ms"
+              f"{stats['taux_erreur'] * 100:>8.1f}%")
+    print(f"Parcours terminés: {resultats['parcours']}")
+    for message, nombre in resultats['erreurs'].items():
+        print(f"  ❌ {nombre} × {message}")
+
+
+def commit_git():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def lire_melange(texte):
+    melange = {}
+    for partie in texte.split(','):
+        nom, _, poids = partie.partition('=')
+        nom = nom.strip()
+        if not hasattr(UtilisateurVirtuel, f"parcours_{nom}"):
+            raise argparse.ArgumentTypeError(f"Parcours inconnu: {nom}")
+        melange[nom] = float(poids or 1)
+    return melange
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--frontend', default=os.getenv('FRONTEND_URL', 'http://localhost'))
+    parser.add_argument('--backend', default=os.getenv('BACKEND_URL', 'http://localhost:5000'),
+                        help="utilisé seulement pour découvrir les identifiants")
+    parser.add_argument('--utilisateurs', type=int, default=12, help="utilisateurs virtuels simultanés")
+    parser.add_argument('--duree', type=float, default=60, help="durée du test en secondes")
+    parser.add_argument('--montee', type=float, default=5, help="délai d'arrivée de tous les utilisateurs (s)")
+    parser.add_argument('--pensee-min', type=float, default=0.5)
+    parser.add_argument('--pensee-max', type=float, default=2.0, help="0 : enchaînement sans pause")
+    parser.add_argument('--melange', type=lire_melange, default=lire_melange('correction=6,bilan=3,archives=1'))
+    parser.add_argument('--max-evaluations', type=int, default=50)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--graine', type=int, default=1)
+    parser.add_argument('--sortie', help="fichier JSON des résultats")
+    config = parser.parse_args()
+    config.frontend = config.frontend.rstrip('/')
+    config.backend = config.backend.rstrip('/')
+
+    catalogue = decouvrir(config.backend, config.max_evaluations, config.timeout)
+    print(f"🔎 {len(catalogue['evaluations'])} évaluation(s), {len(catalogue['eleves'])} élève(s)")
+    print(f"🚀 {config.utilisateurs} utilisateurs virtuels pendant {config.duree:.0f}s "
+          f"sur {config.frontend} (mélange {config.melange})")
+
+    mesures = Mesures()
+    fin = threading.Event()
+    utilisateurs = [
+        UtilisateurVirtuel(i, config, catalogue, mesures, fin,
+                           depart=config.montee * i / max(1, config.utilisateurs))
+        for i in range(config.utilisateurs)
+    ]
+    debut = time.perf_counter()
+    for utilisateur in utilisateurs:
+        utilisateur.start()
+    try:
+        fin.wait(config.duree)
+    except KeyboardInterrupt:
+        print("⏹️ Interrompu, arrêt des utilisateurs virtuels...")
+    fin.set()
+    for utilisateur in utilisateurs:
+        utilisateur.join(config.timeout)
+    duree = time.perf_counter() - debut
+
+    if not mesures.echantillons:
+        print("❌ Aucune requête mesurée")
+        return 1
+
+    resultats = {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit_git(),
+        'machine': platform.platform(),
+        'parametres': {
+            'frontend': config.frontend,
+            'utilisateurs': config.utilisateurs,
+            'duree_s': config.duree,
+            'montee_s': config.montee,
+            'pensee_s': [config.pensee_min, config.pensee_max],
+            'melange': config.melange,
+            'graine': config.graine,
+        },
+        **rapport(mesures, duree),
+    }
+    afficher(resultats)
+    if config.sortie:
+        with open(config.sortie, 'w', encoding='utf-8') as f:
+            json.dump(resultats, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ Résultats écrits dans {config.sortie}")
+    return 1 if resultats['global']['erreurs'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+# Configuration gunicorn du frontend (mode production)
+#
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# Rechargement gracieux (nouveaux workers avec le nouveau code, les requêtes
+# en cours se terminent sur les anciens) :
+#   kill -HUP <pid du master>      ou   docker compose kill -s HUP frontend
+import multiprocessing
+import os
+import shutil
+
+# Métriques Prometheus partagées entre workers (agrégées par /metrics)
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus_frontend')
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Le frontend attend surtout le backend (E/S) : peu de workers, plus de threads
+workers = int(os.getenv('GUNICORN_WORKERS', max(2, multiprocessing.cpu_count())))
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+worker_class = 'gthread'
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 150))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 500))
+
+# Chaque worker importe l'application après le fork : un HUP recharge donc
+# aussi le code. GUNICORN_PRELOAD=1 charge l'application une seule fois dans le
+# master ; c'est sûr ici, la session HTTP et le pool du fan-out n'ouvrant rien
+# avant le premier appel, mais HUP ne relit alors plus le code.
+preload_app = os.getenv('GUNICORN_PRELOAD', '0') == '1'
+
+accesslog = '-'
+# Format par défaut + identifiant de requête (X-Request-ID renvoyé) et durée en ms
+access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s" req=%({x-request-id}o)s %(M)sms'
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOGLEVEL', 'info')
+
+
+def on_starting(server):
+    # Repartir de métriques vides à chaque démarrage du master
+    dossier = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(dossier, ignore_errors=True)
+    os.makedirs(dossier, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # Les jauges "live" du worker arrêté ne comptent plus dans l'agrégat
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
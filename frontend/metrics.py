@@ -0,0 +1,93 @@
+"""
+Métriques Prometheus du frontend : latence par route, requêtes en cours et
+durée des appels au backend.
+
+Sous gunicorn, chaque worker écrit ses valeurs dans PROMETHEUS_MULTIPROC_DIR
+(voir gunicorn.conf.py) et /metrics agrège tous les workers.
+"""
+import os
+import re
+import time
+from urllib.parse import urlsplit
+
+from flask import Response, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                               Counter, Gauge, Histogram, generate_latest, multiprocess)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUETES = Counter(
+    'bacprociel_http_requetes_total', 'Requêtes HTTP traitées',
+    ['route', 'methode', 'statut'])
+LATENCE = Histogram(
+    'bacprociel_http_latence_secondes', 'Durée de traitement des requêtes HTTP',
+    ['route', 'methode'], buckets=BUCKETS)
+EN_COURS = Gauge(
+    'bacprociel_http_requetes_en_cours', 'Requêtes HTTP en cours de traitement',
+    multiprocess_mode='livesum')
+
+BACKEND_APPELS = Counter(
+    'bacprociel_backend_appels_total', 'Appels HTTP du frontend vers le backend',
+    ['endpoint', 'methode', 'statut'])
+BACKEND_DUREE = Histogram(
+    'bacprociel_backend_duree_secondes', 'Durée des appels vers le backend (en-têtes reçus)',
+    ['endpoint', 'methode'], buckets=BUCKETS)
+
+# /api/evaluations/12/fiche/7 -> /api/evaluations/:id/fiche/:id (cardinalité bornée)
+IDENTIFIANT = re.compile(r'/\d+(?=/|$)')
+
+
+def normaliser_endpoint(url):
+    return IDENTIFIANT.sub('/:id', urlsplit(url).path)
+
+
+def mesurer_appel_backend(methode, url, appel):
+    """Exécute appel() en mesurant sa durée ; statut 'erreur' si aucune réponse"""
+    endpoint = normaliser_endpoint(url)
+    debut = time.perf_counter()
+    statut = 'erreur'
+    try:
+        response = appel()
+        statut = response.status_code
+        return response
+    finally:
+        BACKEND_DUREE.labels(endpoint, methode).observe(time.perf_counter() - debut)
+        BACKEND_APPELS.labels(endpoint, methode, statut).inc()
+
+
+def _registre():
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registre = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registre)
+        return registre
+    return REGISTRY
+
+
+def instrumenter_app(app):
+    """Mesure chaque requête (route, méthode, statut) et expose GET /metrics"""
+
+    @app.before_request
+    def debut_mesure_requete():
+        g.debut_requete = time.perf_counter()
+        EN_COURS.inc()
+
+    @app.after_request
+    def fin_mesure_requete(response):
+        debut = g.get('debut_requete')
+        if debut is not None and request.endpoint != 'metrics':
+            route = request.url_rule.rule if request.url_rule else 'inconnue'
+            LATENCE.labels(route, request.method).observe(time.perf_counter() - debut)
+            REQUETES.labels(route, request.method, response.status_code).inc()
+        return response
+
+    @app.teardown_request
+    def fin_requete_en_cours(exception=None):
+        if g.pop('debut_requete', None) is not None:
+            EN_COURS.dec()
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Métriques au format texte Prometheus"""
+        return Response(generate_latest(_registre()), mimetype=CONTENT_TYPE_LATEST)
+
+    return app
@@ -13,7 +13,11 @@ window.AppGlobals = {
     // Configuration
     config: {
         notificationTimeout: 5000,
-        animationDuration: 300
+        animationDuration: 300,
+        jobPollInterval: 1000,
+        // Tâche jamais prise en charge (aucun worker démarré) / trop longue
+        jobAttenteMax: 30000,
+        jobDureeMax: 900000
     }
 };
 
@@ -303,6 +307,39 @@ class BacProCielApp {
         }
     }
 
+    // Suivi d'une tâche de fond (import, passage de classe, export) jusqu'à sa fin
+    // onProgression(job) est appelé à chaque interrogation ; renvoie la tâche terminée
+    async attendreJob(jobId, onProgression = null) {
+        const config = window.AppGlobals.config;
+        const debut = Date.now();
+        while (true) {
+            const response = await fetch(`/api/jobs/${jobId}`);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            const job = await response.json();
+            if (onProgression) {
+                onProgression(job);
+            }
+            if (job.statut === 'termine' || job.statut === 'echec') {
+                return job;
+            }
+            // Erreurs marquées "tache" : message destiné à l'utilisateur
+            const ecoule = Date.now() - debut;
+            if (job.statut === 'en_attente' && ecoule > config.jobAttenteMax) {
+                const erreur = new Error("La tâche n'a pas démarré : le service des tâches de fond ne semble pas lancé");
+                erreur.tache = true;
+                throw erreur;
+            }
+            if (ecoule > config.jobDureeMax) {
+                const erreur = new Error(`La tâche ${jobId} n'est toujours pas terminée, consultez son état plus tard`);
+                erreur.tache = true;
+                throw erreur;
+            }
+            await new Promise(resolve => setTimeout(resolve, config.jobPollInterval));
+        }
+    }
+
     // Validation de formulaire générique
     validateForm(formElement) {
         const errors = [];
@@ -225,15 +225,24 @@ async function executerPassage() {
     btnConfirm.textContent = 'Traitement en cours...';
     
     try {
-        const response = await fetch('/api/passage-classe/passage-avec-archivage', {
+        const response = await fetch('/api/jobs/passage-classe', {
             method: 'POST'
         });
         
-        const result = await response.json();
+        const soumission = await response.json();
+        if (!soumission.success) {
+            fermerModal();
+            afficherNotification(soumission.error || 'Erreur lors du passage', 'error');
+            return;
+        }
+        
+        // Passage exécuté en tâche de fond : suivi jusqu'à la fin
+        const job = await app.attendreJob(soumission.job_id);
+        const result = job.resultat || {};
         
         fermerModal();
         
-        if (result.success) {
+        if (job.statut === 'termine') {
             afficherNotification(result.message, 'success');
             // Recharger les données
             setTimeout(() => {
@@ -242,11 +251,11 @@ async function executerPassage() {
                 chargerStats();
             }, 1000);
         } else {
-            afficherNotification(result.error || 'Erreur lors du passage', 'error');
+            afficherNotification(job.erreur || 'Erreur lors du passage', 'error');
         }
     } catch (error) {
         console.error('Erreur passage:', error);
-        afficherNotification('Erreur de connexion au serveur', 'error');
+        afficherNotification(error.tache ? error.message : 'Erreur de connexion au serveur', 'error');
         fermerModal();
     } finally {
         btnConfirm.disabled = false;
@@ -276,15 +285,34 @@ async function rechercherArchives() {
 }
 
 // ===== EXPORT =====
-function exporterArchives(annee = null) {
+async function exporterArchives(annee = null) {
     console.log('📥 Export archives', annee ? `année ${annee}` : 'toutes');
-    
-    const url = annee 
-        ? `/api/passage-classe/archives/export?annee=${annee}`
-        : '/api/passage-classe/archives/export';
-    
-    window.location.href = url;
     afficherNotification('Export en cours...', 'info');
+    
+    try {
+        // Fichier généré en tâche de fond, téléchargé une fois prêt
+        const response = await fetch('/api/jobs/export-archives', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ annee: annee })
+        });
+        const soumission = await response.json();
+        if (!soumission.success) {
+            afficherNotification(soumission.error || "Erreur lors de l'export", 'error');
+            return;
+        }
+        
+        const job = await app.attendreJob(soumission.job_id);
+        if (job.statut === 'termine') {
+            window.location.href = `/api/jobs/${job.id}/resultat`;
+            afficherNotification(`Export terminé (${job.resultat.lignes} archives)`, 'success');
+        } else {
+            afficherNotification(job.erreur || "Erreur lors de l'export", 'error');
+        }
+    } catch (error) {
+        console.error('Erreur export:', error);
+        afficherNotification(error.tache ? error.message : 'Erreur de connexion au serveur', 'error');
+    }
 }
 
 // ===== NOTIFICATIONS =====
@@ -265,23 +265,48 @@ initFileUpload() {
             console.log('📥 Réponse reçue:', response.status);
             const data = await response.json();
             console.log('📊 Données:', data);
-            
+
+            if (!data.success) {
+                if (progressSection) {
+                    progressSection.style.display = 'none';
+                }
+                app.showNotification("Erreur: " + (data.error || "Inconnue"), "error");
+                return;
+            }
+
+            // Import exécuté en tâche de fond : suivi jusqu'à la fin
+            const progressText = progressSection ? progressSection.querySelector('.progress-text') : null;
+            const progressBar = document.getElementById('progressBar');
+            const job = await app.attendreJob(data.job_id, (job) => {
+                if (progressBar) {
+                    progressBar.style.width = `${job.progression}%`;
+                }
+                if (progressText && job.message) {
+                    progressText.textContent = `${job.message} (${job.progression}%)`;
+                }
+            });
+            console.log('📊 Tâche terminée:', job);
+
             if (progressSection) {
                 progressSection.style.display = 'none';
             }
-            
-            if (data.success) {
-                app.showNotification(`Import réussi! ${data.total_importes} utilisateur(s)`, "success");
+
+            if (job.statut === 'termine') {
+                const resultat = job.resultat || {};
+                const nbErreurs = (resultat.erreurs || []).length;
+                app.showNotification(
+                    `Import réussi! ${resultat.total_importes} utilisateur(s)` +
+                    (nbErreurs ? `, ${nbErreurs} ligne(s) ignorée(s)` : ''), "success");
                 setTimeout(() => window.location.reload(), 2000);
             } else {
-                app.showNotification("Erreur: " + (data.error || "Inconnue"), "error");
+                app.showNotification("Erreur: " + (job.erreur || "Inconnue"), "error");
             }
         } catch (error) {
             console.error("💥 Erreur:", error);
             if (progressSection) {
                 progressSection.style.display = 'none';
             }
-            app.showNotification("Erreur de communication", "error");
+            app.showNotification(error.tache ? error.message : "Erreur de communication", "error");
         }
     }
 